@@ -0,0 +1,292 @@
+"""
+Local stand-ins for the remote APIs the workers call.
+
+FakeServer is a threaded HTTP server whose routes are plain functions, with
+configurable latency, a requests/min quota enforced with 429 + Retry-After,
+and a random 429 rate. It is used by the benchmarks to exercise the
+workers without touching the real providers.
+"""
+import collections
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+# A route gets (method, path, parsed JSON body or raw bytes) and returns
+# (status, body). A dict/list body is sent as JSON, bytes are sent as they
+# are and a generator of dicts is streamed as newline-delimited JSON.
+Route = Callable[[str, str, object], Tuple[int, object]]
+
+
+class FakeServer:
+    """
+    Args:
+        routes (dict): Path prefix -> route function
+        latency_ms (float): Mean added latency per request
+        jitter_ms (float): Uniform +/- jitter on the latency
+        rpm (int): Requests per minute before the server answers 429 (0 = unlimited)
+        error_rate (float): Probability of an unprompted 429
+        retry_after (float): Retry-After seconds sent with every 429 (None = time until
+            the oldest request in the quota window expires, like a real provider)
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, Route],
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rpm: int = 0,
+        error_rate: float = 0.0,
+        retry_after: Optional[float] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.routes = routes
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.counts = collections.Counter()
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _throttled(self) -> Optional[float]:
+        """Seconds the client should wait if this request is rejected, else None."""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            if self.rpm and len(self._recent) >= self.rpm:
+                wait = self._recent[0] + 60 - now
+            elif random.random() < self.error_rate:
+                wait = 1.0
+            else:
+                self._recent.append(now)
+                return None
+            return self.retry_after if self.retry_after is not None else max(0.1, round(wait, 2))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status, chunks):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        data = json.dumps(chunk).encode("utf-8") + b"\n"
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading early
+                    with server._lock:
+                        server.counts["client_closed"] += 1
+                    self.close_connection = True
+
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw and "json" in (self.headers.get("Content-Type") or "") else raw
+                except ValueError:
+                    body = raw
+
+                retry_after = server._throttled()
+                if retry_after is not None:
+                    with server._lock:
+                        server.counts["429"] += 1
+                    self._send_json(429, {"error": {"message": "rate limited"}},
+                                    {"Retry-After": str(retry_after)})
+                    return
+
+                delay = server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)
+                if delay > 0:
+                    time.sleep(delay / 1000)
+
+                path = self.path.split("?", 1)[0]
+                route = next((fn for prefix, fn in server.routes.items() if path.startswith(prefix)), None)
+                if route is None:
+                    with server._lock:
+                        server.counts["404"] += 1
+                    self._send_json(404, {"error": {"message": f"no route for {path}"}})
+                    return
+                status, payload = route(method, path, body)
+                with server._lock:
+                    server.counts[str(status)] += 1
+                if isinstance(payload, bytes):
+                    self._send_json(status, payload, content_type="application/octet-stream")
+                elif isinstance(payload, (dict, list)):
+                    self._send_json(status, payload)
+                else:
+                    self._stream(status, payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+
+def echo_route(method: str, path: str, body: object) -> Tuple[int, object]:
+    return 200, {"ok": True, "path": path}
+
+
+def ollama_route(token_delay_ms: float = 5.0, trailing_tokens: int = 20) -> Route:
+    """
+    Fake Ollama /api/chat and /api/generate.
+
+    A chat reply is a JSON object with every key of the template (the
+    JSON at the start of the user message) set to the first word of the
+    text after it, streamed a few characters per chunk with
+    `token_delay_ms` between chunks and `trailing_tokens` chunks of junk
+    after the JSON, like a model that doesn't stop cleanly.
+    """
+    def route(method, path, body):
+        body = body if isinstance(body, dict) else {}
+        model = body.get("model", "fake")
+        if path.startswith("/api/generate"):
+            return 200, {"model": model, "response": "", "done": True}
+        messages = body.get("messages", [])
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        try:
+            template, end = json.JSONDecoder().raw_decode(user)
+            fields, text = list(template), user[end:]
+        except (ValueError, TypeError):
+            fields, text = ["value"], user
+        words = text.split()
+        reply = json.dumps({field: words[0] if words else "" for field in fields})
+        pieces = [reply[i:i + 4] for i in range(0, len(reply), 4)] + [" ..."] * trailing_tokens
+
+        def chunk(content, done):
+            return {"model": model, "created_at": "1970-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": content}, "done": done}
+
+        if not body.get("stream", True):
+            return 200, chunk("".join(pieces), True)
+
+        def stream():
+            for piece in pieces:
+                time.sleep(token_delay_ms / 1000)
+                yield chunk(piece, False)
+            yield dict(chunk("", True), done_reason="stop", eval_count=len(pieces))
+        return 200, stream()
+
+    return route
+
+
+def file_route(size: int = 256 * 1024) -> Route:
+    """Serve `size` bytes of deterministic data for any GET (stand-in for audio/image/PDF URLs)."""
+    data = bytes(range(256)) * (size // 256 + 1)
+    data = data[:size]
+
+    def route(method, path, body):
+        return 200, data
+
+    return route
+
+
+def mistral_route(pages: int = 3, chars_per_page: int = 4000) -> Route:
+    """
+    Fake Mistral API: /v1/ocr returns `pages` pages of markdown, and
+    /v1/chat/completions returns a StructuredOCR-shaped JSON message.
+    """
+    markdown = ("# Page\n\n" + "Lorem ipsum dolor sit amet. " * (chars_per_page // 28))[:chars_per_page]
+
+    def route(method, path, body):
+        body = body if isinstance(body, dict) else {}
+        if path.startswith("/v1/ocr"):
+            return 200, {
+                "model": body.get("model", "mistral-ocr-latest"),
+                "pages": [
+                    {"index": i, "markdown": markdown, "images": [],
+                     "dimensions": {"dpi": 200, "height": 2200, "width": 1700}}
+                    for i in range(pages)
+                ],
+                "usage_info": {"pages_processed": pages, "doc_size_bytes": None},
+            }
+        content = json.dumps({"file_name": "fake.pdf", "topics": ["fake"], "languages": "English",
+                              "ocr_contents": {"text": markdown[:200]}})
+        return 200, _chat_completion(body.get("model", "fake"), content)
+
+    return route
+
+
+def groq_route(words: int = 200) -> Route:
+    """Fake Groq API: chat completions and verbose_json audio transcriptions."""
+    def route(method, path, body):
+        if path.endswith("/audio/transcriptions"):
+            return 200, {
+                "text": "hello world " * (words // 2),
+                "language": "english",
+                "duration": words * 0.4,
+                "segments": [{"id": 0, "seek": 0, "start": 0.0, "end": words * 0.4,
+                              "text": "hello world", "tokens": [1, 2], "temperature": 0.0,
+                              "avg_logprob": -0.2, "compression_ratio": 1.2, "no_speech_prob": 0.01}],
+            }
+        model = body.get("model", "fake") if isinstance(body, dict) else "fake"
+        return 200, _chat_completion(model, "This is a fake answer.")
+
+    return route
+
+
+def _chat_completion(model: str, content: str) -> Dict[str, object]:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }
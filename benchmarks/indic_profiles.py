@@ -0,0 +1,93 @@
+"""
+Benchmark the IndicTrans2 decoding profiles on the sample Hindi sentences.
+
+Run from the repository root:
+
+    python -m benchmarks.indic_profiles --profiles greedy,small_beam,full_beam,int8_greedy --repeats 5
+
+For each profile this reports the model it runs on (int8 for every profile
+when INDIC_QUANTIZE=1), the model load time and size, the latency of one
+batch of the sample sentences (mean/p50/max), the throughput in sentences
+per second and the process RSS after the run.
+"""
+import argparse
+import resource
+import statistics
+import time
+
+from utils.indic import (
+    INDIC_QUANTIZE,
+    PROFILES,
+    configure_threads,
+    input_sentences,
+    model_for,
+    src_lang,
+    tgt_lang,
+    translate_bucketed,
+)
+from utils.registry import registry
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def bench_profile(profile, sentences, repeats):
+    # The first call loads the model (if this profile needs a new variant)
+    # and warms up the allocator; it is reported separately.
+    started = time.perf_counter()
+    translations = translate_bucketed(sentences, src_lang, tgt_lang, profile)
+    first_call = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        translate_bucketed(sentences, src_lang, tgt_lang, profile)
+        latencies.append(time.perf_counter() - started)
+
+    model_key, device = model_for(profile)
+    stats = registry.stats()[model_key]
+    return {
+        "profile": profile,
+        "model": f"{model_key} ({device})",
+        "first_call_s": round(first_call, 3),
+        "load_s": stats["load_seconds"],
+        "model_mb": round(stats["size_bytes"] / 1e6, 1),
+        "mean_s": round(statistics.mean(latencies), 3),
+        "p50_s": round(statistics.median(latencies), 3),
+        "max_s": round(max(latencies), 3),
+        "sentences_per_s": round(len(sentences) * repeats / sum(latencies), 2),
+        "rss_mb": round(current_rss_mb(), 1),
+        "sample": translations[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = default)")
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    print(f"INDIC_QUANTIZE={int(INDIC_QUANTIZE)}")
+    results = []
+    for profile in args.profiles.split(","):
+        result = bench_profile(profile.strip(), input_sentences, args.repeats)
+        results.append(result)
+        print(result)
+
+    columns = ["profile", "model", "load_s", "model_mb", "mean_s", "p50_s", "max_s", "sentences_per_s", "rss_mb"]
+    print()
+    print(" | ".join(columns))
+    for result in results:
+        print(" | ".join(str(result[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
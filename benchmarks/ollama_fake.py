@@ -0,0 +1,63 @@
+"""
+Drive the Ollama extraction path against a local fake Ollama server.
+
+Run from the repository root:
+
+    python -m benchmarks.ollama_fake --texts 32 --parallel 4
+
+The fake streams a JSON reply followed by trailing junk (see
+benchmarks.fakes.ollama_route). The same texts are extracted the old way
+(one blocking, non-streamed chat per text, template and text in one user
+message) and through utils.ollamaprocesser.extract_json_many, reporting
+wall-clock time, texts per second and how many streams were cut off once
+the JSON was complete.
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+
+from benchmarks.fakes import FakeServer, ollama_route
+
+TEMPLATE = json.dumps({"name": "", "city": "", "employer": ""})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=32)
+    parser.add_argument("--parallel", type=int, default=4, help="OLLAMA_PARALLEL for the new path")
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    parser.add_argument("--trailing-tokens", type=int, default=20)
+    args = parser.parse_args()
+
+    texts = [f"Person{i} lives in City{i} and works at Company{i}." for i in range(args.texts)]
+    route = ollama_route(args.token_delay_ms, args.trailing_tokens)
+    with FakeServer({"/api/": route}) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        os.environ["OLLAMA_PARALLEL"] = str(args.parallel)
+        ollamaprocesser = importlib.import_module("utils.ollamaprocesser")
+        client = ollamaprocesser.get_client()
+
+        started = time.perf_counter()
+        for text in texts:
+            response = client.chat(model="fake", messages=[
+                {"role": "user", "content": f"{TEMPLATE}\n\n{text}"},
+            ])
+            json.JSONDecoder().raw_decode(response["message"]["content"])
+        old = time.perf_counter() - started
+
+        server.counts.clear()
+        ollamaprocesser.warm_up("fake")
+        started = time.perf_counter()
+        results = ollamaprocesser.extract_json_many(texts, TEMPLATE, model="fake")
+        new = time.perf_counter() - started
+        errors = sum(1 for result in results if "error" in result)
+
+    print(f"old: {old:.2f}s, {args.texts / old:.1f} texts/s")
+    print(f"new: {new:.2f}s, {args.texts / new:.1f} texts/s, {errors} errors, "
+          f"{server.counts['client_closed']} streams closed after the JSON")
+
+
+if __name__ == "__main__":
+    main()
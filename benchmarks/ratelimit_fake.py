@@ -0,0 +1,87 @@
+"""
+Drive the outbound-call scheduler against a local rate-limited fake server.
+
+Run from the repository root:
+
+    python -m benchmarks.ratelimit_fake --rpm 120 --calls 200 --threads 32
+
+The fake server answers 429 with Retry-After once its requests/min quota
+is used up. The run is repeated with the calls going straight to the
+server and through utils.ratelimit.scheduler, reporting successes, 429s
+received, failed calls and sustained throughput for each.
+"""
+import argparse
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeServer, echo_route
+from utils.ratelimit import Scheduler
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, error: urllib.error.HTTPError):
+        super().__init__(f"HTTP {error.code}")
+        self.status_code = error.code
+        self.response = error
+
+
+def fake_call(url: str) -> bytes:
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=b"{}", method="POST")) as response:
+            return response.read()
+    except urllib.error.HTTPError as e:
+        raise HTTPStatusError(e) from None
+
+
+def run(server: FakeServer, calls: int, threads: int, scheduler=None):
+    server.counts.clear()
+    url = f"{server.url}/v1/chat"
+
+    def one(_):
+        try:
+            if scheduler is None:
+                fake_call(url)
+            else:
+                scheduler.call("fake", "fake-model", lambda: fake_call(url), tokens=100)
+            return True
+        except Exception:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, range(calls)))
+    elapsed = time.perf_counter() - started
+    return {
+        "succeeded": sum(results),
+        "failed": len(results) - sum(results),
+        "429s_received": server.counts["429"],
+        "seconds": round(elapsed, 2),
+        "successes_per_s": round(sum(results) / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rpm", type=int, default=120, help="fake server quota")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    def server():
+        return FakeServer({"/": echo_route}, latency_ms=args.latency_ms, rpm=args.rpm,
+                          error_rate=args.error_rate)
+
+    # A fresh server (and quota window) for each run
+    with server() as direct:
+        print("direct:   ", run(direct, args.calls, args.threads))
+    limits = {"fake": {"*": {"rpm": args.rpm, "tpm": 0}}}
+    with server() as scheduled:
+        print("scheduled:", run(scheduled, args.calls, args.threads, Scheduler(limits)))
+
+
+if __name__ == "__main__":
+    main()
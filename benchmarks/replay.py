@@ -0,0 +1,308 @@
+"""
+Replay a recorded task stream through the worker functions, offline.
+
+Run from the repository root:
+
+    python -m benchmarks.replay benchmarks/sample_tasks.jsonl --concurrency 8 --latency-ms 200
+    python -m benchmarks.replay benchmarks/sample_model_tasks.jsonl
+
+The stream is JSONL, one task per line:
+
+    {"task": "OCRTask", "input": {"URL": "{fake}/files/doc.pdf", "TYPE": "PDF"}, "repeat": 20}
+
+"{fake}" in string inputs is replaced with the URL of a local fake server
+that stands in for Mistral, Groq, Ollama and the files the tasks download
+(see benchmarks.fakes), with configurable latency, requests/min quota and
+429 rate. The Mistral, Groq and Ollama clients are pointed at it through
+MISTRAL_SERVER_URL, GROQ_BASE_URL and OLLAMA_HOST.
+
+The default stream (sample_tasks.jsonl) only has tasks that call those
+APIs. The model-backed tasks are in sample_model_tasks.jsonl and run on the
+small stand-ins in TINY_MODELS, for any of PII_MODEL, INDIC_MODEL,
+SENTIMENT_MODEL and KEYWORD_SPACY_MODEL that isn't set; --no-tiny-models
+uses the production defaults instead. The stand-ins are downloaded on the
+first run (`python -m spacy download en_core_web_sm` for spaCy); after that
+the replay runs offline with HF_HUB_OFFLINE=1. The sentiment stand-in has
+random weights, so only its timings mean anything.
+
+Each task type runs in its own subprocess, so CPU time and peak RSS are
+per type. The first task of each type is a warm-up (model loads, client
+setup) and is reported separately. The result cache and translation memory
+are off unless --keep-caches is given.
+
+Repeated inputs are made distinct by default (a query parameter on URLs, a
+counter in front of free-text fields), so single-flight and the caches can't answer
+most of the stream from a handful of real executions; --no-unique replays
+them as recorded. Either way, tasks answered by coalescing or a cache are
+reported in their own columns.
+
+With --baseline, the run is compared with an earlier --output file and
+the exit status is 1 if any task type's p95 latency or throughput is more
+than --max-regression percent worse.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeServer, file_route, groq_route, mistral_route, ollama_route
+
+
+# Small models the model-backed tasks run on, unless the variable is set
+TINY_MODELS = {
+    "PII_MODEL": "urchade/gliner_small-v2.1",
+    "INDIC_MODEL": "ai4bharat/indictrans2-indic-en-dist-200M",
+    "SENTIMENT_MODEL": "hf-internal-testing/tiny-random-RobertaForSequenceClassification",
+    "KEYWORD_SPACY_MODEL": "en_core_web_sm",
+}
+
+# Free-text input fields that get a counter appended in --unique mode. Codes
+# and options (TYPE, src, dst, profile, template) are left alone.
+SALTED_FIELDS = {"text", "query", "name"}
+
+
+def _salt(value, n, free_text):
+    if isinstance(value, list):
+        return [_salt(item, n, free_text) for item in value]
+    if not isinstance(value, str):
+        return value
+    if value.startswith(("http://", "https://")):
+        separator = "&" if urlsplit(value).query else "?"
+        return f"{value}{separator}replay={n}"
+    # In front, so a text split into sentences still differs in its first one
+    return f"({n}) {value}" if free_text else value
+
+
+def salt_input(task_input, n):
+    """A copy of task_input made distinct from other copies by the counter n."""
+    return {key: _salt(value, n, key in SALTED_FIELDS) for key, value in task_input.items()}
+
+
+def load_stream(path, fake_url, unique=True):
+    """Tasks of the stream grouped by task type, in first-seen order, with {fake} substituted."""
+    by_type = OrderedDict()
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            record = json.loads(line.replace("{fake}", fake_url))
+            inputs = by_type.setdefault(record["task"], [])
+            task_input = record.get("input", {})
+            for _ in range(int(record.get("repeat", 1))):
+                inputs.append(salt_input(task_input, len(inputs)) if unique else task_input)
+    return by_type
+
+
+def _short_circuited():
+    """Calls answered so far in this process by single-flight coalescing and by the caches."""
+    coalesced = cache_hits = 0
+    singleflight = sys.modules.get("utils.singleflight")
+    if singleflight is not None:
+        coalesced = sum(counters["saved"] for counters in singleflight.single_flight.stats().values())
+    resultcache = sys.modules.get("utils.resultcache")
+    if resultcache is not None:
+        cache_hits += resultcache.result_cache.hits
+    translation_memory = sys.modules.get("utils.translation_memory")
+    if translation_memory is not None:
+        stats = translation_memory.translation_memory.stats()
+        cache_hits += stats["memory_hits"] + stats["disk_hits"]
+    return coalesced, cache_hits
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_child(task_name, concurrency, warmup, result_file):
+    """Run the tasks read from stdin with the worker function for task_name, in this process."""
+    inputs = [json.loads(line) for line in sys.stdin if line.strip()]
+    import worker
+
+    fn = worker.WORKERS[task_name]
+
+    def one(task_input):
+        started = time.perf_counter()
+        try:
+            result = fn(**task_input)
+            ok = not (isinstance(result, str) and result.startswith("Error:"))
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    warmup_seconds = None
+    if warmup and inputs:
+        warmup_seconds, _ = one(inputs[0])
+        inputs = inputs[1:]
+
+    coalesced_before, cache_hits_before = _short_circuited()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, inputs))
+    wall = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    coalesced_after, cache_hits_after = _short_circuited()
+
+    latencies = sorted(latency for latency, _ in results)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak_rss_mb = usage_after.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    report = {
+        "tasks": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        # Calls that never ran: joined an identical in-flight call, or were
+        # answered from the result cache / translation memory (for
+        # translation, counted per sentence)
+        "coalesced": coalesced_after - coalesced_before,
+        "cache_hits": cache_hits_after - cache_hits_before,
+        "warmup_s": round(warmup_seconds, 3) if warmup_seconds is not None else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "tasks_per_s": round(len(results) / wall, 2) if wall > 0 else 0.0,
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_task": round(cpu / len(results) * 1000, 2) if results else 0.0,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+    with open(result_file, "w") as f:
+        json.dump(report, f)
+
+
+def child_env(server_url, keep_caches, tiny_models=True):
+    env = dict(os.environ)
+    if tiny_models:
+        for name, model in TINY_MODELS.items():
+            env.setdefault(name, model)
+    env.update({
+        "MISTRAL_SERVER_URL": server_url,
+        "MISTRAL_API_KEY": env.get("MISTRAL_API_KEY", "fake"),
+        "GROQ_BASE_URL": server_url,
+        "GROQ_API_KEY": env.get("GROQ_API_KEY", "fake"),
+        "OLLAMA_HOST": server_url,
+        "METRICS_ENABLED": "0",
+        "CONCURRENT_TASKS": "",
+        "PYTHONUNBUFFERED": "1",
+    })
+    if not keep_caches:
+        env["RESULT_CACHE_ENABLED"] = "0"
+        env["TRANSLATION_MEMORY_ENABLED"] = "0"
+    return env
+
+
+def format_table(results):
+    columns = ["tasks", "errors", "coalesced", "cache_hits", "warmup_s", "p50_ms", "p95_ms", "p99_ms",
+               "tasks_per_s", "cpu_ms_per_task", "peak_rss_mb"]
+    lines = [f"{'task':<22}" + "".join(f"{column:>16}" for column in columns)]
+    for task_name, report in results.items():
+        if "failed" in report:
+            lines.append(f"{task_name:<22}  failed: {report['failed']}")
+            continue
+        lines.append(f"{task_name:<22}" + "".join(f"{str(report[column]):>16}" for column in columns))
+    return "\n".join(lines)
+
+
+def regressions(results, baseline, max_regression):
+    """Task types whose p95 or throughput is more than max_regression percent worse than baseline."""
+    worse = []
+    limit = 1 + max_regression / 100
+    for task_name, report in results.items():
+        before = baseline.get(task_name)
+        if not before or "failed" in report or "failed" in before:
+            continue
+        if before["p95_ms"] and report["p95_ms"] > before["p95_ms"] * limit:
+            worse.append(f"{task_name}: p95 {before['p95_ms']} -> {report['p95_ms']} ms")
+        if report["tasks_per_s"] and before["tasks_per_s"] > report["tasks_per_s"] * limit:
+            worse.append(f"{task_name}: {before['tasks_per_s']} -> {report['tasks_per_s']} tasks/s")
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("stream", nargs="?", default=os.path.join(os.path.dirname(__file__), "sample_tasks.jsonl"))
+    parser.add_argument("--tasks", default="", help="comma-separated task types to run (default: all in the stream)")
+    parser.add_argument("--concurrency", type=int, default=8, help="tasks in flight per task type")
+    parser.add_argument("--latency-ms", type=float, default=100, help="fake API latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--rpm", type=int, default=0, help="fake API requests/min quota (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake API calls answered 429")
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--keep-caches", action="store_true")
+    parser.add_argument("--unique", action=argparse.BooleanOptionalAction, default=True,
+                        help="make repeated inputs distinct (default); --no-unique replays them as recorded")
+    parser.add_argument("--tiny-models", action=argparse.BooleanOptionalAction, default=True,
+                        help="run model-backed tasks on TINY_MODELS where no model is set (default)")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in percent")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.concurrency, not args.no_warmup, args.result_file)
+        return
+
+    routes = {
+        "/files/": file_route(),
+        "/openai/": groq_route(),
+        "/api/": ollama_route(),
+        "/v1/": mistral_route(),
+    }
+    server = FakeServer(routes, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        rpm=args.rpm, error_rate=args.error_rate)
+    results = OrderedDict()
+    with server:
+        by_type = load_stream(args.stream, server.url, args.unique)
+        wanted = {name.strip() for name in args.tasks.split(",") if name.strip()}
+        env = child_env(server.url, args.keep_caches, args.tiny_models)
+        for task_name, inputs in by_type.items():
+            if wanted and task_name not in wanted:
+                continue
+            fd, result_file = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            command = [sys.executable, "-m", "benchmarks.replay", "--child", task_name,
+                       "--concurrency", str(args.concurrency), "--result-file", result_file]
+            if args.no_warmup:
+                command.append("--no-warmup")
+            print(f"Replaying {len(inputs)} {task_name} tasks...", flush=True)
+            completed = subprocess.run(
+                command, input="\n".join(json.dumps(i) for i in inputs), text=True, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+            try:
+                with open(result_file) as f:
+                    results[task_name] = json.load(f)
+            except (OSError, ValueError):
+                error_lines = completed.stderr.strip().splitlines()
+                results[task_name] = {"failed": error_lines[-1] if error_lines else f"exit {completed.returncode}"}
+            finally:
+                os.remove(result_file)
+        api_counts = dict(server.counts)
+
+    print(format_table(results))
+    print(f"fake API responses: {api_counts}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = regressions(results, json.load(f), args.max_regression)
+        if worse:
+            print("Regressions:\n  " + "\n  ".join(worse))
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Compare the old and new result paths of the OCR, transcription and PII workers.
+
+Run from the repository root:
+
+    python -m benchmarks.result_path --mb 20 --repeats 3
+
+The old path had each helper json.dumps(..., indent=4) its result and the
+worker parse it back with ast.literal_eval before Conductor serialized it
+again (and pii_worker rebuilt its entity list twice). The new path hands
+the helper's dict straight to Conductor, which serializes it once; that
+final json.dumps is timed for both paths. Synthetic payloads are used, so
+no API keys or models are needed. For each task this reports CPU seconds
+and peak traced memory (tracemalloc) per call.
+"""
+import argparse
+import ast
+import base64
+import json
+import os
+import time
+import tracemalloc
+
+
+def ocr_payload(mb):
+    """OCR-like output: page markdown with inlined base64 images, about `mb` MB."""
+    image = "data:image/jpeg;base64," + base64.b64encode(os.urandom(96 * 1024)).decode()
+    page = "# Page\n\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 40
+    pages = []
+    size = 0
+    while size < mb * 1e6:
+        text = f"{page}\n\n![img-{len(pages)}.jpeg]({image})\n"
+        pages.append(text)
+        size += len(text)
+    return {"markdown": "\n\n".join(pages)}
+
+
+def transcription_payload(words):
+    """Transcription with word and segment timestamps and a transcode report."""
+    return {
+        "text": "hello world " * (words // 2),
+        "segments": [
+            {"id": i, "start": i * 5.0, "end": i * 5.0 + 5, "text": "hello world " * 6,
+             "tokens": list(range(12)), "avg_logprob": -0.2, "no_speech_prob": 0.01}
+            for i in range(words // 12)
+        ],
+        "words": [{"word": "hello", "start": i * 0.4, "end": i * 0.4 + 0.3} for i in range(words)],
+        "language": "en",
+        "duration": words * 0.4,
+        "preprocessing": {"transcoded": True, "bytes_before": 10_000_000, "bytes_after": 1_000_000},
+    }
+
+
+def pii_payload(entities):
+    return {
+        "text": "x" * (entities * 20),
+        "entities": [
+            {"entity": "person", "word": "John Smith", "start": i * 20, "end": i * 20 + 10, "score": 0.9}
+            for i in range(entities)
+        ],
+    }
+
+
+def old_path(result):
+    return ast.literal_eval(json.dumps(result, indent=4))
+
+
+def new_path(result):
+    return result
+
+
+def old_pii(results):
+    resultjson = {"text": results["text"], "entities": []}
+    for entity in results["entities"]:
+        resultjson["entities"].append({
+            "word": entity["word"], "entity": entity["entity"], "start": entity["start"],
+            "end": entity["end"], "score": entity.get("score", 0),
+        })
+    return {
+        "text": resultjson["text"],
+        "entities": [
+            {"entity": e["entity"], "word": e["word"], "start": e["start"], "end": e["end"],
+             "score": e.get("score", 0)}
+            for e in resultjson["entities"]
+        ],
+    }
+
+
+def new_pii(results):
+    return {"text": results["text"], "entities": [
+        {"entity": e["entity"], "word": e["word"], "start": e["start"], "end": e["end"],
+         "score": e.get("score", 0)}
+        for e in results["entities"]
+    ]}
+
+
+def measure(fn, payload, repeats):
+    cpu = []
+    peak = 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        started = time.process_time()
+        try:
+            # Conductor serializes the task output once on the way out
+            json.dumps(fn(payload))
+            error = None
+        except (ValueError, SyntaxError) as e:
+            error = f"{type(e).__name__}: {e}"
+        cpu.append(time.process_time() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        if error:
+            return {"error": error[:60]}
+    return {"cpu_s": round(min(cpu), 3), "peak_mb": round(peak / 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, default=20, help="size of the synthetic OCR markdown")
+    parser.add_argument("--words", type=int, default=50000, help="words in the synthetic transcription")
+    parser.add_argument("--entities", type=int, default=20000, help="entities in the synthetic PII result")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    transcription = transcription_payload(args.words)
+    no_flags = dict(transcription, preprocessing={"bytes_before": 10_000_000, "bytes_after": 1_000_000})
+    cases = [
+        (f"OCRTask ({args.mb:g} MB)", ocr_payload(args.mb), old_path, new_path),
+        (f"transcribeTask ({args.words} words)", no_flags, old_path, new_path),
+        ("transcribeTask (with true/null)", transcription, old_path, new_path),
+        (f"piiTask ({args.entities} entities)", pii_payload(args.entities), old_pii, new_pii),
+    ]
+    for name, payload, old, new in cases:
+        print(f"{name}")
+        print(f"  old: {measure(old, payload, args.repeats)}")
+        print(f"  new: {measure(new, payload, args.repeats)}")
+
+
+if __name__ == "__main__":
+    main()
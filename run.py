@@ -1,18 +1,169 @@
-from conductor.client.automator.task_handler import TaskHandler
-from conductor.client.configuration.configuration import Configuration
-from conductor.client.configuration.settings.authentication_settings import AuthenticationSettings
-from worker import *
+import argparse
+import glob
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import traceback
+
+from utils.startup import concurrent_tasks, is_enabled, pid_alive, report, timed
+
+# Per-run files in the temp directory, named after the run.py pid
+_RUN_FILE_RE = re.compile(r"conductor-ml-(?:metrics|ratelimit)-(\d+)(?:\.sqlite(?:-wal|-shm)?)?")
+
+with timed("import conductor"):
+    from conductor.client.automator.task_handler import TaskHandler
+    from conductor.client.configuration.configuration import Configuration
+    from conductor.client.configuration.settings.authentication_settings import AuthenticationSettings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Conductor ML workers")
+    parser.add_argument(
+        "--workers",
+        default=os.environ.get("ENABLED_TASKS", ""),
+        help="Comma-separated task names to serve, e.g. 'queryTask,OCRTask' "
+             "(default: ENABLED_TASKS, or every task when unset)",
+    )
+    parser.add_argument(
+        "--concurrent",
+        default=os.environ.get("CONCURRENT_TASKS", ""),
+        help="I/O-bound tasks to run many-at-a-time in one process instead of one "
+             "process each, e.g. 'OCRTask=32,transcribeTask=8' (default: CONCURRENT_TASKS)",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        default=os.environ.get("PRELOAD_MODELS", "0") == "1",
+        help="Load the enabled tasks' models before forking workers so they share "
+             "the weights copy-on-write (default: PRELOAD_MODELS=1)",
+    )
+    parser.add_argument(
+        "--warmup",
+        action=argparse.BooleanOptionalAction,
+        default=os.environ.get("WARMUP_MODELS", "1") == "1",
+        help="Load the enabled tasks' models and run warm-up inferences on them before "
+             "polling starts; exit non-zero if that fails (default: WARMUP_MODELS, on)",
+    )
+    parser.add_argument(
+        "--memory-report-interval",
+        type=float,
+        default=float(os.environ.get("MEMORY_REPORT_INTERVAL", "0")),
+        help="Print RSS/PSS of this process and its workers every N seconds (0 = off)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("METRICS_PORT", "9464")),
+        help="Serve Prometheus metrics of every worker process on this port at /metrics, "
+             "and a readiness probe at /ready (default: METRICS_PORT or 9464; 0 = off)",
+    )
+    return parser.parse_args()
+
+
+def remove_run_files(pid=None):
+    """
+    Remove the metrics directory and rate-limit state files of the run
+    with this pid, or (by default) of every run whose process is gone.
+    """
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), "conductor-ml-*")):
+        match = _RUN_FILE_RE.fullmatch(os.path.basename(path))
+        if match is None:
+            continue
+        run_pid = int(match.group(1))
+        if run_pid != pid if pid is not None else pid_alive(run_pid):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
 
 def main():
+    args = parse_args()
+    # worker.py reads ENABLED_TASKS when its tasks are declared, so this has
+    # to be set before it is imported.
+    os.environ["ENABLED_TASKS"] = args.workers
+    os.environ["CONCURRENT_TASKS"] = args.concurrent
+    # Runs that were killed never got to clean up after themselves
+    remove_run_files()
+    # Every worker process writes its metrics snapshot here; the endpoint
+    # below merges them. Inherited by the forked workers.
+    os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"conductor-ml-metrics-{os.getpid()}"))
+    # The workers draw from one set of API rate-limit buckets through this file
+    os.environ.setdefault("RATE_LIMIT_STATE_PATH",
+                          os.path.join(tempfile.gettempdir(), f"conductor-ml-ratelimit-{os.getpid()}.sqlite"))
+
+    metrics_server = None
+    if args.metrics_port:
+        # /ready answers 503 until the workers are polling
+        from utils.metrics import clear_snapshots, start_metrics_server
+        clear_snapshots()
+        metrics_server = start_metrics_server(args.metrics_port)
+
+    with timed("import worker"):
+        import worker
+
+    if args.preload:
+        from utils.memory import report_memory
+        from utils.sharedweights import share_models
+        # Only the models the current settings use, and none that would run
+        # on CUDA (a GPU model loaded here would crash every forked worker)
+        task_names = [name for name in worker.WORKERS if is_enabled(name)]
+        with timed("preload shared models"):
+            share_models(worker.models_for(task_names))
+        print(report_memory(include_children=False))
+
+    if args.warmup:
+        # Models are loaded and run here, before forking, so the workers
+        # inherit them warm and the first real tasks don't pay for it.
+        # GPU models are only downloaded (CUDA doesn't survive a fork) and
+        # the Ollama warm-up runs in the background without gating /ready.
+        from utils.warmup import warm_up
+        task_names = [name for name in worker.WORKERS if is_enabled(name)]
+        try:
+            with timed("warm up models"):
+                warm_up(task_names)
+        except Exception:
+            print("Warm-up failed, not starting the workers:")
+            print(traceback.format_exc())
+            sys.exit(1)
+
     configuration = Configuration(base_url='https://admin.triggerbird.com')
 
-    task_handler = TaskHandler(
-        configuration=configuration,
-        scan_for_annotated_workers=True
-    )
+    with timed("create TaskHandler"):
+        task_handler = TaskHandler(
+            configuration=configuration,
+            scan_for_annotated_workers=True
+        )
+    print(f"Serving tasks: {args.workers or ', '.join(worker.WORKERS)}")
+    print(report())
     task_handler.start_processes()
 
+    limits = {name: limit for name, limit in concurrent_tasks().items() if is_enabled(name)}
+    if limits:
+        from utils.concurrent_runner import run_concurrent
+        multiprocessing.Process(
+            target=run_concurrent,
+            args=(configuration, worker.WORKERS, limits),
+            name="concurrent-runner",
+        ).start()
+    if metrics_server is not None:
+        from utils.metrics import set_ready
+        set_ready()
+    if args.memory_report_interval > 0:
+        from utils.memory import start_memory_reporter
+        start_memory_reporter(args.memory_report_interval)
+    if args.memory_report_interval > 0 or metrics_server is not None:
+        # Keep this process (and its reporter/endpoint threads) alive
+        task_handler.join_processes()
+        remove_run_files(os.getpid())
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from utils.batching import MicroBatcher
+
+
+class _Recorder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key, items):
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.batches.append((key, list(items)))
+        return [f"{key}:{item}" for item in items]
+
+
+def test_submit_many_is_split_at_max_batch_size():
+    recorder = _Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=8, max_wait_ms=0)
+    futures = batcher.submit_many(list(range(20)), key="k")
+    assert [f.result(timeout=5) for f in futures] == [f"k:{i}" for i in range(20)]
+    assert [len(items) for _, items in recorder.batches] == [8, 8, 4]
+    assert batcher.stats() == {"batches": 3, "items": 20, "avg_batch_size": 6.67}
+
+
+def test_lone_item_is_flushed_after_max_wait():
+    recorder = _Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=8, max_wait_ms=50)
+    started = time.monotonic()
+    assert batcher.submit("a") == "None:a"
+    assert time.monotonic() - started >= 0.045
+    assert recorder.batches == [(None, ["a"])]
+
+
+def test_full_batch_does_not_wait():
+    recorder = _Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=4, max_wait_ms=10_000)
+    futures = batcher.submit_many(["a", "b", "c", "d"])
+    assert [f.result(timeout=5) for f in futures] == ["None:a", "None:b", "None:c", "None:d"]
+
+
+def test_concurrent_callers_share_a_batch():
+    recorder = _Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit_async(i) for i in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [f"None:{i}" for i in range(5)]
+    assert [len(items) for _, items in recorder.batches] == [5]
+
+
+def test_items_are_only_batched_with_the_same_key():
+    recorder = _Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=8, max_wait_ms=20)
+    first = batcher.submit_many([1, 2], key="a")
+    second = batcher.submit_many([3], key="b")
+    assert [f.result(timeout=5) for f in first + second] == ["a:1", "a:2", "b:3"]
+    assert sorted(recorder.batches) == [("a", [1, 2]), ("b", [3])]
+
+
+def test_batch_size_one_runs_inline():
+    recorder = _Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=1)
+    assert batcher.submit("x", key="k") == "k:x"
+    assert batcher._thread is None
+
+
+def test_exception_is_set_on_every_future_of_the_batch():
+    def fail(key, items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(fail, max_batch_size=8, max_wait_ms=0)
+    futures = batcher.submit_many([1, 2, 3])
+    for future in futures:
+        with pytest.raises(ValueError, match="model failed"):
+            future.result(timeout=5)
+    assert batcher.stats()["batches"] == 0
+
+
+def test_wrong_number_of_results_is_an_error():
+    batcher = MicroBatcher(lambda key, items: items[:-1], max_batch_size=8, max_wait_ms=0)
+    futures = batcher.submit_many([1, 2])
+    for future in futures:
+        with pytest.raises(RuntimeError, match="returned 1 results for 2 items"):
+            future.result(timeout=5)
@@ -0,0 +1,53 @@
+import os
+import time
+
+from utils.blobstore import LocalBlobStore
+
+
+def _path(ref):
+    return str(ref["uri"])[len("file://"):]
+
+
+def test_round_trip_and_compression(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    text = b"markdown " * 1000
+    ref = store.put(text, "text/markdown")
+    assert ref["encoding"] == "gzip" and ref["stored_bytes"] < ref["bytes"]
+    assert store.get(ref) == text
+    image = os.urandom(100)
+    assert store.get(store.put(image, "image/png")) == image
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    first, second = store.put(b"same", "text/plain"), store.put(b"same", "text/plain")
+    assert first == second
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 1
+
+
+def test_put_rewrites_a_blob_removed_by_cleanup(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    ref = store.put(b"data", "text/plain")
+    os.remove(_path(ref))
+    assert store.put(b"data", "text/plain") == ref
+    assert store.get(ref) == b"data"
+
+
+def test_cleanup_removes_expired_then_oldest_blobs(tmp_path):
+    # Filled without limits, so no background sweep runs during the test
+    refs = [LocalBlobStore(str(tmp_path)).put(os.urandom(100), "image/png") for _ in range(4)]
+    now = time.time()
+    for age, ref in zip((500, 30, 20, 10), refs):
+        os.utime(_path(ref), (now - age, now - age))
+    # The first is expired; of the rest, the oldest goes to get under 250 bytes
+    assert LocalBlobStore(str(tmp_path), ttl_seconds=100, max_bytes=250).cleanup() == 2
+    assert [os.path.exists(_path(ref)) for ref in refs] == [False, False, True, True]
+
+
+def test_put_refreshes_the_age_of_an_existing_blob(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    ref = store.put(b"data", "text/plain")
+    old = time.time() - 500
+    os.utime(_path(ref), (old, old))
+    store.put(b"data", "text/plain")
+    assert LocalBlobStore(str(tmp_path), ttl_seconds=100).cleanup() == 0
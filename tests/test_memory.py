@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+
+from utils.memory import format_memory, process_memory, report_memory
+
+
+def test_process_memory_reads_this_process():
+    usage = process_memory()
+    assert usage["pid"] == os.getpid()
+    assert usage["rss"] > 0
+
+
+def test_format_memory_totals_pss():
+    rows = [{"pid": 1, "name": "parent", "rss": 100.0, "pss": 60.0, "shared": 80.0, "private": 20.0},
+            {"pid": 2, "name": "worker", "rss": 90.0, "pss": 30.5, "shared": 80.0, "private": 10.0}]
+    assert format_memory(rows).splitlines()[-1].split()[-1] == "90.5"
+
+
+def test_report_memory_lists_child_processes():
+    child = multiprocessing.get_context("fork").Process(target=multiprocessing.Event().wait, args=(5,),
+                                                        name="memory-test-child")
+    child.start()
+    try:
+        assert "memory-test-child" in report_memory()
+        assert "memory-test-child" not in report_memory(include_children=False)
+    finally:
+        child.terminate()
+        child.join()
@@ -0,0 +1,63 @@
+from utils.pii_rules import detect_structured, merge_entities
+
+
+def _found(text, labels=None):
+    return [(e["label"], e["text"]) for e in detect_structured(text, labels)]
+
+
+def test_detects_phone_numbers():
+    assert _found("call +44 20 7946 0958 today") == [("phone number", "+44 20 7946 0958")]
+    assert _found("office (555) 123-4567") == [("phone number", "(555) 123-4567")]
+    assert _found("mobile 555-123-4567") == [("phone number", "555-123-4567")]
+    assert _found("London 020 7946 0958") == [("phone number", "020 7946 0958")]
+
+
+def test_dates_are_not_phone_numbers():
+    assert _found("DOB 1985-01-15") == []
+    assert _found("issued 15-01-1985") == []
+    assert _found("shipped 2023.10.05") == []
+
+
+def test_id_numbers_are_not_phone_numbers():
+    assert _found("ID 12345678") == []
+    assert _found("ref 4821-99310") == []
+    assert _found("employee ID is UK-987654-321") == []
+
+
+def test_card_numbers_need_a_valid_checksum():
+    assert _found("card 4111 1111 1111 1111") == [("credit card number", "4111 1111 1111 1111")]
+    assert _found("card 4111 1111 1111 1112") == []
+
+
+def test_iban_and_email():
+    text = "pay GB82 WEST 1234 5698 7654 32 or write to jane.doe@example.com"
+    assert _found(text) == [
+        ("bank account number", "GB82 WEST 1234 5698 7654 32"),
+        ("email", "jane.doe@example.com"),
+    ]
+
+
+def test_labels_filter():
+    assert _found("mail a@example.com or call +1 555 123 4567", {"email"}) == [("email", "a@example.com")]
+
+
+def _entity(label, start, end, score=0.9):
+    return {"label": label, "text": "", "start": start, "end": end, "score": score}
+
+
+def test_model_wins_over_heuristic_rule():
+    rule = [_entity("phone number", 4, 16, 0.85)]
+    model = [_entity("date of birth", 4, 14)]
+    assert merge_entities(rule, model) == model
+
+
+def test_checksummed_rule_wins_over_model():
+    rule = [_entity("credit card number", 5, 24, 1.0)]
+    model = [_entity("phone number", 5, 24), _entity("person", 30, 40)]
+    assert merge_entities(rule, model) == [rule[0], model[1]]
+
+
+def test_non_overlapping_entities_are_all_kept():
+    rule = [_entity("phone number", 20, 32, 0.85)]
+    model = [_entity("person", 0, 10)]
+    assert merge_entities(rule, model) == [model[0], rule[0]]
@@ -0,0 +1,74 @@
+from utils.pii import _dedupe_entities, split_windows
+
+
+def _sentences(count):
+    return "".join(f"Sentence number {i:02d} is here. " for i in range(count))
+
+
+def _entity(label, start, end, score=0.9):
+    return {"label": label, "text": "x" * (end - start), "start": start, "end": end, "score": score}
+
+
+def test_short_text_is_one_window():
+    assert split_windows("Short text.", window_chars=100) == [(0, "Short text.")]
+
+
+def test_windows_map_back_to_the_text_and_cover_it():
+    text = _sentences(20)
+    windows = split_windows(text, window_chars=120, overlap_chars=40)
+    assert len(windows) > 1
+    for offset, window in windows:
+        assert text[offset:offset + len(window)] == window
+        assert len(window) <= 120
+    assert windows[0][0] == 0
+    assert windows[-1][0] + len(windows[-1][1]) == len(text)
+    for (offset, window), (next_offset, _) in zip(windows, windows[1:]):
+        # No gap between windows, and always progress
+        assert offset < next_offset <= offset + len(window)
+
+
+def test_windows_break_on_sentence_boundaries():
+    text = _sentences(20)
+    for offset, window in split_windows(text, window_chars=120, overlap_chars=40):
+        assert window.startswith("Sentence number")
+        assert window.rstrip().endswith(".")
+
+
+def test_windows_overlap_by_whole_sentences():
+    text = _sentences(20)
+    sentence = len("Sentence number 00 is here. ")
+    windows = split_windows(text, window_chars=4 * sentence, overlap_chars=sentence)
+    for (offset, window), (next_offset, _) in zip(windows, windows[1:]):
+        assert offset + len(window) - next_offset == sentence
+
+
+def test_overlap_is_capped_at_half_a_window():
+    text = _sentences(20)
+    windows = split_windows(text, window_chars=120, overlap_chars=1000)
+    for (offset, window), (next_offset, _) in zip(windows, windows[1:]):
+        assert offset + len(window) - next_offset <= 60
+
+
+def test_long_sentence_is_cut_on_whitespace():
+    text = " ".join(["word"] * 100)
+    windows = split_windows(text, window_chars=50, overlap_chars=0)
+    assert "".join(window for _, window in windows) == text
+    for _, window in windows[:-1]:
+        assert len(window) <= 50
+        assert window.endswith("word")
+
+
+def test_dedupe_keeps_the_longer_overlapping_span():
+    kept = _dedupe_entities([_entity("person", 10, 15, 0.99), _entity("person", 10, 20, 0.6)])
+    assert [(e["start"], e["end"]) for e in kept] == [(10, 20)]
+
+
+def test_dedupe_prefers_the_higher_score_for_the_same_span():
+    kept = _dedupe_entities([_entity("email", 5, 25, 0.5), _entity("email", 5, 25, 0.8)])
+    assert [e["score"] for e in kept] == [0.8]
+
+
+def test_dedupe_keeps_other_labels_and_disjoint_spans():
+    entities = [_entity("person", 30, 40), _entity("organization", 30, 40), _entity("person", 0, 10)]
+    kept = _dedupe_entities(entities)
+    assert [(e["label"], e["start"]) for e in kept] == [("person", 0), ("person", 30), ("organization", 30)]
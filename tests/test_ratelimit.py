@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeServer, echo_route
+from benchmarks.ratelimit_fake import fake_call
+from utils import ratelimit
+from utils.ratelimit import RateLimitedError, Scheduler, SharedRateLimitState
+
+
+class _MistralError(Exception):
+    # Shaped like mistralai's SDKError: the HTTP response is on raw_response
+    def __init__(self, status_code, headers):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.raw_response = type("Response", (), {"headers": headers, "status_code": status_code})()
+
+
+@pytest.fixture
+def server():
+    with FakeServer({"/": echo_route}, rpm=1, retry_after=0.3) as server:
+        yield server
+
+
+def _call(scheduler, server, **kwargs):
+    return scheduler.call("fake", "fake-model", lambda: fake_call(f"{server.url}/v1/chat"), **kwargs)
+
+
+def test_429_is_retried_after_retry_after(server):
+    scheduler = Scheduler({})
+    _call(scheduler, server)
+    # The quota is used up; lift it while the scheduler waits out Retry-After
+    threading.Timer(0.1, setattr, (server, "rpm", 0)).start()
+    started = time.monotonic()
+    _call(scheduler, server)
+    assert time.monotonic() - started >= 0.3
+    assert server.counts["429"] == 1
+    stats = scheduler.stats()["fake"]
+    assert (stats["calls"], stats["throttled"], stats["retries"], stats["in_flight"]) == (2, 1, 1, 0)
+    assert stats["concurrency_limit"] < ratelimit.RATE_LIMIT_INITIAL_CONCURRENCY
+
+
+def test_gives_up_after_the_retry_cap(server, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_MAX_RETRIES", 2)
+    server.retry_after = 0.01
+    scheduler = Scheduler({})
+    _call(scheduler, server)
+    with pytest.raises(RateLimitedError, match="after 3 attempts"):
+        _call(scheduler, server)
+    assert server.counts["429"] == 3
+    assert scheduler.stats()["fake"]["in_flight"] == 0
+
+
+def test_retry_after_holds_off_other_processes(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_MAX_RETRIES", 0)
+    path = str(tmp_path / "ratelimit.sqlite")
+    # Two schedulers on one state file stand in for two worker processes
+    first, second = Scheduler({}, SharedRateLimitState(path)), Scheduler({}, SharedRateLimitState(path))
+    _call(first, server)
+    server.retry_after = 0.5
+    with pytest.raises(RateLimitedError):
+        _call(first, server)
+    server.rpm = 0
+    started = time.monotonic()
+    _call(second, server)
+    # The second scheduler never saw a 429 but still waited out the hold-off
+    assert time.monotonic() - started >= 0.4
+    assert server.counts["429"] == 1
+    assert second.stats()["fake"]["throttled"] == 0
+
+
+def test_shared_buckets_split_one_quota(tmp_path):
+    path = str(tmp_path / "ratelimit.sqlite")
+    limits = {"fake": {"*": {"rpm": 120, "tpm": 0}}}
+    states = [SharedRateLimitState(path), SharedRateLimitState(path)]
+    # A full bucket holds one minute's quota; both states draw from it
+    waits = [states[i % 2].take("fake:*:rpm", 2.0, 120, 1) for i in range(121)]
+    assert waits[:120] == [0.0] * 120
+    assert waits[120] > 0
+    assert Scheduler(limits, states[0])._bucket("fake", "*", "rpm").key == "fake:*:rpm"
+
+
+def test_mistral_retry_after_is_honoured():
+    scheduler = Scheduler({})
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _MistralError(429, {"retry-after": "0.2"})
+        return "ok"
+
+    assert scheduler.call("mistral", "ocr", call) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+
+
+def test_server_errors_shrink_the_limit_and_are_raised():
+    scheduler = Scheduler({})
+
+    def call():
+        raise _MistralError(503, {})
+
+    with pytest.raises(_MistralError):
+        scheduler.call("mistral", "ocr", call)
+    stats = scheduler.stats()["mistral"]
+    assert stats["errors"] == 1
+    assert stats["concurrency_limit"] < ratelimit.RATE_LIMIT_INITIAL_CONCURRENCY
+
+
+def test_slot_is_released_when_the_buckets_fail():
+    class BrokenState(SharedRateLimitState):
+        def take(self, *args):
+            raise RuntimeError("database is locked")
+
+    scheduler = Scheduler({"fake": {"*": {"rpm": 10}}}, BrokenState(":memory:"))
+    with pytest.raises(RuntimeError):
+        scheduler.call("fake", "fake-model", lambda: "ok")
+    limiter = scheduler._limiter("fake")
+    assert limiter.in_flight == 0
+    assert limiter.limit == ratelimit.RATE_LIMIT_INITIAL_CONCURRENCY
@@ -0,0 +1,54 @@
+from utils.registry import estimate_size
+
+
+class _Tensor:
+    def __init__(self, numel, element_size, ptr):
+        self._numel, self._element_size, self._ptr = numel, element_size, ptr
+
+    def numel(self):
+        return self._numel
+
+    def element_size(self):
+        return self._element_size
+
+    def data_ptr(self):
+        return self._ptr
+
+
+class _Module:
+    # Enough of a torch module for estimate_size
+    def __init__(self, parameters, buffers, state):
+        self._parameters, self._buffers, self._state = parameters, buffers, state
+
+    def parameters(self):
+        return iter(self._parameters)
+
+    def buffers(self):
+        return iter(self._buffers)
+
+    def state_dict(self):
+        return dict(self._state)
+
+
+def test_counts_parameters_and_buffers_once():
+    weight, running_mean = _Tensor(1000, 4, 1), _Tensor(10, 4, 2)
+    module = _Module([weight], [running_mean], {"weight": weight, "running_mean": running_mean})
+    assert estimate_size(module) == 4040
+
+
+def test_counts_packed_quantized_weights():
+    # Dynamically quantized Linear layers keep int8 weights only in the state dict
+    packed = (_Tensor(1000, 1, 3), _Tensor(10, 4, 4))
+    module = _Module([], [], {"fc._packed_params._packed_params": packed, "fc.scale": 1.0})
+    assert estimate_size(module) == 1040
+
+
+def test_tied_weights_count_once():
+    embedding = _Tensor(500, 4, 5)
+    module = _Module([embedding], [], {"encoder.embed": embedding, "decoder.embed": embedding})
+    assert estimate_size(module) == 2000
+
+
+def test_sums_tuples_and_unwraps_model_attribute():
+    wrapper = type("Wrapper", (), {"model": _Module([_Tensor(100, 4, 6)], [], {})})()
+    assert estimate_size(("tokenizer", _Module([_Tensor(50, 4, 7)], [], {}), wrapper)) == 600
@@ -0,0 +1,121 @@
+import sqlite3
+
+import pytest
+
+from utils import resultcache
+from utils.resultcache import ResultCache, cache_key, cached_call
+
+
+def _size(cache):
+    conn = sqlite3.connect(cache.path)
+    try:
+        meta = conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+        actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    finally:
+        conn.close()
+    assert meta == actual
+    return meta
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+    assert cache.get("missing") is None
+    cache.set("key", {"markdown": "text", "pages": [1, 2]})
+    assert cache.get("key") == {"markdown": "text", "pages": [1, 2]}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["size_bytes"] == _size(cache)
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resultcache.time, "time", lambda: now[0])
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20, ttl_seconds=60)
+    cache.set("key", "value")
+    now[0] += 59
+    assert cache.get("key") == "value"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+    assert _size(cache) == 0
+
+
+def test_least_recently_read_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resultcache.time, "time", lambda: now[0])
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+    for key in ("a", "b", "c"):
+        now[0] += 1
+        cache.set(key, key * 100)
+    entry_size = _size(cache) // 3
+    # Reading "a" makes "b" the least recently used
+    now[0] += 1
+    cache.get("a")
+    cache.max_bytes = entry_size * 3
+    now[0] += 1
+    cache.set("d", "d" * 100)
+    assert [cache.get(key) is not None for key in ("a", "b", "c", "d")] == [True, False, True, True]
+    assert cache.evictions == 1
+    assert _size(cache) <= cache.max_bytes
+
+
+def test_set_many_and_overwrites_keep_the_size_right(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+    cache.set_many({f"key{i}": f"value {i}" for i in range(50)})
+    assert cache.stats()["entries"] == 50
+    before = _size(cache)
+    cache.set_many({"key0": "a much longer value " * 20, "key1": "x"})
+    assert cache.get("key0") == "a much longer value " * 20
+    assert cache.get("key1") == "x"
+    assert _size(cache) != before
+
+
+def test_values_larger_than_the_cache_are_not_stored(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=16)
+    cache.set("key", "incompressible " + "".join(chr(0x4e00 + i) for i in range(200)))
+    assert cache.get("key") is None
+
+
+def test_cache_key_depends_on_every_part():
+    key = cache_key("ocr", "etag:1", {"type": "PDF"})
+    assert key == cache_key("ocr", "etag:1", {"type": "PDF"})
+    assert key != cache_key("ocr", "etag:2", {"type": "PDF"})
+    assert key != cache_key("ocr", "etag:1", {"type": "IMAGE"})
+    assert key != cache_key("structured_ocr", "etag:1", {"type": "PDF"})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=1 << 20)
+    monkeypatch.setattr(resultcache, "result_cache", cache)
+    monkeypatch.setattr(resultcache, "RESULT_CACHE_ENABLED", True)
+    return cache
+
+
+def test_cached_call_computes_once_per_fingerprint(cache, monkeypatch):
+    monkeypatch.setattr(resultcache, "url_fingerprint", lambda url: f"etag:{url}:v1")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"markdown": "text"}
+
+    assert cached_call("ocr", "http://files/doc.pdf", {}, compute) == {"markdown": "text"}
+    assert cached_call("ocr", "http://files/doc.pdf", {}, compute) == {"markdown": "text"}
+    assert len(calls) == 1
+
+
+def test_cached_call_skips_the_cache_without_a_fingerprint(cache, monkeypatch):
+    monkeypatch.setattr(resultcache, "url_fingerprint", lambda url: None)
+    calls = []
+    for _ in range(2):
+        cached_call("ocr", "http://files/doc.pdf", {}, lambda: calls.append(1) or "value")
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_cached_call_does_not_store_rejected_results(cache, monkeypatch):
+    monkeypatch.setattr(resultcache, "url_fingerprint", lambda url: "etag:1")
+    cached_call("ocr", "http://files/doc.pdf", {}, lambda: "Error: boom",
+                should_cache=lambda value: isinstance(value, dict))
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,70 @@
+import gc
+import os
+
+import pytest
+
+from utils import sharedweights
+from utils.registry import ModelRegistry
+from utils.sharedweights import freeze, mmap_weights, share_models
+
+
+class _Module:
+    # Just enough of a torch module for freeze()
+    def __init__(self):
+        self.training = True
+        self.requires_grad = True
+
+    def parameters(self):
+        return iter(())
+
+    def state_dict(self):
+        return {}
+
+    def eval(self):
+        self.training = False
+        return self
+
+    def requires_grad_(self, requires_grad=True):
+        self.requires_grad = requires_grad
+        return self
+
+
+def test_freeze_puts_every_module_in_eval_mode():
+    model = _Module()
+    bundle = ("tokenizer", model, [_Module()])
+    assert freeze(bundle) is bundle
+    for module in (model, bundle[2][0]):
+        assert (module.training, module.requires_grad) == (False, False)
+
+
+def test_share_models_loads_and_freezes_before_the_fork(monkeypatch):
+    registry = ModelRegistry()
+    registry.register("model", _Module)
+    monkeypatch.setattr(sharedweights, "registry", registry)
+    try:
+        share_models(["model"])
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    model = registry.get("model")
+    assert registry.stats()["model"]["loads"] == 1
+    assert model.training is False
+
+
+def test_mmap_weights_is_a_no_op_without_a_directory(monkeypatch):
+    monkeypatch.setattr(sharedweights, "MODEL_MMAP_DIR", "")
+    model = _Module()
+    assert mmap_weights("model", model) is model
+    assert model.training is True
+
+
+def test_mmap_weights_maps_the_same_file_in_every_process(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    monkeypatch.setattr(sharedweights, "MODEL_MMAP_DIR", str(tmp_path))
+    first, second = torch.nn.Linear(4, 4), torch.nn.Linear(4, 4)
+    second.load_state_dict(first.state_dict())
+    mmap_weights("linear", first)
+    mmap_weights("linear", second)
+    assert os.listdir(tmp_path) == ["linear-0.pt"]
+    assert torch.equal(first.weight, second.weight)
+    assert not first.weight.requires_grad
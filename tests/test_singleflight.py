@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.singleflight import SingleFlight, make_key
+
+
+def _run_concurrently(flight, fn, callers=4):
+    pool = ThreadPoolExecutor(callers)
+    futures = [pool.submit(flight.do, "ns", "key", fn) for _ in range(callers)]
+    pool.shutdown(wait=False)
+    return futures
+
+
+def _gated(result=None, error=None):
+    # fn blocks until released, so the test can let every follower join first
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    return fn, release, calls
+
+
+def _wait_for_followers(flight, callers):
+    for _ in range(500):
+        if flight.stats().get("ns", {}).get("calls") == callers:
+            return
+        time.sleep(0.01)
+    raise AssertionError("callers never joined")
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    fn, release, calls = _gated(result={"answer": 42})
+    futures = _run_concurrently(flight, fn)
+    _wait_for_followers(flight, 4)
+    release.set()
+    assert [f.result(timeout=5) for f in futures] == [{"answer": 42}] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"ns": {"calls": 4, "executed": 1, "saved": 3}}
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+    fn, release, calls = _gated(error=ValueError("upstream down"))
+    futures = _run_concurrently(flight, fn)
+    _wait_for_followers(flight, 4)
+    release.set()
+    for future in futures:
+        with pytest.raises(ValueError, match="upstream down"):
+            future.result(timeout=5)
+    assert len(calls) == 1
+
+
+def test_finished_calls_are_not_remembered():
+    flight = SingleFlight()
+    calls = []
+    for _ in range(3):
+        flight.do("ns", "key", lambda: calls.append(1))
+    assert len(calls) == 3
+    assert flight.stats()["ns"]["saved"] == 0
+
+
+def test_a_failed_call_can_be_retried():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("ns", "key", fail)
+    assert flight.do("ns", "key", lambda: "ok") == "ok"
+
+
+def test_namespaces_do_not_share_calls():
+    flight = SingleFlight()
+    assert flight.do("a", "key", lambda: 1) == 1
+    assert flight.do("b", "key", lambda: 2) == 2
+    assert set(flight.stats()) == {"a", "b"}
+
+
+def test_make_key_ignores_dict_order():
+    assert make_key("ocr", {"a": 1, "b": 2}) == make_key("ocr", {"b": 2, "a": 1})
+    assert make_key("ocr", {"a": 1}) != make_key("ocr", {"a": 2})
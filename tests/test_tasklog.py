@@ -0,0 +1,80 @@
+import json
+import logging
+import queue
+import threading
+
+from utils import tasklog
+from utils.tasklog import JSONFormatter, TextFormatter, _DroppingQueueHandler, _TaskFilter, preview, size_of
+
+
+def _record(msg="hello", level=logging.INFO, **attrs):
+    record = logging.LogRecord("workers.test", level, __file__, 1, msg, None, None)
+    for key, value in attrs.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_preview_keeps_short_values_on_one_line():
+    assert preview("a\nb") == "a\\nb"
+    assert preview([1, 2]) == "[1, 2]"
+
+
+def test_preview_truncates_with_length():
+    assert preview("x" * 50, limit=10) == "x" * 10 + "... (50 chars)"
+
+
+def test_size_of():
+    assert size_of("abc") == 3
+    assert size_of(b"ab") == 2
+    assert size_of([1, 2, 3, 4]) == 4
+    assert size_of(42) == 0
+
+
+def test_full_queue_counts_drops_from_every_thread():
+    tasklog.setup()
+    handler = _DroppingQueueHandler(queue.Queue(maxsize=1))
+    before = tasklog.dropped()
+
+    def log_many():
+        for _ in range(500):
+            handler.enqueue(_record())
+
+    threads = [threading.Thread(target=log_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tasklog.dropped() - before == 8 * 500 - 1
+
+
+def test_task_context_tags_records_with_bound_id():
+    record_filter = _TaskFilter()
+    tasklog.bind("conductor-123")
+    with tasklog.task_context("OCRTask"):
+        record = _record()
+        assert record_filter.filter(record)
+        assert (record.task, record.task_id) == ("OCRTask", "conductor-123")
+        # The bound id is used for one execution only
+        with tasklog.task_context("OCRTask"):
+            nested = _record()
+            record_filter.filter(nested)
+            assert nested.task_id not in (None, "conductor-123")
+    outside = _record()
+    record_filter.filter(outside)
+    assert (outside.task, outside.task_id) == (None, None)
+
+
+def test_json_formatter_includes_task_and_fields():
+    record = _record("done", task="piiTask", task_id="abc", fields={"items": 3})
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry["msg"] == "done"
+    assert entry["level"] == "INFO"
+    assert (entry["task"], entry["task_id"], entry["items"]) == ("piiTask", "abc", 3)
+
+
+def test_text_formatter_includes_task_and_fields():
+    record = _record("done", task="piiTask", task_id="abc", fields={"items": 3})
+    line = TextFormatter().format(record)
+    assert "INFO" in line
+    assert line.endswith("[piiTask abc] done items=3")
+    assert TextFormatter().format(_record("plain", task=None)).endswith(" plain")
@@ -0,0 +1,49 @@
+from utils.resultcache import ResultCache
+from utils.translation_memory import TranslationMemory, normalize
+
+
+def _memory(tmp_path, max_entries=100):
+    return TranslationMemory(max_entries, store=ResultCache(str(tmp_path / "tm.sqlite"), max_bytes=1 << 20))
+
+
+def test_normalize_collapses_whitespace_and_composes():
+    assert normalize("  a\u0301  b\n c ") == "\u00e1 b c"
+
+
+def test_lookup_after_store(tmp_path):
+    memory = _memory(tmp_path)
+    memory.store_many({"नमस्ते दुनिया": "Hello world"}, "hin_Deva", "eng_Latn", "greedy")
+    assert memory.lookup(["नमस्ते  दुनिया ", "नया वाक्य"], "hin_Deva", "eng_Latn", "greedy") == {
+        "नमस्ते  दुनिया ": "Hello world"}
+    stats = memory.stats()
+    assert (stats["memory_hits"], stats["misses"]) == (1, 1)
+
+
+def test_languages_and_profile_are_part_of_the_key(tmp_path):
+    memory = _memory(tmp_path)
+    memory.store_many({"वाक्य": "Sentence"}, "hin_Deva", "eng_Latn", "greedy")
+    assert memory.lookup(["वाक्य"], "hin_Deva", "eng_Latn", "full_beam") == {}
+    assert memory.lookup(["वाक्य"], "mar_Deva", "eng_Latn", "greedy") == {}
+
+
+def test_in_memory_lru_falls_back_to_disk(tmp_path):
+    memory = _memory(tmp_path, max_entries=2)
+    memory.store_many({"एक": "One", "दो": "Two", "तीन": "Three"}, "hin_Deva", "eng_Latn", "greedy")
+    assert memory.stats()["entries"] == 2
+    assert memory.lookup(["एक"], "hin_Deva", "eng_Latn", "greedy") == {"एक": "One"}
+    assert memory.stats()["disk_hits"] == 1
+
+
+def test_another_process_reads_the_disk_store(tmp_path):
+    _memory(tmp_path).store_many({"एक": "One"}, "hin_Deva", "eng_Latn", "greedy")
+    other = _memory(tmp_path)
+    assert other.lookup(["एक"], "hin_Deva", "eng_Latn", "greedy") == {"एक": "One"}
+    assert other.lookup(["एक"], "hin_Deva", "eng_Latn", "greedy") == {"एक": "One"}
+    stats = other.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_works_without_a_disk_store():
+    memory = TranslationMemory(1)
+    memory.store_many({"एक": "One", "दो": "Two"}, "hin_Deva", "eng_Latn", "greedy")
+    assert memory.lookup(["एक", "दो"], "hin_Deva", "eng_Latn", "greedy") == {"दो": "Two"}
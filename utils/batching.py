@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    Collect items submitted from concurrent callers into small batches.
+
+    A batch is flushed when it reaches `max_batch_size` items or when its
+    oldest item has waited `max_wait_ms`, whichever comes first. Items are
+    only batched with others that share the same key, so callers with
+    different labels/thresholds/language pairs never end up in one batch.
+
+    With `max_wait_ms` 0 nothing waits: a batch holds whatever was queued
+    while the previous one ran, plus every item of a submit_many call. Use
+    that when there is only ever one caller, where any wait is pure latency.
+
+    Args:
+        process_batch: Callable taking (key, items) and returning one result per item, in order
+        max_batch_size (int): Maximum number of items per batch
+        max_wait_ms (float): Maximum time the first item of a batch waits for company
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[Hashable, List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._pending: Dict[Hashable, List[Tuple[float, Any, Future]]] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any, key: Hashable = None) -> Any:
+        """Queue `item` and block until its result is available."""
+        return self.submit_async(item, key).result()
+
+    def submit_async(self, item: Any, key: Hashable = None) -> Future:
+        """Queue `item` and return a Future for its result."""
+        return self.submit_many([item], key)[0]
+
+    def submit_many(self, items: List[Any], key: Hashable = None) -> List[Future]:
+        """Queue `items` together, so they can share a batch, and return a Future for each."""
+        futures: List[Future] = [Future() for _ in items]
+        if not items:
+            return futures
+        now = time.monotonic()
+        if self.max_batch_size == 1:
+            for item, future in zip(items, futures):
+                self._run(key, [(now, item, future)])
+            return futures
+        with self._cond:
+            self._ensure_thread()
+            self._pending.setdefault(key, []).extend(zip([now] * len(items), items, futures))
+            self._cond.notify()
+        return futures
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            }
+
+    def _ensure_thread(self) -> None:
+        # Caller holds self._cond. Threads don't survive a fork, so a child
+        # process that inherited this object starts its own.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        if self._pid != os.getpid():
+            self._pending = {}
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def _next_batch(self) -> Tuple[Hashable, List[Tuple[float, Any, Future]]]:
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                # Serve the key whose oldest item has waited longest
+                key = min(self._pending, key=lambda k: self._pending[k][0][0])
+                queue = self._pending[key]
+                remaining = queue[0][0] + self.max_wait - time.monotonic()
+                if len(queue) >= self.max_batch_size or remaining <= 0:
+                    batch = queue[:self.max_batch_size]
+                    del queue[:self.max_batch_size]
+                    if not queue:
+                        del self._pending[key]
+                    return key, batch
+                self._cond.wait(remaining)
+
+    def _loop(self) -> None:
+        while True:
+            key, batch = self._next_batch()
+            self._run(key, batch)
+
+    def _run(self, key: Hashable, batch: List[Tuple[float, Any, Future]]) -> None:
+        items = [item for _, item, _ in batch]
+        try:
+            results = self.process_batch(key, items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"Batch function returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        with self._cond:
+            self.batches += 1
+            self.items += len(items)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+# Where large task outputs (OCR markdown, extracted images) are written
+# instead of being returned inline. Only the local filesystem store is
+# built in; other stores implement BlobStore and are set with set_blob_store.
+BLOB_STORE_DIR = os.environ.get(
+    "BLOB_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "conductor-ml-workers", "blobs"),
+)
+BLOB_COMPRESS_LEVEL = int(os.environ.get("BLOB_COMPRESS_LEVEL", "6"))
+# Blobs not written for this long are deleted (0 keeps them forever). Keep
+# it longer than RESULT_CACHE_TTL_SECONDS and than consumers of the task
+# outputs need the references, or they will point at deleted files.
+BLOB_TTL_SECONDS = float(os.environ.get("BLOB_TTL_SECONDS", str(14 * 24 * 3600)))
+# Size cap for the directory; the least recently written blobs go first.
+# 0 means no cap, as a cap can delete blobs still referenced.
+BLOB_MAX_MB = float(os.environ.get("BLOB_MAX_MB", "0"))
+# How often a process sweeps the directory, at most
+BLOB_CLEANUP_INTERVAL_SECONDS = float(os.environ.get("BLOB_CLEANUP_INTERVAL_SECONDS", "3600"))
+
+# Content types that are already compressed and are stored as they are
+_PRECOMPRESSED = ("image/jpeg", "image/png", "image/webp", "image/gif", "application/gzip")
+
+
+class BlobStore:
+    """
+    Content-addressed store for large task outputs.
+
+    put() returns a reference dict that is small enough to travel in a
+    Conductor task output; get() takes that reference back to the bytes.
+    """
+
+    def put(self, data: bytes, content_type: str = "application/octet-stream",
+            suffix: str = "") -> Dict[str, object]:
+        raise NotImplementedError
+
+    def get(self, ref: Dict[str, object]) -> bytes:
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    BlobStore on a local (or network-mounted) directory.
+
+    Blobs are named by the sha256 of their content, so storing the same
+    output twice writes it once. Text and other compressible content is
+    gzipped; images are kept as they are.
+
+    Storing a blob again refreshes its modification time. At most every
+    `cleanup_interval` seconds, put() starts a background sweep that
+    deletes blobs older than `ttl_seconds` and then, while the directory is
+    over `max_bytes`, the least recently written ones.
+
+    Args:
+        root (str): Directory the blobs are written under
+        compress_level (int): gzip level for compressible content
+        ttl_seconds (float): Age after which a blob is deleted (0 means never)
+        max_bytes (int): Size cap for the directory (0 means none)
+        cleanup_interval (float): Minimum seconds between sweeps
+    """
+
+    def __init__(self, root: str, compress_level: int = 6, ttl_seconds: float = 0,
+                 max_bytes: int = 0, cleanup_interval: float = 3600):
+        self.root = root
+        self.compress_level = compress_level
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def put(self, data: bytes, content_type: str = "application/octet-stream",
+            suffix: str = "") -> Dict[str, object]:
+        digest = hashlib.sha256(data).hexdigest()
+        compress = content_type not in _PRECOMPRESSED
+        name = digest + suffix + (".gz" if compress else "")
+        path = self._path(name)
+        try:
+            # Already stored: refresh its age instead of writing it again
+            os.utime(path)
+            stored_bytes = os.path.getsize(path)
+        except FileNotFoundError:
+            # Not stored yet, or removed by a cleanup since
+            stored = gzip.compress(data, self.compress_level, mtime=0) if compress else data
+            self._write(path, stored)
+            stored_bytes = len(stored)
+        self._maybe_cleanup()
+        return {
+            "uri": "file://" + os.path.abspath(path),
+            "sha256": digest,
+            "content_type": content_type,
+            "encoding": "gzip" if compress else None,
+            "bytes": len(data),
+            "stored_bytes": stored_bytes,
+        }
+
+    @staticmethod
+    def _write(path: str, stored: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename, so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(stored)
+        os.replace(tmp_path, path)
+
+    def _maybe_cleanup(self) -> None:
+        if not (self.ttl_seconds or self.max_bytes):
+            return
+        now = time.monotonic()
+        with self._cleanup_lock:
+            if self._last_cleanup and now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+        threading.Thread(target=self.cleanup, name="blob-cleanup", daemon=True).start()
+
+    def cleanup(self) -> int:
+        """Delete expired blobs, then the oldest ones while over max_bytes. Returns the number deleted."""
+        blobs = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        blobs.sort()
+        total = sum(size for _, size, _ in blobs)
+        expires = time.time() - self.ttl_seconds
+        deleted = 0
+        for mtime, size, path in blobs:
+            expired = self.ttl_seconds and mtime < expires
+            if not expired and not (self.max_bytes and total > self.max_bytes):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another process
+                continue
+            total -= size
+            deleted += 1
+        return deleted
+
+    def get(self, ref: Dict[str, object]) -> bytes:
+        path = str(ref["uri"])[len("file://"):]
+        with open(path, "rb") as f:
+            data = f.read()
+        return gzip.decompress(data) if ref.get("encoding") == "gzip" else data
+
+
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """The process-wide blob store, a LocalBlobStore on BLOB_STORE_DIR unless replaced."""
+    global _store
+    if _store is None:
+        _store = LocalBlobStore(
+            BLOB_STORE_DIR,
+            BLOB_COMPRESS_LEVEL,
+            ttl_seconds=BLOB_TTL_SECONDS,
+            max_bytes=int(BLOB_MAX_MB * 1024 * 1024),
+            cleanup_interval=BLOB_CLEANUP_INTERVAL_SECONDS,
+        )
+    return _store
+
+
+def set_blob_store(store: BlobStore) -> None:
+    """Use another BlobStore implementation (e.g. an object store) for this process."""
+    global _store
+    _store = store
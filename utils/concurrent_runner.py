@@ -0,0 +1,151 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from conductor.client.configuration.configuration import Configuration
+from conductor.client.http.api.task_resource_api import TaskResourceApi
+from conductor.client.http.api_client import ApiClient
+from conductor.client.worker.worker import Worker
+
+from utils import tasklog
+from utils.metrics import metrics
+
+CONCURRENT_POLL_TIMEOUT_MS = int(os.environ.get("CONCURRENT_POLL_TIMEOUT_MS", "100"))
+CONCURRENT_IDLE_SLEEP_MS = int(os.environ.get("CONCURRENT_IDLE_SLEEP_MS", "100"))
+CONCURRENT_UPDATE_RETRIES = int(os.environ.get("CONCURRENT_UPDATE_RETRIES", "3"))
+
+log = tasklog.get_logger("concurrent")
+
+
+class ConcurrentTaskRunner:
+    """
+    Run many tasks of one type at once inside the current process.
+
+    TaskHandler gives every worker its own process that executes one task at
+    a time, which wastes a process per in-flight call for tasks that mostly
+    wait on remote APIs. This runner polls only as many tasks as it has free
+    slots (so a task is only taken off the queue when it can start right
+    away), executes them on a thread pool and reports each result as soon as
+    it finishes.
+
+    Args:
+        task_definition_name (str): Conductor task type to poll
+        execute_function (callable): The worker function, as declared in worker.py
+        configuration (Configuration): Conductor client configuration
+        max_concurrency (int): Maximum number of tasks in flight
+    """
+
+    def __init__(
+        self,
+        task_definition_name: str,
+        execute_function: Callable,
+        configuration: Configuration,
+        max_concurrency: int = 16,
+    ):
+        self.task_definition_name = task_definition_name
+        self.worker = Worker(task_definition_name, execute_function)
+        self.task_client = TaskResourceApi(ApiClient(configuration))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix=f"{task_definition_name}-worker",
+        )
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        """Poll and execute tasks until stop() is called."""
+        log.info("Concurrent runner for %s started (max %d in flight)",
+                 self.task_definition_name, self.max_concurrency)
+        while not self._stopped.is_set():
+            # Block until at least one slot is free, then claim every free slot
+            self._slots.acquire()
+            free = 1
+            while free < self.max_concurrency and self._slots.acquire(blocking=False):
+                free += 1
+
+            tasks = self._poll(free)
+            for task in tasks:
+                with self._lock:
+                    self._in_flight += 1
+                self._executor.submit(self._execute, task)
+            for _ in range(free - len(tasks)):
+                self._slots.release()
+            if not tasks:
+                time.sleep(CONCURRENT_IDLE_SLEEP_MS / 1000)
+        self._executor.shutdown(wait=True)
+
+    def _poll(self, count: int) -> List:
+        try:
+            return self.task_client.batch_poll(
+                self.task_definition_name,
+                workerid=self.worker_id,
+                count=count,
+                timeout=CONCURRENT_POLL_TIMEOUT_MS,
+            ) or []
+        except Exception as e:
+            log.warning("Failed to poll %s: %s", self.task_definition_name, e)
+            return []
+
+    def _execute(self, task) -> None:
+        # Time from scheduling to being polled, both set by the server (ms)
+        scheduled, started = getattr(task, "scheduled_time", None), getattr(task, "start_time", None)
+        if scheduled and started and started >= scheduled:
+            metrics.observe("task_phase_seconds", (started - scheduled) / 1000,
+                            task=self.task_definition_name, phase="queue_wait")
+        try:
+            # Worker.execute maps task input to the function's parameters and
+            # turns exceptions into a FAILED TaskResult, same as TaskHandler.
+            # The task's log records carry its Conductor id.
+            tasklog.bind(task.task_id)
+            task_result = self.worker.execute(task)
+            self._update(task_result)
+        except Exception:
+            log.exception("Error executing %s task %s", self.task_definition_name, task.task_id)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _update(self, task_result) -> None:
+        for attempt in range(CONCURRENT_UPDATE_RETRIES):
+            try:
+                self.task_client.update_task(body=task_result)
+                return
+            except Exception as e:
+                log.warning("Failed to update %s task %s (attempt %d): %s",
+                            self.task_definition_name, task_result.task_id, attempt + 1, e)
+                time.sleep(0.5 * (2 ** attempt))
+
+
+def run_concurrent(configuration: Configuration, workers: Dict[str, Callable], limits: Dict[str, int]) -> None:
+    """
+    Run a ConcurrentTaskRunner per task in `limits`, all in this process.
+
+    Args:
+        configuration (Configuration): Conductor client configuration
+        workers (dict): Worker functions by task name
+        limits (dict): Maximum in-flight tasks by task name
+    """
+    threads = []
+    for task_name, limit in limits.items():
+        runner = ConcurrentTaskRunner(task_name, workers[task_name], configuration, limit)
+        thread = threading.Thread(target=runner.run, name=f"{task_name}-poller", daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
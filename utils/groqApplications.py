@@ -1,12 +1,35 @@
 import os
 import json
-from groq import Groq
-import requests
-import io
-import re
+from concurrent.futures import ThreadPoolExecutor
+from utils import tasklog
+from utils.resultcache import cached_call
+from utils.ratelimit import estimate_tokens, scheduler
+from utils.singleflight import make_key, single_flight
 
-# Initialize the Groq client
-client = Groq(api_key="YOUR_API_KEY")
+log = tasklog.get_logger("groq")
+
+# Long-audio mode: files over the upload limit are split on silences into
+# chunks of at most GROQ_CHUNK_SECONDS and transcribed GROQ_CHUNK_WORKERS at a time
+GROQ_MAX_UPLOAD_MB = float(os.environ.get("GROQ_MAX_UPLOAD_MB", "25"))
+GROQ_CHUNK_SECONDS = float(os.environ.get("GROQ_CHUNK_SECONDS", "600"))
+GROQ_CHUNK_WORKERS = int(os.environ.get("GROQ_CHUNK_WORKERS", "4"))
+
+# Re-encode audio to 16 kHz mono Opus before upload (see utils.media.transcode_for_upload)
+TRANSCODE_AUDIO = os.environ.get("TRANSCODE_AUDIO", "0") == "1"
+
+_client = None
+
+
+def get_client():
+    """Create the Groq client on first use instead of at import time."""
+    global _client
+    if _client is None:
+        from groq import Groq
+        # Retries on 429 are handled by utils.ratelimit.scheduler, which
+        # shares the backoff across every caller in the process. The SDK
+        # reads GROQ_BASE_URL to talk to another endpoint (e.g. a local fake).
+        _client = Groq(api_key=os.environ.get("GROQ_API_KEY", "YOUR_API_KEY"), max_retries=0)
+    return _client
 
 class CustomJSONEncoder(json.JSONEncoder):
     """Custom JSON encoder that handles special types from the Groq API."""
@@ -22,35 +45,109 @@ class CustomJSONEncoder(json.JSONEncoder):
 
 def transcribe_audio_from_url_groq(url, model="whisper-large-v3-turbo", prompt=None, 
                                   response_format="verbose_json", timestamp_granularities=None, 
-                                  language=None, temperature=0.0):
-    print(f"Transcribing audio from URL: {url}")
+                                  language=None, temperature=0.0, long_audio=None,
+                                  include_timestamps=False, transcode=None):
     """
-    Transcribe an audio file from a URL using Groq's audio transcription API.
-    
-    Args:
-        url (str): URL of the audio file to transcribe
-        model (str): Model to use for transcription
-        prompt (str, optional): Context or spelling hints for the transcription
-        response_format (str, optional): Format of the response
-        timestamp_granularities (list, optional): List of timestamp granularities
-        language (str, optional): Language code of the audio
-        temperature (float, optional): Temperature for the model
-        
-    Returns:
-        dict: Transcription result from Groq
+    Transcribe an audio file from a URL, served from the result cache when
+    the same audio was transcribed before with the same parameters.
+    Identical requests that arrive while one is in flight share its result.
+    See _transcribe_audio_from_url_groq for the arguments.
     """
-    # Download the content from the URL
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch audio from URL: Status code {response.status_code}")
-    
-    # Create a file-like object from the content
-    audio_data = io.BytesIO(response.content)
-    audio_data.name = 'audio.mp3'  # Set a filename for the file-like object
-    
+    log.debug("Transcribing audio from %s", url)
+    params = {
+        "model": model,
+        "prompt": prompt,
+        "response_format": response_format,
+        "timestamp_granularities": timestamp_granularities,
+        "language": language,
+        "temperature": temperature,
+        "long_audio": long_audio,
+        "include_timestamps": include_timestamps,
+        "transcode": TRANSCODE_AUDIO if transcode is None else transcode,
+    }
+    return single_flight.do("transcribe", make_key(url, params), lambda: cached_call(
+        "transcribe",
+        url,
+        params,
+        lambda: _transcribe_audio_from_url_groq(url, **params),
+    ))
+
+
+def _field(obj, name):
+    # Segments and words come back as dicts or as objects depending on the SDK version
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _transcription_to_dict(transcription, offset=0.0):
+    """
+    Extract text, segments, words and metadata from a Transcription object,
+    shifting every timestamp by `offset` seconds.
+    """
+    transcription_dict = {'text': _field(transcription, 'text') or ''}
+
+    segments_list = []
+    for segment in _field(transcription, 'segments') or []:
+        segment_dict = {}
+        # Extract common segment attributes
+        for attr in ['id', 'seek', 'start', 'end', 'text', 'tokens', 
+                     'temperature', 'avg_logprob', 'compression_ratio', 'no_speech_prob']:
+            value = _field(segment, attr)
+            if value is not None:
+                segment_dict[attr] = value
+        for attr in ['start', 'end']:
+            if attr in segment_dict:
+                segment_dict[attr] = round(segment_dict[attr] + offset, 3)
+        segments_list.append(segment_dict)
+    transcription_dict['segments'] = segments_list
+
+    words_list = []
+    for word in _field(transcription, 'words') or []:
+        word_dict = {}
+        # Extract common word attributes
+        for attr in ['word', 'start', 'end']:
+            value = _field(word, attr)
+            if value is not None:
+                word_dict[attr] = value
+        for attr in ['start', 'end']:
+            if attr in word_dict:
+                word_dict[attr] = round(word_dict[attr] + offset, 3)
+        words_list.append(word_dict)
+    transcription_dict['words'] = words_list
+
+    # Additional metadata
+    for attr in ['task', 'language', 'duration']:
+        value = _field(transcription, attr)
+        if value is not None:
+            transcription_dict[attr] = value
+    return transcription_dict
+
+
+def _stitch(chunk_dicts, chunks):
+    """Join per-chunk transcriptions (already shifted onto the original timeline)."""
+    stitched = {
+        'text': " ".join(d['text'].strip() for d in chunk_dicts if d['text'].strip()),
+        'segments': [],
+        'words': [],
+    }
+    for d in chunk_dicts:
+        for segment in d['segments']:
+            segment['id'] = len(stitched['segments'])
+            stitched['segments'].append(segment)
+        stitched['words'].extend(d['words'])
+    for attr in ['task', 'language']:
+        if attr in chunk_dicts[0]:
+            stitched[attr] = chunk_dicts[0][attr]
+    stitched['duration'] = chunks[-1][1]
+    stitched['chunks'] = len(chunks)
+    return stitched
+
+
+def _create_transcription(audio_file, model, prompt, response_format, timestamp_granularities, language, temperature):
     # Prepare parameters for the API call
     params = {
-        "file": audio_data,
+        "file": audio_file,
         "model": model,
         "temperature": temperature
     }
@@ -65,60 +162,143 @@ def transcribe_audio_from_url_groq(url, model="whisper-large-v3-turbo", prompt=N
     if language:
         params["language"] = language
     
+    def attempt():
+        # A retried upload has to start from the beginning of the file again
+        contents = audio_file[1]
+        if hasattr(contents, "seek"):
+            contents.seek(0)
+        return get_client().audio.transcriptions.create(**params)
+
     try:
         # Create a transcription
-        transcription = client.audio.transcriptions.create(**params)
-        
-        # Extract relevant attributes from the Transcription object
-        transcription_dict = {}
-        
-        # First, try to get attributes directly
-        if hasattr(transcription, 'text'):
-            transcription_dict['text'] = transcription.text
-        
-        if hasattr(transcription, 'segments'):
-            segments_list = []
-            for segment in transcription.segments:
-                segment_dict = {}
-                # Extract common segment attributes
-                for attr in ['id', 'seek', 'start', 'end', 'text', 'tokens', 
-                             'temperature', 'avg_logprob', 'compression_ratio', 'no_speech_prob']:
-                    if hasattr(segment, attr):
-                        segment_dict[attr] = getattr(segment, attr)
-                # segments_list.append(segment_dict)
-            # transcription_dict['segments'] = segments_list
-        
-        if hasattr(transcription, 'words'):
-            words_list = []
-            for word in transcription.words:
-                word_dict = {}
-                # Extract common word attributes
-                for attr in ['word', 'start', 'end']:
-                    if hasattr(word, attr):
-                        word_dict[attr] = getattr(word, attr)
-                words_list.append(word_dict)
-            # transcription_dict['words'] = words_list
-        
-        # Additional metadata
-        for attr in ['task', 'language', 'duration']:
-            if hasattr(transcription, attr):
-                transcription_dict[attr] = getattr(transcription, attr)
-        transcription_dict = json.dumps(transcription_dict, indent=2, cls=CustomJSONEncoder)
-        return transcription_dict
-        
+        return scheduler.call("groq", model, attempt, priority="transcribeTask")
     except Exception as e:
         raise Exception(f"Transcription failed: {str(e)}")
 
+
+def _transcribe_long_audio(audio_data, api_args):
+    """
+    Split audio on silences into chunks that fit the upload limit, transcribe
+    them in parallel and stitch the results onto the original timeline.
+    """
+    from utils.media import detect_silences, extract_chunk, plan_chunks, probe_duration, spill_to_path
+
+    # Chunks are re-encoded as 16 kHz mono Opus, about 4 KB per second
+    codec_args = ["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "32k"]
+    max_seconds = min(GROQ_CHUNK_SECONDS, GROQ_MAX_UPLOAD_MB * 1024 * 1024 * 0.9 / 4000)
+
+    source_path = spill_to_path(audio_data)
+    # Every chunk file is recorded as soon as it exists, so the finally
+    # below removes them all even if a later chunk fails
+    chunk_paths = []
+    try:
+        duration = probe_duration(source_path)
+        chunks = plan_chunks(duration, detect_silences(source_path), max_seconds)
+        log.info("Transcribing %.0fs of audio as %d chunks", duration, len(chunks))
+
+        def transcribe_chunk(index):
+            # Extraction runs in the pool too, so early chunks upload while
+            # later ones are still being cut
+            start, end = chunks[index]
+            chunk_path = extract_chunk(source_path, start, end, codec_args, ".ogg")
+            chunk_paths.append(chunk_path)
+            with open(chunk_path, "rb") as chunk_file:
+                transcription = _create_transcription(
+                    ("audio.ogg", chunk_file.read()), **api_args
+                )
+            return _transcription_to_dict(transcription, offset=start)
+
+        with ThreadPoolExecutor(max_workers=GROQ_CHUNK_WORKERS) as pool:
+            chunk_dicts = list(pool.map(transcribe_chunk, range(len(chunks))))
+        return _stitch(chunk_dicts, chunks)
+    finally:
+        for path in [source_path, *chunk_paths]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _transcribe_audio_from_url_groq(url, model="whisper-large-v3-turbo", prompt=None, 
+                                   response_format="verbose_json", timestamp_granularities=None, 
+                                   language=None, temperature=0.0, long_audio=None,
+                                   include_timestamps=False, transcode=False):
+    """
+    Transcribe an audio file from a URL using Groq's audio transcription API.
+    
+    Args:
+        url (str): URL of the audio file to transcribe
+        model (str): Model to use for transcription
+        prompt (str, optional): Context or spelling hints for the transcription
+        response_format (str, optional): Format of the response
+        timestamp_granularities (list, optional): List of timestamp granularities
+        language (str, optional): Language code of the audio
+        temperature (float, optional): Temperature for the model
+        long_audio (bool, optional): Split into silence-aligned chunks and transcribe
+            them in parallel. None (default) does this only for files over GROQ_MAX_UPLOAD_MB.
+        include_timestamps (bool, optional): Include segments and word timestamps in the result
+        transcode (bool, optional): Re-encode to 16 kHz mono Opus before upload, unless the
+            source is already compact. The result then has a "preprocessing" report.
+        
+    Returns:
+        dict: Transcription result from Groq
+    """
+    from utils.media import download_to_spooled, transcode_for_upload
+
+    # Stream the content from the URL; small files stay in memory, large
+    # ones spill to disk instead of being buffered whole
+    audio_data, size = download_to_spooled(url)
+    filename, preprocessing = 'audio.mp3', None
+    if transcode:
+        # A smaller upload is faster and may fit under the size limit, so this
+        # runs before deciding whether long-audio chunking is needed
+        audio_data, size, filename, preprocessing = transcode_for_upload(audio_data, size)
+        log.info("Transcoded for upload", extra={"fields": {
+            "bytes_before": preprocessing['bytes_before'], "bytes_after": preprocessing['bytes_after']}})
+    api_args = {
+        "model": model,
+        "prompt": prompt,
+        "response_format": response_format,
+        "timestamp_granularities": timestamp_granularities,
+        "language": language,
+        "temperature": temperature,
+    }
+    try:
+        if long_audio is None:
+            long_audio = size > GROQ_MAX_UPLOAD_MB * 1024 * 1024
+        if long_audio:
+            transcription_dict = _transcribe_long_audio(audio_data, api_args)
+        else:
+            transcription = _create_transcription((filename, audio_data), **api_args)
+            transcription_dict = _transcription_to_dict(transcription)
+    finally:
+        audio_data.close()
+
+    if not include_timestamps:
+        transcription_dict.pop('segments', None)
+        transcription_dict.pop('words', None)
+    if preprocessing is not None:
+        transcription_dict['preprocessing'] = preprocessing
+    return transcription_dict
+
+LLM_MODEL = "llama3-70b-8192"
+
+
 def LLMChat(query):
-    chat_completion = client.chat.completions.create(
+    # Identical questions asked at the same moment share one completion
+    return single_flight.do("llm_chat", make_key(query, LLM_MODEL), lambda: _llm_chat(query))
+
+
+def _llm_chat(query):
+    chat_completion = scheduler.call("groq", LLM_MODEL, lambda: get_client().chat.completions.create(
         messages=[
             {
                 "role": "user",
                 "content": f"Answer the following question: {query}",
             }
         ],
-        model="llama3-70b-8192",
-    )
+        model=LLM_MODEL,
+    ), priority="queryTask", tokens=estimate_tokens(query))
     return chat_completion.choices[0].message.content
 # Example usage:
 if __name__ == "__main__":
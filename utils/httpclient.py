@@ -0,0 +1,30 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", "60"))
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Shared keep-alive session for downloading task inputs.
+
+    One session per process: connections to the same host are reused across
+    tasks instead of opening a new TCP/TLS connection for every download.
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
@@ -1,14 +1,107 @@
+import os
+import re
 import torch
 from transformers import (
     AutoModelForSeq2SeqLM,
     AutoTokenizer,
 )
 from IndicTransToolkit import IndicProcessor
+from utils import tasklog
+from utils.batching import MicroBatcher
+from utils.metrics import metrics
+from utils.registry import registry
+from utils.singleflight import make_key, single_flight
+from utils.startup import concurrent_tasks
+from utils.translation_memory import TRANSLATION_MEMORY_ENABLED, translation_memory
 
-model_name = "ai4bharat/indictrans2-indic-en-1B"
-tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name, trust_remote_code=True)
-ip = IndicProcessor(inference=True)
+model_name = os.environ.get("INDIC_MODEL", "ai4bharat/indictrans2-indic-en-1B")
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# Concurrent translation requests for the same (src, tgt) pair are coalesced
+# into one batch of up to INDIC_BATCH_SIZE sentences, waiting at most
+# INDIC_BATCH_WAIT_MS. Each batch is then cut into length buckets of
+# INDIC_BUCKET_SIZE sentences so padding="longest" pads as little as possible.
+# The wait defaults to 0 unless InidcToEnglish runs several calls at once in
+# this process (CONCURRENT_TASKS); a lone request's sentences are queued
+# together and still share a batch.
+INDIC_BATCH_SIZE = int(os.environ.get("INDIC_BATCH_SIZE", "32"))
+INDIC_BATCH_WAIT_MS = float(os.environ.get(
+    "INDIC_BATCH_WAIT_MS", "20" if concurrent_tasks().get("InidcToEnglish", 1) > 1 else "0"))
+INDIC_BUCKET_SIZE = int(os.environ.get("INDIC_BUCKET_SIZE", "8"))
+
+# Decoding profiles selectable per InidcToEnglish task. "int8" profiles run
+# a dynamically quantized copy of the model on CPU; INDIC_QUANTIZE=1 forces
+# the quantized model for every profile.
+PROFILES = {
+    "greedy": {"num_beams": 1, "int8": False},
+    "small_beam": {"num_beams": 2, "int8": False},
+    "full_beam": {"num_beams": 5, "int8": False},
+    "int8_greedy": {"num_beams": 1, "int8": True},
+    "int8_small_beam": {"num_beams": 2, "int8": True},
+}
+DEFAULT_PROFILE = os.environ.get("INDIC_PROFILE", "full_beam")
+INDIC_QUANTIZE = os.environ.get("INDIC_QUANTIZE", "0") == "1"
+
+# max_length is derived from the longest input in the bucket instead of the
+# fixed 256, so short sentences stop beam-searching long after they're done.
+INDIC_MAX_LENGTH = int(os.environ.get("INDIC_MAX_LENGTH", "256"))
+INDIC_LENGTH_RATIO = float(os.environ.get("INDIC_LENGTH_RATIO", "2.0"))
+
+# Torch intra-op threads for this worker process (0 keeps torch's default)
+INDIC_NUM_THREADS = int(os.environ.get("INDIC_NUM_THREADS", "0"))
+
+log = tasklog.get_logger("indic")
+
+# A sentence ends at a danda, double danda or Latin terminal punctuation, or
+# at a line break; a period followed by a digit is a decimal point. The
+# trailing whitespace is kept so paragraphs can be rejoined as they were.
+_SENTENCE_RE = re.compile(r"(?:[^।॥.!?\n]|\.(?=\d))*(?:[।॥.!?]+[\"')\]]*|(?=\n)|$)\s*")
+
+
+def configure_threads(num_threads=INDIC_NUM_THREADS):
+    """Pin torch's intra-op thread pool size for this process."""
+    if num_threads > 0 and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+
+
+def _load_indictrans():
+    configure_threads()
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name, trust_remote_code=True)
+    model.to(DEVICE)
+    model.eval()
+    ip = IndicProcessor(inference=True)
+    return tokenizer, model, ip
+
+
+def _load_indictrans_int8():
+    # Dynamic quantization only has CPU kernels, so this variant always runs
+    # on CPU. Linear layers carry nearly all of the 1B parameters.
+    configure_threads()
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name, trust_remote_code=True)
+    model.eval()
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    ip = IndicProcessor(inference=True)
+    return tokenizer, model, ip
+
+
+registry.register("indictrans", _load_indictrans)
+registry.register("indictrans-int8", _load_indictrans_int8)
+
+
+def prefetch():
+    """Download the model files without loading them (and without touching CUDA)."""
+    from huggingface_hub import snapshot_download
+    snapshot_download(model_name)
+
+
+def _resolve_profile(profile):
+    profile = profile or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown translation profile '{profile}'. Choose from: {', '.join(PROFILES)}")
+    return profile
 
 input_sentences = [
     "जब मैं छोटा था, मैं हर रोज़ पार्क जाता था।",
@@ -20,16 +113,55 @@ input_sentences = [
 src_lang, tgt_lang = "hin_Deva", "eng_Latn"
 
 
-def TransulationWorkerIndictoEnglish(input_sentences , src_lang , tgt_lang):
+def model_for(profile=None):
+    """Registry name and device of the model that serves `profile`, given INDIC_QUANTIZE."""
+    if PROFILES[_resolve_profile(profile)]["int8"] or INDIC_QUANTIZE:
+        return "indictrans-int8", "cpu"
+    return "indictrans", DEVICE
+
+
+def uses_cuda(profile=None):
+    """Whether translating with `profile` runs on the GPU, i.e. initializes CUDA."""
+    return model_for(profile)[1] == "cuda"
+
+
+def preload_models():
+    """
+    Registry models to load before the workers fork: the one serving the
+    default profile, unless it runs on CUDA, which doesn't survive a fork.
+    """
+    name, device = model_for()
+    return [] if device == "cuda" else [name]
 
+
+def split_sentences(text):
+    """
+    Split a paragraph into sentences.
+
+    Returns:
+        List of (sentence, trailing_whitespace) tuples. Joining every
+        sentence with its trailing whitespace gives back the original text.
+    """
+    pieces = []
+    for match in _SENTENCE_RE.finditer(text):
+        chunk = match.group()
+        if not chunk:
+            continue
+        sentence = chunk.rstrip()
+        pieces.append((sentence, chunk[len(sentence):]))
+    return pieces
+
+
+def _generate(sentences, src_lang, tgt_lang, profile=None):
+    settings = PROFILES[_resolve_profile(profile)]
+    name, device = model_for(profile)
+    tokenizer, model, ip = registry.get(name)
     batch = ip.preprocess_batch(
-        input_sentences,
+        sentences,
         src_lang=src_lang,
         tgt_lang=tgt_lang,
     )
 
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
     # Tokenize the sentences and generate input encodings
     inputs = tokenizer(
         batch,
@@ -37,16 +169,18 @@ def TransulationWorkerIndictoEnglish(input_sentences , src_lang , tgt_lang):
         padding="longest",
         return_tensors="pt",
         return_attention_mask=True,
-    ).to(DEVICE)
+    ).to(device)
+    max_length = min(INDIC_MAX_LENGTH, int(inputs["input_ids"].shape[1] * INDIC_LENGTH_RATIO) + 16)
 
-    # Generate translations using the model
-    with torch.no_grad():
+    # Generate translations using the model (on the batcher thread, so the
+    # task is named explicitly)
+    with torch.inference_mode(), metrics.phase("model_inference", "InidcToEnglish"):
         generated_tokens = model.generate(
             **inputs,
             use_cache=True,
             min_length=0,
-            max_length=256,
-            num_beams=5,
+            max_length=max_length,
+            num_beams=settings["num_beams"],
             num_return_sequences=1,
         )
 
@@ -59,17 +193,98 @@ def TransulationWorkerIndictoEnglish(input_sentences , src_lang , tgt_lang):
         )
 
     # Postprocess the translations, including entity replacement
-    translations = ip.postprocess_batch(generated_tokens, lang=tgt_lang)
-    print(f"Translations from {src_lang} to {tgt_lang}:")
-    # print(translations)
-    return translations[0]
+    return ip.postprocess_batch(generated_tokens, lang=tgt_lang)
+
+
+def translate_bucketed(sentences, src_lang, tgt_lang, profile=None):
+    """
+    Translate sentences in length-sorted buckets and return them in input order.
+
+    Repeated sentences within the batch are only translated once.
+    """
+    unique = list(dict.fromkeys(sentences))
+    order = sorted(range(len(unique)), key=lambda i: len(unique[i]))
+    translated = {}
+    for start in range(0, len(order), INDIC_BUCKET_SIZE):
+        bucket = [unique[i] for i in order[start:start + INDIC_BUCKET_SIZE]]
+        outputs = _generate(bucket, src_lang, tgt_lang, profile)
+        translated.update(zip(bucket, outputs))
+    return [translated[sentence] for sentence in sentences]
+
+
+def _run_translation_batch(key, sentences):
+    src_lang, tgt_lang, profile = key
+    outputs = translate_bucketed(sentences, src_lang, tgt_lang, profile)
+    if TRANSLATION_MEMORY_ENABLED:
+        translation_memory.store_many(dict(zip(sentences, outputs)), src_lang, tgt_lang, profile)
+    return outputs
+
+
+_translation_batcher = MicroBatcher(
+    _run_translation_batch,
+    max_batch_size=INDIC_BATCH_SIZE,
+    max_wait_ms=INDIC_BATCH_WAIT_MS,
+)
+
+
+def TransulationWorkerIndictoEnglish(input_sentences , src_lang , tgt_lang, profile=None):
+    """
+    Translate a list of texts from src_lang to tgt_lang.
+
+    Each text is split into sentences. Sentences already in the translation
+    memory are answered from it; the rest are queued on a shared batcher so
+    concurrent callers with the same language pair are translated together.
+    The translated sentences are rejoined per text.
+
+    Args:
+        input_sentences (list): Texts (sentences or whole paragraphs) to translate
+        src_lang (str): Source language code, e.g. "hin_Deva"
+        tgt_lang (str): Target language code, e.g. "eng_Latn"
+        profile (str): Decoding profile from PROFILES (default INDIC_PROFILE)
+
+    Returns:
+        list: One translation per input text, in input order
+    """
+    profile = _resolve_profile(profile)
+    # Identical requests in flight at the same time share one translation
+    return single_flight.do(
+        "translate",
+        make_key(list(input_sentences), src_lang, tgt_lang, profile),
+        lambda: _translate_texts(input_sentences, src_lang, tgt_lang, profile),
+    )
+
+
+def _translate_texts(input_sentences, src_lang, tgt_lang, profile):
+    key = (src_lang, tgt_lang, profile)
+    split = [split_sentences(text) for text in input_sentences]
+    remembered = {}
+    if TRANSLATION_MEMORY_ENABLED:
+        remembered = translation_memory.lookup(
+            [sentence for pieces in split for sentence, _ in pieces if sentence], src_lang, tgt_lang, profile
+        )
+
+    # Every sentence of the request is queued at once, so they can share a
+    # batch even when the batcher doesn't wait
+    queued = list(dict.fromkeys(
+        sentence for pieces in split for sentence, _ in pieces if sentence and sentence not in remembered
+    ))
+    futures = dict(zip(queued, _translation_batcher.submit_many(queued, key=key)))
 
-    # for input_sentence, translation in zip(input_sentences, translations):
-    #     print(f"{src_lang}: {input_sentence}")
-    #     print(f"{tgt_lang}: {translation}")
+    translations = []
+    for pieces in split:
+        parts = []
+        for sentence, whitespace in pieces:
+            future = futures.get(sentence)
+            parts.append(future.result() if future is not None else remembered.get(sentence, ""))
+            parts.append(whitespace)
+        translations.append("".join(parts).strip())
+    log.debug("%d translation(s) from %s to %s", len(translations), src_lang, tgt_lang)
+    return translations
 
 
 if __name__ == "__main__":
     # Example usage
-    res = TransulationWorkerIndictoEnglish(["मेरे मित्र ने मुझे उसके जन्मदिन की पार्टी में बुलाया है, और मैं उसे एक तोहफा दूंगा।"], src_lang, tgt_lang)
-    print(res)
+    res = TransulationWorkerIndictoEnglish(input_sentences, src_lang, tgt_lang)
+    for input_sentence, translation in zip(input_sentences, res):
+        print(f"{src_lang}: {input_sentence}")
+        print(f"{tgt_lang}: {translation}")
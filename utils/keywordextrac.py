@@ -1,7 +1,63 @@
+import os
 import spacy
 import json
 from collections import Counter
 from string import punctuation
+from utils.metrics import metrics
+from utils.registry import registry
+
+KEYWORD_SPACY_MODEL = os.environ.get("KEYWORD_SPACY_MODEL", "en_core_web_lg")
+KEYWORD_BATCH_SIZE = int(os.environ.get("KEYWORD_BATCH_SIZE", "64"))
+# Processes nlp.pipe uses for large batches (1 = in this process)
+KEYWORD_N_PROCESS = int(os.environ.get("KEYWORD_N_PROCESS", "1"))
+
+# Only POS tags are used: keep tok2vec, tagger and attribute_ruler (which
+# maps tags to POS) and skip the rest of the pipeline
+DISABLED_COMPONENTS = ["ner", "parser", "lemmatizer"]
+POS_TAGS = frozenset(['PROPN', 'ADJ', 'NOUN'])
+PUNCTUATION = frozenset(punctuation)
+
+registry.register("spacy_en", lambda: spacy.load(KEYWORD_SPACY_MODEL, disable=DISABLED_COMPONENTS))
+
+
+def preload_models():
+    """Registry models to load before the workers fork."""
+    return ["spacy_en"]
+
+
+def _keywords(doc, top_n):
+    # is_stop uses the stop words of the loaded pipeline's language
+    word_counts = Counter(
+        token.text for token in doc
+        if token.pos_ in POS_TAGS and not token.is_stop and token.text not in PUNCTUATION
+    )
+    return {"keywords": [{"word": word, "count": count} for word, count in word_counts.most_common(top_n)]}
+
+
+def extract_keywords(texts, top_n=10, batch_size=None, n_process=None):
+    """
+    Extract the most frequent keywords (proper nouns, adjectives and nouns)
+    from each text, running them through nlp.pipe together.
+
+    Parameters:
+        texts (list): The input texts
+        top_n (int): The number of top keywords to return per text
+        batch_size (int): Texts per nlp.pipe batch (default KEYWORD_BATCH_SIZE)
+        n_process (int): Processes for nlp.pipe (default KEYWORD_N_PROCESS)
+
+    Returns:
+        list: {"keywords": [{"word", "count"}, ...]} for each text, in order
+    """
+    nlp = registry.get("spacy_en")
+    n_process = n_process or KEYWORD_N_PROCESS
+    batch_size = batch_size or KEYWORD_BATCH_SIZE
+    if n_process > 1 and len(texts) < batch_size * n_process:
+        # Starting worker processes costs more than a small batch saves
+        n_process = 1
+    with metrics.phase("model_inference"):
+        docs = nlp.pipe((text.lower() for text in texts), batch_size=batch_size, n_process=n_process)
+        return [_keywords(doc, top_n) for doc in docs]
+
 
 def extract_keywords_to_json(text, top_n=10):
     """
@@ -14,31 +70,11 @@ def extract_keywords_to_json(text, top_n=10):
     Returns:
         str: A JSON string containing the keywords and their counts
     """
-    # Load spaCy model
     try:
-        nlp = spacy.load("en_core_web_lg")
+        result_dict = extract_keywords([text], top_n)[0]
     except OSError:
         # If model is not found, handle the error
-        return json.dumps({"error": "Required spaCy model not found. Install with: python -m spacy download en_core_web_sm"})
-    
-    # Extract keywords
-    result = []
-    pos_tag = ['PROPN', 'ADJ', 'NOUN']
-    doc = nlp(text.lower())
-    
-    for token in doc:
-        if token.text in nlp.Defaults.stop_words or token.text in punctuation:
-            continue
-        if token.pos_ in pos_tag:
-            result.append(token.text)
-    
-    # Count keywords
-    word_counts = Counter(result)
-    most_common_list = word_counts.most_common(top_n)
-    
-    # Create result dictionary
-    keywords_list = [{"word": word, "count": count} for word, count in most_common_list]
-    result_dict = {"keywords": keywords_list}
+        return json.dumps({"error": f"Required spaCy model not found. Install with: python -m spacy download {KEYWORD_SPACY_MODEL}"})
     
     # Return as JSON string
     return json.dumps(result_dict, indent=2)
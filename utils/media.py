@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from utils.httpclient import HTTP_TIMEOUT_SECONDS, get_session
+from utils.metrics import metrics
+
+# Downloads stay in memory up to this size, then spill to a temp file
+MEDIA_SPOOL_MAX_MB = float(os.environ.get("MEDIA_SPOOL_MAX_MB", "16"))
+FFMPEG = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE = os.environ.get("FFPROBE_BINARY", "ffprobe")
+# A corrupt or stalled input must not hang a worker; subprocess.TimeoutExpired
+# is raised once these run out
+FFMPEG_TIMEOUT_SECONDS = float(os.environ.get("FFMPEG_TIMEOUT_SECONDS", "600"))
+FFPROBE_TIMEOUT_SECONDS = float(os.environ.get("FFPROBE_TIMEOUT_SECONDS", "60"))
+
+# Pre-upload transcoding: 16 kHz mono Opus, which is what Whisper resamples
+# to anyway. Sources already at or below these settings are sent as they are.
+TRANSCODE_CODEC_ARGS = ["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "32k", "-application", "voip"]
+TRANSCODE_MAX_SAMPLE_RATE = 16000
+TRANSCODE_MAX_BITRATE = int(os.environ.get("TRANSCODE_MAX_BITRATE", "64000"))
+# Used to estimate the upload time a transcode saves
+TRANSCODE_UPLOAD_MBPS = float(os.environ.get("TRANSCODE_UPLOAD_MBPS", "50"))
+
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+
+def download_to_spooled(url: str, chunk_size: int = 1 << 16) -> Tuple[IO[bytes], int]:
+    """
+    Stream a URL into a SpooledTemporaryFile over the shared keep-alive session.
+
+    Returns:
+        (file, size_in_bytes), with the file rewound to the start
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=int(MEDIA_SPOOL_MAX_MB * 1024 * 1024))
+    size = 0
+    with metrics.phase("download"), get_session().get(url, stream=True, timeout=HTTP_TIMEOUT_SECONDS) as response:
+        if response.status_code != 200:
+            spooled.close()
+            raise Exception(f"Failed to fetch audio from URL: Status code {response.status_code}")
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            spooled.write(chunk)
+            size += len(chunk)
+    spooled.seek(0)
+    return spooled, size
+
+
+def spill_to_path(fileobj: IO[bytes], suffix: str = "") -> str:
+    """Copy a file object to a named temp file (for ffmpeg). The caller deletes it."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as out:
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, out, 1 << 20)
+    fileobj.seek(0)
+    return path
+
+
+def probe_duration(path: str) -> float:
+    """Duration of a media file in seconds, from ffprobe."""
+    output = subprocess.run(
+        [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True, timeout=FFPROBE_TIMEOUT_SECONDS,
+    ).stdout.strip()
+    return float(output)
+
+
+def detect_silences(path: str, noise_db: float = -35.0, min_silence: float = 0.5) -> List[Tuple[float, float]]:
+    """(start, end) of every silence ffmpeg's silencedetect filter finds."""
+    stderr = subprocess.run(
+        [FFMPEG, "-hide_banner", "-nostats", "-i", path,
+         "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+        capture_output=True, text=True, check=True, timeout=FFMPEG_TIMEOUT_SECONDS,
+    ).stderr
+    silences = []
+    start: Optional[float] = None
+    for kind, value in _SILENCE_RE.findall(stderr):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+
+def plan_chunks(duration: float, silences: List[Tuple[float, float]], max_seconds: float) -> List[Tuple[float, float]]:
+    """
+    Cut [0, duration] into chunks of at most max_seconds.
+
+    Each cut goes in the middle of the last silence before the limit, so
+    words aren't split across chunks; if a stretch has no silence at all
+    it is cut hard at the limit.
+    """
+    midpoints = [(start + end) / 2 for start, end in silences]
+    chunks = []
+    position = 0.0
+    while duration - position > max_seconds:
+        limit = position + max_seconds
+        candidates = [m for m in midpoints if position + max_seconds / 4 < m <= limit]
+        cut = candidates[-1] if candidates else limit
+        chunks.append((position, cut))
+        position = cut
+    chunks.append((position, duration))
+    return chunks
+
+
+def extract_chunk(path: str, start: float, end: float, codec_args: List[str], suffix: str) -> str:
+    """Write [start, end) of `path` to a new temp file with the given ffmpeg codec arguments."""
+    fd, out_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        subprocess.run(
+            [FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+             "-ss", f"{start:.3f}", "-i", path, "-t", f"{end - start:.3f}", "-vn", *codec_args, out_path],
+            check=True, timeout=FFMPEG_TIMEOUT_SECONDS,
+        )
+    except BaseException:
+        os.remove(out_path)
+        raise
+    return out_path
+
+
+def probe_audio(path: str) -> Dict[str, Any]:
+    """Container, codec, sample rate, channels, bitrate and whether there is a video stream."""
+    output = subprocess.run(
+        [FFPROBE, "-v", "error", "-show_entries",
+         "format=format_name,bit_rate:stream=codec_type,codec_name,sample_rate,channels,bit_rate",
+         "-of", "json", path],
+        capture_output=True, text=True, check=True, timeout=FFPROBE_TIMEOUT_SECONDS,
+    ).stdout
+    probe = json.loads(output)
+    streams = probe.get("streams", [])
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    return {
+        "format": probe.get("format", {}).get("format_name", ""),
+        "codec": audio.get("codec_name"),
+        "sample_rate": int(audio.get("sample_rate") or 0),
+        "channels": int(audio.get("channels") or 0),
+        "bit_rate": int(audio.get("bit_rate") or probe.get("format", {}).get("bit_rate") or 0),
+        "has_video": any(stream.get("codec_type") == "video" for stream in streams),
+    }
+
+
+def is_compact(info: Dict[str, Any]) -> bool:
+    """True if re-encoding would not make the upload meaningfully smaller."""
+    return (
+        not info["has_video"]
+        and info["channels"] == 1
+        and 0 < info["sample_rate"] <= TRANSCODE_MAX_SAMPLE_RATE
+        and 0 < info["bit_rate"] <= TRANSCODE_MAX_BITRATE
+    )
+
+
+def transcode_for_upload(fileobj: IO[bytes], size: int) -> Tuple[IO[bytes], int, str, Dict[str, Any]]:
+    """
+    Re-encode audio (or the audio track of a video) to 16 kHz mono Opus.
+
+    Skips the work when the source is already compact. If ffmpeg is missing,
+    fails or times out, the original file is returned untouched.
+
+    Returns:
+        (file, size, filename, report) where report has bytes_before,
+        bytes_after, transcode_seconds and an estimate of the upload time saved
+    """
+    report: Dict[str, Any] = {"transcoded": False, "bytes_before": size, "bytes_after": size}
+    source_path = spill_to_path(fileobj)
+    try:
+        started = time.perf_counter()
+        info = probe_audio(source_path)
+        report["source"] = info
+        if is_compact(info):
+            report["skipped"] = "already compact"
+            return fileobj, size, "audio.mp3", report
+
+        fd, out_path = tempfile.mkstemp(suffix=".ogg")
+        os.close(fd)
+        try:
+            subprocess.run(
+                [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source_path,
+                 "-vn", *TRANSCODE_CODEC_ARGS, out_path],
+                check=True, timeout=FFMPEG_TIMEOUT_SECONDS,
+            )
+            new_size = os.path.getsize(out_path)
+            elapsed = time.perf_counter() - started
+            if new_size >= size:
+                report["skipped"] = "transcode was not smaller"
+                return fileobj, size, "audio.mp3", report
+            transcoded = tempfile.SpooledTemporaryFile(max_size=int(MEDIA_SPOOL_MAX_MB * 1024 * 1024))
+            with open(out_path, "rb") as f:
+                shutil.copyfileobj(f, transcoded, 1 << 20)
+            transcoded.seek(0)
+        finally:
+            os.remove(out_path)
+
+        upload_bytes_per_second = TRANSCODE_UPLOAD_MBPS * 1e6 / 8
+        report.update({
+            "transcoded": True,
+            "bytes_after": new_size,
+            "transcode_seconds": round(elapsed, 3),
+            "estimated_seconds_saved": round((size - new_size) / upload_bytes_per_second - elapsed, 3),
+        })
+        fileobj.close()
+        return transcoded, new_size, "audio.ogg", report
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError) as e:
+        report["skipped"] = f"transcode failed: {e}"
+        return fileobj, size, "audio.mp3", report
+    finally:
+        os.remove(source_path)
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Memory of a process in MB, read from /proc/<pid>/smaps_rollup.
+
+    Returns rss, pss (RSS with shared pages divided between the processes
+    sharing them), shared and private. PSS is the number to compare when
+    checking that forked workers share model weights: RSS counts shared
+    pages in full for every process.
+    """
+    pid = pid or os.getpid()
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    result = {"pid": pid, "rss": 0.0, "pss": 0.0, "shared": 0.0, "private": 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                key = parts[0].rstrip(":")
+                if key in fields and len(parts) >= 2:
+                    result[fields[key]] += int(parts[1]) / 1024
+    except OSError:
+        # No smaps_rollup (non-Linux or old kernel): only our own peak RSS is available
+        import resource
+        if pid == os.getpid():
+            scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+            result["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return {key: round(value, 1) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def format_memory(rows: List[Dict[str, float]]) -> str:
+    lines = [f"{'pid':>8} {'name':<28} {'rss MB':>9} {'pss MB':>9} {'shared MB':>10} {'private MB':>11}"]
+    total_pss = 0.0
+    for row in rows:
+        total_pss += row["pss"]
+        lines.append(
+            f"{row['pid']:>8} {row.get('name', ''):<28} {row['rss']:>9} {row['pss']:>9} "
+            f"{row['shared']:>10} {row['private']:>11}"
+        )
+    lines.append(f"{'':>8} {'total pss':<28} {'':>9} {round(total_pss, 1):>9}")
+    return "\n".join(lines)
+
+
+def report_memory(include_children: bool = True) -> str:
+    """Memory table for this process and (optionally) its live child processes."""
+    rows = [dict(process_memory(), name="parent")]
+    if include_children:
+        for child in multiprocessing.active_children():
+            rows.append(dict(process_memory(child.pid), name=child.name))
+    return format_memory(rows)
+
+
+def start_memory_reporter(interval_seconds: float) -> threading.Thread:
+    """Print report_memory() every `interval_seconds` from a daemon thread."""
+    def loop():
+        while True:
+            time.sleep(interval_seconds)
+            print(report_memory())
+
+    thread = threading.Thread(target=loop, name="memory-reporter", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    # Usage: python -m utils.memory <pid> [<pid> ...]
+    pids = [int(pid) for pid in sys.argv[1:]] or [os.getpid()]
+    print(format_memory([dict(process_memory(pid), name=str(pid)) for pid in pids]))
@@ -0,0 +1,409 @@
+import bisect
+import cProfile
+import glob
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.startup import pid_alive
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# How often each process writes its snapshot for the run.py endpoint to merge
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+# Fraction of task outputs serialized once more to measure their size and
+# serialization time (the Conductor client does the real serialization)
+METRICS_PAYLOAD_SAMPLE_RATE = float(os.environ.get("METRICS_PAYLOAD_SAMPLE_RATE", "0.05"))
+# Fraction of tasks run under cProfile; profiles of the ones slower than
+# METRICS_PROFILE_SLOW_SECONDS are written to <metrics dir>/profiles
+METRICS_PROFILE_SAMPLE_RATE = float(os.environ.get("METRICS_PROFILE_SAMPLE_RATE", "0"))
+METRICS_PROFILE_SLOW_SECONDS = float(os.environ.get("METRICS_PROFILE_SLOW_SECONDS", "5"))
+
+# Upper bounds of the histogram buckets: seconds for latencies, bytes for sizes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+HELP = {
+    "task_seconds": "Task latency from the start of the worker function to its return",
+    "task_phase_seconds": "Time spent in one phase of a task",
+    "tasks_total": "Tasks finished, by status",
+    "tasks_in_flight": "Tasks currently executing",
+    "task_payload_bytes": "Serialized size of task outputs (sampled)",
+    "model_load_seconds": "Model load time",
+    "cache_requests_total": "Cache lookups, by result",
+    "log_records_dropped_total": "Log records dropped because the log queue was full",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def metrics_dir() -> str:
+    """Directory of the per-process snapshot files (METRICS_DIR)."""
+    return os.environ.get("METRICS_DIR") or os.path.join(tempfile.gettempdir(), "conductor-ml-metrics")
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """
+    In-process counters, gauges and histograms.
+
+    Updates are a dict lookup and an add under a lock. A daemon thread
+    writes a JSON snapshot of this process's metrics to metrics_dir() every
+    METRICS_FLUSH_SECONDS; the endpoint in run.py merges the snapshots of
+    every worker process. Collectors registered with add_collector are
+    called at snapshot time for values other modules already keep (cache
+    and scheduler stats).
+
+    A forked child starts with empty counters and histograms, and its
+    collector counters are reported relative to their values at the fork,
+    so samples the parent recorded (model loads, warm-up) are not exported
+    again by every worker. Gauges are kept. Collector gauges (resident model
+    bytes, concurrency limits) are labelled with the pid: every process
+    reports its own value, often inherited from the preloading parent, so
+    summing them across processes would count the same thing several times.
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: List[Callable[[], Iterator[Tuple[str, str, Dict[str, object], float]]]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._flusher_pid: Optional[int] = None
+        self._profile_lock = threading.Lock()
+        self._fork_baseline: Dict[Tuple[str, Labels], float] = {}
+        self._collector_baseline: Dict[Tuple[str, Labels], float] = {}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork_in_child)
+
+    def _before_fork(self) -> None:
+        if METRICS_ENABLED:
+            self._fork_baseline = {(name, labels): value for kind, name, labels, value in self._collect()
+                                   if kind == "counter"}
+
+    def _after_fork_in_child(self) -> None:
+        # Locks held by other threads at the fork would never be released here
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._local = threading.local()
+        self._counters.clear()
+        self._histograms.clear()
+        self._collector_baseline = self._fork_baseline
+        self._fork_baseline = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._ensure_flusher()
+
+    def add_gauge(self, name: str, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + value
+        self._ensure_flusher()
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # One count per bucket plus +Inf, then sum
+                histogram = self._histograms[key] = [0.0] * (len(buckets) + 2)
+                self._buckets[name] = buckets
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+        self._ensure_flusher()
+
+    def add_collector(self, collector: Callable[[], Iterator[Tuple[str, str, Dict[str, object], float]]]) -> None:
+        """Register a callable yielding (kind, name, labels, value) with kind "counter" or "gauge"."""
+        self._collectors.append(collector)
+
+    @property
+    def current_task(self) -> str:
+        return getattr(self._local, "task", None) or "unknown"
+
+    @contextmanager
+    def phase(self, phase: str, task: Optional[str] = None):
+        """Time the enclosed block as `phase` of the current (or given) task."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("task_phase_seconds", time.perf_counter() - started,
+                         task=task or self.current_task, phase=phase)
+
+    @contextmanager
+    def track_task(self, task: str):
+        """
+        Count and time one execution of `task`: in-flight gauge, latency
+        histogram, ok/error counter and (sampled) cProfile capture. Phases
+        timed on the same thread inside the block are attributed to `task`.
+
+        Yields a dict whose "status" the caller can set to "error" for
+        failures reported as a return value rather than an exception.
+        """
+        previous = getattr(self._local, "task", None)
+        self._local.task = task
+        self.add_gauge("tasks_in_flight", 1, task=task)
+        profiler = self._start_profile()
+        started = time.perf_counter()
+        outcome = {"status": "ok"}
+        try:
+            yield outcome
+        except BaseException:
+            outcome["status"] = "error"
+            raise
+        finally:
+            status = outcome["status"]
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                self._finish_profile(profiler, task, elapsed)
+            self.add_gauge("tasks_in_flight", -1, task=task)
+            self.observe("task_seconds", elapsed, task=task)
+            self.inc("tasks_total", task=task, status=status)
+            self._local.task = previous
+
+    def record_output(self, task: str, result) -> None:
+        """For a sample of tasks, time serializing `result` and record its size."""
+        if not METRICS_ENABLED or random.random() >= METRICS_PAYLOAD_SAMPLE_RATE:
+            return
+        with self.phase("serialization", task):
+            size = len(result) if isinstance(result, str) else len(json.dumps(result, default=str))
+        self.observe("task_payload_bytes", size, buckets=SIZE_BUCKETS, task=task)
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        if METRICS_PROFILE_SAMPLE_RATE <= 0 or random.random() >= METRICS_PROFILE_SAMPLE_RATE:
+            return None
+        # Only one profiler can be active in a process at a time
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def _finish_profile(self, profiler: cProfile.Profile, task: str, elapsed: float) -> None:
+        profiler.disable()
+        self._profile_lock.release()
+        if elapsed < METRICS_PROFILE_SLOW_SECONDS:
+            return
+        directory = os.path.join(metrics_dir(), "profiles")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{task}-{int(time.time())}-{os.getpid()}-{elapsed:.1f}s.prof")
+        profiler.dump_stats(path)
+        print(f"Slow {task} task ({elapsed:.1f}s) profiled to {path}")
+
+    def snapshot(self) -> Dict[str, object]:
+        """This process's metrics as a JSON-serializable dict."""
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            gauges = [[name, list(labels), value] for (name, labels), value in self._gauges.items()]
+            histograms = [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()]
+            buckets = {name: list(bounds) for name, bounds in self._buckets.items()}
+        for kind, name, labels, value in self._collect():
+            if kind == "counter":
+                counters.append([name, list(labels), value - self._collector_baseline.get((name, labels), 0.0)])
+            else:
+                gauges.append([name, list(_labels(dict(labels, pid=os.getpid()))), value])
+        return {"pid": os.getpid(), "counters": counters, "gauges": gauges,
+                "histograms": histograms, "buckets": buckets}
+
+    def _collect(self) -> List[Tuple[str, str, Labels, float]]:
+        collected = []
+        for collector in self._collectors:
+            try:
+                for kind, name, labels, value in collector():
+                    collected.append((kind, name, _labels(labels), value))
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return collected
+
+    def flush(self) -> None:
+        """Write this process's snapshot to metrics_dir()/<pid>.json."""
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, f"{os.getpid()}.json"))
+
+    def _ensure_flusher(self) -> None:
+        # One flusher thread per process, started again in forked children
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(METRICS_FLUSH_SECONDS)
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"Metrics flush failed: {e}")
+
+        threading.Thread(target=loop, name="metrics-flusher", daemon=True).start()
+
+
+metrics = Metrics()
+
+
+def merge_snapshots(snapshots: List[Dict[str, object]]) -> Dict[str, object]:
+    """Sum counters, gauges and histograms with the same name and labels."""
+    merged = {"counters": {}, "gauges": {}, "histograms": {}, "buckets": {}}
+    for snapshot in snapshots:
+        merged["buckets"].update(snapshot.get("buckets", {}))
+        for kind in ("counters", "gauges"):
+            for name, labels, value in snapshot.get(kind, []):
+                key = (name, tuple(tuple(label) for label in labels))
+                merged[kind][key] = merged[kind].get(key, 0.0) + value
+        for name, labels, values in snapshot.get("histograms", []):
+            key = (name, tuple(tuple(label) for label in labels))
+            current = merged["histograms"].get(key)
+            merged["histograms"][key] = values if current is None else [a + b for a, b in zip(current, values)]
+    return merged
+
+
+def read_snapshots() -> List[Dict[str, object]]:
+    """
+    The snapshot files of every live process, with this process's live
+    metrics in place of its file. Files of processes that have exited are
+    deleted.
+    """
+    snapshots = [metrics.snapshot()]
+    for path in glob.glob(os.path.join(metrics_dir(), "*.json")):
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        if not pid_alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(merged: Dict[str, object]) -> str:
+    """Prometheus text exposition (version 0.0.4) of merged snapshots."""
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for kind, prom_kind in (("counters", "counter"), ("gauges", "gauge")):
+        for (name, labels), value in sorted(merged[kind].items()):
+            header(name, prom_kind)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), values in sorted(merged["histograms"].items()):
+        header(name, "histogram")
+        bounds = merged["buckets"].get(name, LATENCY_BUCKETS)
+        cumulative = 0.0
+        for bound, count in zip(list(bounds) + ["+Inf"], values[:-1]):
+            cumulative += count
+            le = bound if isinstance(bound, str) else f"{bound:g}"
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative:g}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:g}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative:g}")
+    return "\n".join(lines) + "\n"
+
+
+_ready = threading.Event()
+
+
+def set_ready(ready: bool = True) -> None:
+    """Mark this process ready (or not) to take tasks; GET /ready reports it."""
+    if ready:
+        _ready.set()
+    else:
+        _ready.clear()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve GET /metrics (Prometheus text, merged across every worker
+    process) and GET /ready (200 once set_ready() was called, 503 until
+    then) from a daemon thread of the calling process.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/ready":
+                status, body = (200, b"ready\n") if _ready.is_set() else (503, b"warming up\n")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if path != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(merge_snapshots(read_snapshots())).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def clear_snapshots() -> None:
+    """Remove snapshot files left by processes of an earlier run."""
+    for path in glob.glob(os.path.join(metrics_dir(), "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
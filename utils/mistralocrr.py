@@ -6,15 +6,46 @@ from mistralai import DocumentURLChunk, ImageURLChunk, TextChunk
 import json 
 from mistralai import Mistral
 from mistralai.models import OCRResponse
-from IPython.display import Markdown, display
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from utils import tasklog
+from utils.blobstore import get_blob_store
+from utils.resultcache import cached_call
+from utils.ratelimit import estimate_tokens, scheduler
+from utils.singleflight import make_key, single_flight
 
-api_key = "42wmLET2ZDwUAlsx4JLiaCrtypxLySko" # Replace with your API key
-client = Mistral(api_key=api_key)
+OCR_MODEL = "mistral-ocr-latest"
+STRUCTURED_MODEL = "pixtral-12b-latest"
+# Concurrent per-page chat.parse calls for StructuredOCRTask on PDFs
+STRUCTURED_OCR_PAGE_WORKERS = int(os.environ.get("STRUCTURED_OCR_PAGE_WORKERS", "8"))
+# OCRTask output: "inline" returns the markdown with base64 images inlined,
+# "blobs" writes images and markdown to the blob store and returns references
+OCR_OUTPUT_MODE = os.environ.get("OCR_OUTPUT_MODE", "inline")
+OCR_PREVIEW_CHARS = int(os.environ.get("OCR_PREVIEW_CHARS", "500"))
+
+api_key = os.environ.get("MISTRAL_API_KEY", "42wmLET2ZDwUAlsx4JLiaCrtypxLySko") # Replace with your API key
+_client = None
+
+
+def get_client() -> Mistral:
+    """Create the Mistral client on first use instead of at import time."""
+    global _client
+    if _client is None:
+        # MISTRAL_SERVER_URL points the client at another endpoint (e.g. a local fake)
+        _client = Mistral(api_key=api_key, server_url=os.environ.get("MISTRAL_SERVER_URL") or None)
+    return _client
+
+
+log = tasklog.get_logger("mistralocr")
+
+_IMAGE_PLACEHOLDER_RE = re.compile(r"!\[([^\]]*)\]\(([^)]*)\)")
 
 
 def replace_images_in_markdown(markdown_str: str, images_dict: dict) -> str:
     """
-    Replace image placeholders in markdown with base64-encoded images.
+    Replace image placeholders in markdown with base64-encoded images (or
+    any other link target), in a single pass over the text.
 
     Args:
         markdown_str: Markdown text containing image placeholders
@@ -23,11 +54,16 @@ def replace_images_in_markdown(markdown_str: str, images_dict: dict) -> str:
     Returns:
         Markdown text with images replaced by base64 data
     """
-    for img_name, base64_str in images_dict.items():
-        markdown_str = markdown_str.replace(
-            f"![{img_name}]({img_name})", f"![{img_name}]({base64_str})"
-        )
-    return markdown_str
+    if not images_dict:
+        return markdown_str
+
+    def substitute(match):
+        name, target = match.group(1), match.group(2)
+        if name == target and name in images_dict:
+            return f"![{name}]({images_dict[name]})"
+        return match.group(0)
+
+    return _IMAGE_PLACEHOLDER_RE.sub(substitute, markdown_str)
 
 def get_combined_markdown(ocr_response: OCRResponse) -> str:
     """
@@ -50,89 +86,232 @@ def get_combined_markdown(ocr_response: OCRResponse) -> str:
 
     return "\n\n".join(markdowns)
 
+def _decode_image(image_base64: str):
+    """(bytes, content type) of an image from OCR, which may be a data: URI or bare base64."""
+    content_type = "image/jpeg"
+    if image_base64.startswith("data:"):
+        header, _, image_base64 = image_base64.partition(",")
+        content_type = header[len("data:"):].split(";", 1)[0] or content_type
+    return base64.b64decode(image_base64), content_type
+
+
+def externalize_ocr_output(ocr_response: OCRResponse) -> dict:
+    """
+    Write the images and the combined markdown of an OCR response to the
+    blob store and return only references and small metadata.
+
+    Image placeholders in the stored markdown point at the stored images.
+
+    Returns:
+        dict with markdown_ref, images (id, page and blob reference of
+        each), pages and a short preview of the markdown
+    """
+    store = get_blob_store()
+    markdowns, images = [], []
+    for page_number, page in enumerate(ocr_response.pages, start=1):
+        image_uris = {}
+        for img in page.images:
+            if not img.image_base64:
+                continue
+            data, content_type = _decode_image(img.image_base64)
+            ref = store.put(data, content_type)
+            image_uris[img.id] = ref["uri"]
+            images.append({"id": img.id, "page": page_number, **ref})
+        markdowns.append(replace_images_in_markdown(page.markdown, image_uris))
+
+    markdown = "\n\n".join(markdowns)
+    return {
+        "markdown_ref": store.put(markdown.encode("utf-8"), "text/markdown", ".md"),
+        "images": images,
+        "pages": len(ocr_response.pages),
+        "preview": markdown[:OCR_PREVIEW_CHARS],
+    }
+
+
 class StructuredOCR(BaseModel):
     file_name: str
     topics: list[str]
     languages: str
     ocr_contents: dict
 
-def structured_ocr(URL: str) -> StructuredOCR:
+def _is_cacheable(result) -> bool:
+    # ocr_docu reports failures as an "Error: ..." string; never cache those
+    return isinstance(result, dict)
+
+
+def structured_ocr(URL: str, TYPE: str = "IMAGE") -> dict:
+    """
+    Structured OCR of an image or PDF URL, served from the result cache when
+    the same content was processed before with the same models. Identical
+    requests that arrive while one is in flight share its result.
     """
-    Process an image using OCR and extract structured data.
+    params = {"type": TYPE, "ocr_model": OCR_MODEL, "parse_model": STRUCTURED_MODEL}
+    return single_flight.do("structured_ocr", make_key(URL, params), lambda: cached_call(
+        "structured_ocr",
+        URL,
+        params,
+        lambda: _structured_ocr(URL, TYPE),
+        should_cache=_is_cacheable,
+    ))
+
+
+def _parse_page(markdown: str, image_url: str = None) -> StructuredOCR:
+    """
+    Parse the OCR markdown of one image or page into a StructuredOCR.
 
     Args:
-        image_path: Path to the image file to process
+        markdown: OCR markdown of the image or page
+        image_url: Image to send alongside the markdown; PDF pages are parsed from text only
 
     Returns:
         StructuredOCR object containing the extracted data
-
-    Raises:
-        AssertionError: If the image file does not exist
     """
-
-    # Process the image using OCR
-    image_response = client.ocr.process(
-        document=ImageURLChunk(image_url=URL),
-        model="mistral-ocr-latest"
-    )
-    image_ocr_markdown = image_response.pages[0].markdown
-
-    # Parse the OCR result into a structured JSON response
-    chat_response = client.chat.parse(
-        model="pixtral-12b-latest",
+    source = "image" if image_url else "page"
+    content = [ImageURLChunk(image_url=image_url)] if image_url else []
+    content.append(TextChunk(text=(
+        f"This is the {source}'s OCR in markdown:\n{markdown}\n.\n"
+        "Convert this into a structured JSON response "
+        "with the OCR contents in a sensible dictionnary."
+        )
+    ))
+    chat_response = scheduler.call("mistral", STRUCTURED_MODEL, lambda: get_client().chat.parse(
+        model=STRUCTURED_MODEL,
         messages=[
             {
                 "role": "user",
-                "content": [
-                    ImageURLChunk(image_url=URL),
-                    TextChunk(text=(
-                        f"This is the image's OCR in markdown:\n{image_ocr_markdown}\n.\n"
-                        "Convert this into a structured JSON response "
-                        "with the OCR contents in a sensible dictionnary."
-                        )
-                    )
-                ]
+                "content": content
             }
         ],
         response_format=StructuredOCR,
         temperature=0
+    ), priority="StructuredOCRTask", tokens=estimate_tokens(markdown, completion=1024))
+    return chat_response.choices[0].message.parsed
+
+
+def merge_structured_pages(URL: str, pages: list) -> StructuredOCR:
+    """
+    Merge per-page StructuredOCR results into one document-level result.
+
+    Topics and languages are de-duplicated in page order; each page's
+    contents are kept under ocr_contents["pages"] as
+    {"page": page number, "contents": that page's ocr_contents}.
+    """
+    topics, languages = [], []
+    for page in pages:
+        for topic in page.topics:
+            if topic not in topics:
+                topics.append(topic)
+        for language in page.languages.split(","):
+            language = language.strip()
+            if language and language not in languages:
+                languages.append(language)
+    return StructuredOCR(
+        file_name=Path(URL.split("?", 1)[0]).name or URL,
+        topics=topics,
+        languages=", ".join(languages),
+        ocr_contents={"pages": [
+            # Nested, so a "page" key the model put in the contents can't
+            # overwrite the page number
+            {"page": index + 1, "contents": page.ocr_contents} for index, page in enumerate(pages)
+        ]},
     )
-    res = chat_response.choices[0].message.parsed
 
-    result =  res.model_dump_json(indent=4)
-    return result
-def ocr_docu(URL, TYPE):
-    print(f'OCR Worker called with URL: {URL} and TYPE: {TYPE}')
+
+def _structured_ocr(URL: str, TYPE: str = "IMAGE") -> dict:
+    """
+    Process an image or PDF using OCR and extract structured data.
+
+    PDFs are OCR'd once as a whole document; each page is then parsed with
+    its own chat.parse call, STRUCTURED_OCR_PAGE_WORKERS at a time, and the
+    page results are merged.
+
+    Args:
+        URL: URL of the image or PDF to process
+        TYPE: 'IMAGE' or 'PDF'
+
+    Returns:
+        The StructuredOCR fields as a dict
+    """
+    if TYPE == 'PDF':
+        pdf_response = scheduler.call("mistral", OCR_MODEL, lambda: get_client().ocr.process(
+            document=DocumentURLChunk(document_url=URL),
+            model=OCR_MODEL
+        ), priority="StructuredOCRTask")
+
+        # The OCR call returns every page at once; the per-page parses then
+        # run in parallel, so the slowest page rather than the sum of pages
+        # sets the parse latency
+        with ThreadPoolExecutor(max_workers=STRUCTURED_OCR_PAGE_WORKERS) as pool:
+            futures = [pool.submit(_parse_page, page.markdown) for page in pdf_response.pages]
+            pages = [future.result() for future in futures]
+        res = merge_structured_pages(URL, pages)
+    else:
+        # Process the image using OCR
+        image_response = scheduler.call("mistral", OCR_MODEL, lambda: get_client().ocr.process(
+            document=ImageURLChunk(image_url=URL),
+            model=OCR_MODEL
+        ), priority="StructuredOCRTask")
+        res = _parse_page(image_response.pages[0].markdown, image_url=URL)
+
+    return res.model_dump()
+def ocr_docu(URL, TYPE, OUTPUT=None):
+    """
+    OCR a PDF or image URL, served from the result cache when the same
+    content was processed before. Identical requests that arrive while one
+    is in flight share its result.
+
+    OUTPUT (default OCR_OUTPUT_MODE) selects the result shape: "inline" is
+    {"markdown": combined markdown with base64 images}; "blobs" is the
+    blob-store references from externalize_ocr_output.
+    """
+    log.debug("OCR %s (%s)", URL, TYPE)
+    OUTPUT = OUTPUT or OCR_OUTPUT_MODE
+    params = {"type": TYPE, "model": OCR_MODEL, "include_image_base64": True, "output": OUTPUT}
+    return single_flight.do("ocr", make_key(URL, params), lambda: cached_call(
+        "ocr",
+        URL,
+        params,
+        lambda: _ocr_docu(URL, TYPE, OUTPUT),
+        should_cache=_is_cacheable,
+    ))
+
+
+def _ocr_output(ocr_response: OCRResponse, OUTPUT: str) -> dict:
+    if OUTPUT == "blobs":
+        result = externalize_ocr_output(ocr_response)
+        log.info("OCR output stored", extra={"fields": {
+            "pages": result['pages'], "images": len(result['images']),
+            "markdown_bytes": result['markdown_ref']['bytes']}})
+        return result
+    # Get combined markdown directly from the OCRResponse object
+    combined_markdown = get_combined_markdown(ocr_response)
+    log.debug("markdown: %s", tasklog.preview(combined_markdown))
+    return {"markdown": combined_markdown}
+
+
+def _ocr_docu(URL, TYPE, OUTPUT="inline"):
     try:
         if TYPE == 'PDF':
-            pdf_response = client.ocr.process(
+            pdf_response = scheduler.call("mistral", OCR_MODEL, lambda: get_client().ocr.process(
                 document=DocumentURLChunk(document_url=URL),
-                model="mistral-ocr-latest",
+                model=OCR_MODEL,
                 include_image_base64=True
-            )
-
-            # Get combined markdown directly from the OCRResponse object
-            combined_markdown = get_combined_markdown(pdf_response)
-            print(combined_markdown)
-            return json.dumps({"markdown": combined_markdown}, indent=4)
+            ), priority="OCRTask")
+            return _ocr_output(pdf_response, OUTPUT)
 
         if TYPE == 'IMAGE':
             # Here's the fix: use image_url instead of document_url
-            image_response = client.ocr.process(
+            image_response = scheduler.call("mistral", OCR_MODEL, lambda: get_client().ocr.process(
                 document=ImageURLChunk(image_url=URL),  # Changed from document_url to image_url
-                model="mistral-ocr-latest",
+                model=OCR_MODEL,
                 include_image_base64=True
-            )
-
-            # Get combined markdown directly from the OCRResponse object
-            combined_markdown = get_combined_markdown(image_response)
-            print(combined_markdown)
-            return json.dumps({"markdown": combined_markdown}, indent=4)
+            ), priority="OCRTask")
+            return _ocr_output(image_response, OUTPUT)
 
+        log.warning("Unsupported OCR TYPE %r for %s", TYPE, URL)
+        return f"Error: Unsupported TYPE '{TYPE}', expected 'PDF' or 'IMAGE'"
     except Exception as e:
-        print(f"Error in OCR processing: {e}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("OCR processing failed for %s", URL)
         return f"Error: {str(e)}"
 
 if __name__ == "__main__":
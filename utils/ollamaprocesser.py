@@ -1,14 +1,170 @@
-from ollama import Client
-client = Client(
-  host='http://localhost:11434',
-  headers={'x-some-header': 'some-value'}
-)
-
-def ollamaParserClient(text, template , model='iodose/nuextract-v1.5'):
-    response = client.chat(model=model, messages=[
-        {
-            'role': 'user',
-            'content': f'{template}\n\n{text}',
-        },
-    ])
-    return response['message']['content']
\ No newline at end of file
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.singleflight import make_key, single_flight
+
+OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL', 'iodose/nuextract-v1.5')
+# Requests sent to the Ollama server at once from this process. Match it
+# to the server's OLLAMA_NUM_PARALLEL; more only queue on the server.
+OLLAMA_PARALLEL = int(os.environ.get('OLLAMA_PARALLEL', '4'))
+# How long the server keeps the model loaded after the last request
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+# Stop a generation that runs past this many characters without closing its JSON
+OLLAMA_MAX_OUTPUT_CHARS = int(os.environ.get('OLLAMA_MAX_OUTPUT_CHARS', '200000'))
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(OLLAMA_PARALLEL)
+
+
+def _new_client(**kwargs):
+    from ollama import Client
+    return Client(
+      host=os.environ.get('OLLAMA_HOST', 'http://localhost:11434'),
+      headers={'x-some-header': 'some-value'},
+      **kwargs,
+    )
+
+
+def get_client():
+    """
+    Create the Ollama client on first use instead of at import time. A
+    forked child (e.g. after run.py warmed the model up) gets its own, so
+    pooled connections are never shared between processes.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            import httpx
+            # One client for the process; its connection pool is sized to
+            # the number of requests that can be in flight
+            _client = _new_client(
+              limits=httpx.Limits(max_connections=OLLAMA_PARALLEL, max_keepalive_connections=OLLAMA_PARALLEL),
+            )
+            _client_pid = os.getpid()
+    return _client
+
+
+class JSONStreamScanner:
+    """
+    Follows a JSON document as it streams in, without parsing it.
+
+    feed() raises ValueError as soon as the output can't be JSON (the
+    first non-blank character is not { or [, or a bracket is closed that
+    was never opened) and returns True once the top-level value is closed,
+    so the caller can stop reading instead of waiting for the model to
+    finish whatever it generates after the JSON.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk):
+        for char in chunk:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif not self.started:
+                if char.isspace():
+                    continue
+                if char not in '{[':
+                    raise ValueError(f"model output is not JSON (starts with {char!r})")
+                self.started = True
+                self.depth = 1
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+def _messages(text, template):
+    # One user turn with the template first, the format NuExtract was trained
+    # on. Every request with the same template shares that token prefix, which
+    # the server can keep in its KV cache; only the text after it changes.
+    return [
+        {'role': 'user', 'content': f'{template}\n\n{text}'},
+    ]
+
+
+def warm_up(model=OLLAMA_MODEL, template=None, timeout=None):
+    """
+    Load `model` on the server and keep it resident for OLLAMA_KEEP_ALIVE.
+    With a template, also run one short request so its prefix is cached.
+    With a timeout, the requests go through a one-off client that gives up
+    after `timeout` seconds.
+    """
+    client = get_client() if timeout is None else _new_client(timeout=timeout)
+    client.generate(model=model, prompt='', keep_alive=OLLAMA_KEEP_ALIVE)
+    if template is not None:
+        client.chat(model=model, messages=_messages('', template), keep_alive=OLLAMA_KEEP_ALIVE,
+                    options={'num_predict': 1})
+
+
+def ollamaParserClient(text, template , model=OLLAMA_MODEL):
+    """Extract `template` fields from `text`; returns the model's JSON reply as a string."""
+    # Identical extraction requests in flight at the same time share one call
+    return single_flight.do('ollama_parse', make_key(text, template, model),
+                            lambda: _ollama_parse(text, template, model))
+
+
+def _ollama_parse(text, template, model):
+    scanner = JSONStreamScanner()
+    parts = []
+    size = 0
+    with _slots:
+        stream = get_client().chat(model=model, messages=_messages(text, template), stream=True,
+                                   keep_alive=OLLAMA_KEEP_ALIVE)
+        try:
+            for chunk in stream:
+                content = chunk['message']['content']
+                parts.append(content)
+                size += len(content)
+                if scanner.feed(content):
+                    break
+                if size > OLLAMA_MAX_OUTPUT_CHARS:
+                    raise ValueError(f"model output exceeded {OLLAMA_MAX_OUTPUT_CHARS} characters")
+        finally:
+            # Closing the stream early drops the connection, which stops
+            # the generation on the server
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+    return ''.join(parts)
+
+
+def extract_json(text, template, model=OLLAMA_MODEL):
+    """Extract `template` fields from `text` and return them parsed."""
+    reply = ollamaParserClient(text, template, model)
+    # Drop anything the model wrote after the JSON value
+    value, _ = json.JSONDecoder().raw_decode(reply.strip())
+    return value
+
+
+def extract_json_many(texts, template, model=OLLAMA_MODEL):
+    """
+    Run extract_json on every text against the same template, up to
+    OLLAMA_PARALLEL at a time. A text that fails gets {"error": ...} in
+    its place instead of failing the others.
+    """
+    def one(text):
+        try:
+            return extract_json(text, template, model)
+        except Exception as e:
+            return {'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(OLLAMA_PARALLEL, len(texts)))) as pool:
+        return list(pool.map(one, texts))
@@ -1,63 +1,319 @@
-from typing import Dict, List, Union
-from gliner import GLiNER
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+from utils.batching import MicroBatcher
+from utils.metrics import metrics
+from utils.pii_rules import STRUCTURED_LABELS, coverage, detect_structured, merge_entities
+from utils.registry import registry
+from utils.startup import concurrent_tasks
+
+PII_MODEL = os.environ.get("PII_MODEL", "urchade/gliner_multi_pii-v1")
+
+
+def _load_gliner():
+    # Imported here so the windowing and rule helpers work without gliner
+    from gliner import GLiNER
+    return GLiNER.from_pretrained(PII_MODEL)
+
+
+registry.register("pii", _load_gliner)
+
+
+def preload_models():
+    """Registry models to load before the workers fork."""
+    return ["pii"]
+
+DEFAULT_LABELS = [
+    "person", "organization", "address", "email", "phone number", 
+    "social security number", "credit card number", "passport number", 
+    "driver license", "bank account number", "date of birth", 
+    "medical record number", "insurance policy number", "property registration number",
+    "employee ID number", "tax ID number", "full address", "personally identifiable information"
+]
+
+# Micro-batching of concurrent piiTask calls (see extract_pii_batched).
+# Waiting for company only pays off when this process runs several piiTask
+# calls at once (CONCURRENT_TASKS); otherwise there is a single caller and
+# the wait is added to every task, so it defaults to 0.
+PII_BATCH_SIZE = int(os.environ.get("PII_BATCH_SIZE", "8"))
+PII_BATCH_WAIT_MS = float(os.environ.get(
+    "PII_BATCH_WAIT_MS", "10" if concurrent_tasks().get("piiTask", 1) > 1 else "0"))
+
+# Long-document mode: texts longer than PII_WINDOW_CHARS are split into
+# overlapping sentence-aligned windows (see split_windows)
+PII_WINDOW_CHARS = int(os.environ.get("PII_WINDOW_CHARS", "1200"))
+PII_WINDOW_OVERLAP_CHARS = int(os.environ.get("PII_WINDOW_OVERLAP_CHARS", "200"))
+PII_WINDOW_BATCH = int(os.environ.get("PII_WINDOW_BATCH", "16"))
+PII_WINDOW_WORKERS = int(os.environ.get("PII_WINDOW_WORKERS", "1"))
+
+# Rule/checksum fast path for structured identifiers: "auto", "cascade" or "off"
+PII_RULES_POLICY = os.environ.get("PII_RULES_POLICY", "auto")
+PII_RULES_SHORT_TEXT = int(os.environ.get("PII_RULES_SHORT_TEXT", "200"))
+PII_RULES_MIN_COVERAGE = float(os.environ.get("PII_RULES_MIN_COVERAGE", "0.9"))
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]*(?:[.!?]+[\"')\]]*\s*|\n+|$)")
+
+
+def _parse_labels(labels: str = None) -> List[str]:
+    # Default PII labels if none provided
+    if labels is None:
+        return list(DEFAULT_LABELS)
+    return [label.strip() for label in labels.split(",")]
+
+
+def _format_results(text: str, entities: List[Dict]) -> Dict[str, Union[str, List[Dict]]]:
+    return {
+        "text": text,
+        "entities": [
+            {
+                "entity": entity["label"],
+                "word": entity["text"],
+                "start": entity["start"],
+                "end": entity["end"],
+                "score": entity.get("score", 0),
+            }
+            for entity in entities
+        ],
+    }
+
+
+def split_windows(
+    text: str,
+    window_chars: int = None,
+    overlap_chars: int = None,
+) -> List[Tuple[int, str]]:
+    """
+    Split text into overlapping windows that break on sentence boundaries.
+
+    Args:
+        text (str): The text to split
+        window_chars (int): Maximum characters per window
+        overlap_chars (int): Characters of context repeated at the start of the next window
+
+    Returns:
+        List of (offset, window_text) tuples, where offset is the window's
+        position in the original text
+    """
+    window_chars = window_chars or PII_WINDOW_CHARS
+    overlap_chars = min(overlap_chars if overlap_chars is not None else PII_WINDOW_OVERLAP_CHARS,
+                        window_chars // 2)
+    if len(text) <= window_chars:
+        return [(0, text)]
+
+    # Sentence spans; anything longer than a window is cut on whitespace
+    spans: List[Tuple[int, int]] = []
+    for match in _SENTENCE_RE.finditer(text):
+        start, end = match.span()
+        while end - start > window_chars:
+            cut = text.rfind(" ", start + 1, start + window_chars)
+            cut = cut if cut > start else start + window_chars
+            spans.append((start, cut))
+            start = cut
+        if end > start:
+            spans.append((start, end))
+
+    windows: List[Tuple[int, str]] = []
+    i = 0
+    while i < len(spans):
+        win_start = spans[i][0]
+        j = i
+        while j + 1 < len(spans) and spans[j + 1][1] - win_start <= window_chars:
+            j += 1
+        win_end = spans[j][1]
+        windows.append((win_start, text[win_start:win_end]))
+        if j + 1 >= len(spans):
+            break
+        # Step back over trailing sentences so the next window starts with
+        # up to overlap_chars of context, but always make progress.
+        k = j + 1
+        while k - 1 > i and win_end - spans[k - 1][0] <= overlap_chars:
+            k -= 1
+        i = k
+    return windows
+
+
+def _dedupe_entities(entities: List[Dict]) -> List[Dict]:
+    # Entities found twice in the overlap of two windows collapse into one.
+    # For overlapping spans with the same label the longer span wins (the
+    # shorter one was usually cut off at a window edge), then the higher score.
+    ordered = sorted(entities, key=lambda e: (e["start"] - e["end"], -e.get("score", 0)))
+    kept: List[Dict] = []
+    for entity in ordered:
+        if any(
+            other["label"] == entity["label"]
+            and entity["start"] < other["end"] and other["start"] < entity["end"]
+            for other in kept
+        ):
+            continue
+        kept.append(entity)
+    return sorted(kept, key=lambda e: (e["start"], e["end"]))
+
+
+def _predict_windows(
+    texts: List[str],
+    labels: List[str],
+    threshold: float,
+    nested_ner: bool,
+) -> List[List[Dict]]:
+    # Loaded once per process and kept resident by the registry
+    model = registry.get("pii")
+    # Runs on the batcher thread, so the task is named explicitly
+    with metrics.phase("model_inference", "piiTask"):
+        if len(texts) == 1:
+            return [model.predict_entities(texts[0], labels, flat_ner=not nested_ner, threshold=threshold)]
+        # One forward pass over the whole batch instead of one per text
+        return model.batch_predict_entities(texts, labels, flat_ner=not nested_ner, threshold=threshold)
+
+
+def _predict_model(
+    texts: List[str],
+    labels: List[str],
+    threshold: float,
+    nested_ner: bool,
+) -> List[List[Dict]]:
+    # Long texts are split into overlapping windows so nothing past the
+    # model's context gets truncated. All windows of all texts are run as
+    # batches of PII_WINDOW_BATCH, optionally across PII_WINDOW_WORKERS threads.
+    windows: List[Tuple[int, int, str]] = []
+    for index, text in enumerate(texts):
+        for offset, window in split_windows(text):
+            windows.append((index, offset, window))
+
+    chunks = [windows[i:i + PII_WINDOW_BATCH] for i in range(0, len(windows), PII_WINDOW_BATCH)]
+
+    def run(chunk):
+        return _predict_windows([w for _, _, w in chunk], labels, threshold, nested_ner)
+
+    if PII_WINDOW_WORKERS > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=PII_WINDOW_WORKERS) as pool:
+            chunk_results = list(pool.map(run, chunks))
+    else:
+        chunk_results = [run(chunk) for chunk in chunks]
+
+    per_text: List[List[Dict]] = [[] for _ in texts]
+    split = [False] * len(texts)
+    for chunk, results in zip(chunks, chunk_results):
+        for (index, offset, _), entities in zip(chunk, results):
+            if offset or len(texts[index]) > PII_WINDOW_CHARS:
+                split[index] = True
+            for entity in entities:
+                start, end = entity["start"] + offset, entity["end"] + offset
+                per_text[index].append(dict(entity, start=start, end=end, text=texts[index][start:end]))
+    return [_dedupe_entities(entities) if was_split else entities
+            for entities, was_split in zip(per_text, split)]
+
+
+def _predict_batch(
+    texts: List[str],
+    labels: List[str],
+    threshold: float,
+    nested_ner: bool,
+    rules: str = None,
+) -> List[List[Dict]]:
+    # Rule-based fast path in front of GLiNER. With rules="auto" the model is
+    # skipped when every requested label is one the rules handle, or when a
+    # short text is already covered by rule matches; "cascade" always runs
+    # both and "off" only runs the model.
+    rules = rules or PII_RULES_POLICY
+    if rules == "off":
+        return _predict_model(texts, labels, threshold, nested_ner)
+
+    requested = set(labels)
+    rule_entities = [
+        [entity for entity in detect_structured(text, requested) if entity["score"] >= threshold]
+        for text in texts
+    ]
+    if rules == "auto" and requested <= STRUCTURED_LABELS:
+        return rule_entities
+
+    need_model = []
+    for index, text in enumerate(texts):
+        if (
+            rules == "auto"
+            and rule_entities[index]
+            and len(text) <= PII_RULES_SHORT_TEXT
+            and coverage(text, rule_entities[index]) >= PII_RULES_MIN_COVERAGE
+        ):
+            continue
+        need_model.append(index)
+
+    results = list(rule_entities)
+    if need_model:
+        model_entities = _predict_model([texts[i] for i in need_model], labels, threshold, nested_ner)
+        for index, entities in zip(need_model, model_entities):
+            results[index] = merge_entities(rule_entities[index], entities)
+    return results
+
 
 def extract_pii(
     text: str, 
     labels: str = None, 
     threshold: float = 0.5, 
-    nested_ner: bool = False
+    nested_ner: bool = False,
+    rules: str = None
 ) -> Dict[str, Union[str, List[Dict]]]:
     """
     Extract personally identifiable information (PII) from text using GLiNER model.
+
+    Texts longer than PII_WINDOW_CHARS are processed as overlapping windows
+    and the entity offsets are mapped back onto the original text.
     
     Args:
         text (str): The text to analyze for PII
         labels (str): Comma-separated list of labels to look for (if None, uses default labels)
         threshold (float): Confidence threshold for entity detection (0.0 to 1.0)
         nested_ner (bool): Whether to allow nested entity recognition
+        rules (str): Rule fast-path policy, "auto", "cascade" or "off" (default PII_RULES_POLICY)
     
     Returns:
         Dict containing the original text and a list of detected entities
     """
-    # Initialize model if not already done
-    model = GLiNER.from_pretrained("urchade/gliner_multi_pii-v1")
-    
-    # Default PII labels if none provided
-    if labels is None:
-        labels = [
-            "person", "organization", "address", "email", "phone number", 
-            "social security number", "credit card number", "passport number", 
-            "driver license", "bank account number", "date of birth", 
-            "medical record number", "insurance policy number", "property registration number",
-            "employee ID number", "tax ID number", "full address", "personally identifiable information"
-        ]
-    else:
-        labels = [label.strip() for label in labels.split(",")]
-    
-    # Extract entities
-    entities = model.predict_entities(
-        text, 
-        labels, 
-        flat_ner=not nested_ner, 
-        threshold=threshold
-    )
-    
-    # Format results
-    results = {
-        "text": text,
-        "entities": [
-            {
-                "entity": entity["label"],
-                "word": entity["text"],
-                "start": entity["start"],
-                "end": entity["end"],
-                "score": entity.get("score", 0),
-            }
-            for entity in entities
-        ],
-    }
-    
-    return results
+    entities = _predict_batch([text], _parse_labels(labels), threshold, nested_ner, rules)[0]
+    return _format_results(text, entities)
+
+
+def extract_pii_batch(
+    texts: List[str],
+    labels: str = None,
+    threshold: float = 0.5,
+    nested_ner: bool = False,
+    rules: str = None
+) -> List[Dict[str, Union[str, List[Dict]]]]:
+    """
+    Extract PII from several texts with a single batched GLiNER call.
+
+    Returns one result per input text, in the same order and shape as extract_pii.
+    """
+    if not texts:
+        return []
+    batch_entities = _predict_batch(list(texts), _parse_labels(labels), threshold, nested_ner, rules)
+    return [_format_results(text, entities) for text, entities in zip(texts, batch_entities)]
+
+
+def _run_pii_batch(key, texts: List[str]) -> List[Dict[str, Union[str, List[Dict]]]]:
+    labels, threshold, nested_ner, rules = key
+    return extract_pii_batch(texts, labels=labels, threshold=threshold, nested_ner=nested_ner, rules=rules)
+
+
+_pii_batcher = MicroBatcher(_run_pii_batch, max_batch_size=PII_BATCH_SIZE, max_wait_ms=PII_BATCH_WAIT_MS)
+
+
+def extract_pii_batched(
+    text: str,
+    labels: str = None,
+    threshold: float = 0.5,
+    nested_ner: bool = False,
+    rules: str = None
+) -> Dict[str, Union[str, List[Dict]]]:
+    """
+    Same as extract_pii, but coalesced with other concurrent callers.
+
+    Texts submitted from different threads within PII_BATCH_WAIT_MS of each
+    other (up to PII_BATCH_SIZE of them) are run through GLiNER together.
+    Only calls with the same labels, threshold, nested_ner and rules share a batch.
+    """
+    return _pii_batcher.submit(text, key=(labels, threshold, nested_ner, rules))
 
 
 # Example usage
@@ -0,0 +1,164 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# Labels from the default extract_pii label list that the rules below can
+# detect on their own. Keys must match the GLiNER label names exactly.
+STRUCTURED_LABELS = frozenset([
+    "email",
+    "phone number",
+    "credit card number",
+    "social security number",
+    "passport number",
+    "bank account number",
+])
+
+_EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+_CARD_RE = re.compile(r"\b\d(?:[ -]?\d){12,18}\b")
+_SSN_RE = re.compile(r"\b(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b")
+_IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b")
+_PASSPORT_RE = re.compile(r"\b[A-Z]{1,2}\d{6,8}\b")
+_PHONE_RE = re.compile(
+    r"(?<![\w+-])(?:\+\d{1,3}[ .-]?)?(?:\(\d{2,4}\)[ .-]?)?\d{2,4}(?:[ .-]?\d{2,4}){1,4}(?!\w)"
+)
+# Dates have the same shape as a short grouped number
+_DATE_RE = re.compile(r"\d{4}[./-]\d{1,2}[./-]\d{1,2}|\d{1,2}[./-]\d{1,2}[./-]\d{4}")
+_PHONE_GROUP_SEP_RE = re.compile(r"[ .-]")
+
+# Rules precise enough (checksummed, or unambiguous like an email address)
+# to override an overlapping model entity. For the others the model wins.
+AUTHORITATIVE_LABELS = frozenset([
+    "email",
+    "credit card number",
+    "bank account number",
+])
+
+
+def luhn_valid(number: str) -> bool:
+    """Check a card number (digits only) against the Luhn checksum."""
+    total = 0
+    for i, ch in enumerate(reversed(number)):
+        digit = ord(ch) - 48
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def iban_valid(iban: str) -> bool:
+    """Check an IBAN (no spaces) against its ISO 7064 mod-97 checksum."""
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    digits = "".join(str(int(ch, 36)) for ch in rearranged)
+    return int(digits) % 97 == 1
+
+
+def _digits(value: str) -> str:
+    return "".join(ch for ch in value if ch.isdigit())
+
+
+def _card(match: "re.Match") -> Optional[float]:
+    digits = _digits(match.group())
+    return 1.0 if 13 <= len(digits) <= 19 and luhn_valid(digits) else None
+
+
+def _iban(match: "re.Match") -> Optional[float]:
+    return 1.0 if iban_valid(match.group().replace(" ", "")) else None
+
+
+def _phone(match: "re.Match") -> Optional[float]:
+    value = match.group()
+    if not 7 <= len(_digits(value)) <= 15 or _DATE_RE.fullmatch(value):
+        return None
+    if value[0] in "+(":
+        return 0.85
+    # Without a country code or area code in brackets, only accept phone-style
+    # grouping (e.g. 555-123-4567, 020 7946 0958); a bare or two-part digit
+    # run is more likely an ID or reference number
+    groups = _PHONE_GROUP_SEP_RE.split(value)
+    if len(groups) >= 3 and all(2 <= len(group) <= 4 for group in groups) and len(groups[-1]) >= 3:
+        return 0.85
+    return None
+
+
+# Checked in this order; a later rule never claims characters an earlier
+# one already matched, so e.g. a Luhn-valid card is not also a phone number.
+_RULES: List[Tuple[str, "re.Pattern", object]] = [
+    ("email", _EMAIL_RE, 0.95),
+    ("credit card number", _CARD_RE, _card),
+    ("bank account number", _IBAN_RE, _iban),
+    ("social security number", _SSN_RE, 0.95),
+    ("passport number", _PASSPORT_RE, 0.85),
+    ("phone number", _PHONE_RE, _phone),
+]
+
+
+def detect_structured(text: str, labels: Optional[Set[str]] = None) -> List[Dict]:
+    """
+    Detect structured identifiers with compiled regexes and checksums.
+
+    Args:
+        text (str): The text to scan
+        labels (set): Only look for these labels (None means all STRUCTURED_LABELS)
+
+    Returns:
+        List of entities in GLiNER's format ({"label", "text", "start", "end", "score"}),
+        sorted by position
+    """
+    entities: List[Dict] = []
+    taken: List[Tuple[int, int]] = []
+    for label, pattern, check in _RULES:
+        if labels is not None and label not in labels:
+            continue
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if any(start < t_end and t_start < end for t_start, t_end in taken):
+                continue
+            score = check(match) if callable(check) else check
+            if score is None:
+                continue
+            taken.append((start, end))
+            entities.append({
+                "label": label,
+                "text": match.group(),
+                "start": start,
+                "end": end,
+                "score": score,
+            })
+    return sorted(entities, key=lambda e: e["start"])
+
+
+def coverage(text: str, entities: List[Dict]) -> float:
+    """Fraction of the text's alphanumeric characters that fall inside an entity."""
+    covered = [False] * len(text)
+    for entity in entities:
+        for i in range(entity["start"], entity["end"]):
+            covered[i] = True
+    total = hits = 0
+    for ch, inside in zip(text, covered):
+        if ch.isalnum():
+            total += 1
+            hits += inside
+    return hits / total if total else 1.0
+
+
+def _overlaps(entity: Dict, others: List[Dict]) -> bool:
+    return any(entity["start"] < other["end"] and other["start"] < entity["end"] for other in others)
+
+
+def merge_entities(rule_entities: List[Dict], model_entities: List[Dict]) -> List[Dict]:
+    """
+    Merge rule and model entities. Where spans overlap, a rule entity with a
+    label in AUTHORITATIVE_LABELS wins, since it was matched exactly and
+    checksummed where applicable; otherwise the model entity wins (a
+    heuristic phone match inside a date of birth, say).
+    """
+    authoritative = [e for e in rule_entities if e["label"] in AUTHORITATIVE_LABELS]
+    merged = authoritative + [
+        e for e in rule_entities
+        if e["label"] not in AUTHORITATIVE_LABELS and not _overlaps(e, model_entities)
+    ]
+    merged.extend(e for e in model_entities if not _overlaps(e, authoritative))
+    return sorted(merged, key=lambda e: (e["start"], e["end"]))
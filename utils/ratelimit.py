@@ -0,0 +1,428 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from utils.metrics import metrics
+
+# Requests/min and tokens/min per provider and model; "*" applies to every
+# model of the provider on top of the model's own limits. Override with
+# RATE_LIMITS_JSON using the same shape.
+DEFAULT_RATE_LIMITS = {
+    "groq": {
+        "*": {"rpm": 0, "tpm": 0},
+        "llama3-70b-8192": {"rpm": 30, "tpm": 6000},
+        "whisper-large-v3-turbo": {"rpm": 20, "tpm": 0},
+    },
+    "mistral": {
+        "*": {"rpm": 60, "tpm": 0},
+    },
+}
+
+# Lower number = served first when calls are queued for the same provider
+TASK_PRIORITIES = {
+    "queryTask": 0,
+    "StructuredOCRTask": 1,
+    "OCRTask": 2,
+    "transcribeTask": 3,
+}
+
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get("RATE_LIMIT_MAX_RETRIES", "6"))
+RATE_LIMIT_INITIAL_CONCURRENCY = float(os.environ.get("RATE_LIMIT_INITIAL_CONCURRENCY", "4"))
+RATE_LIMIT_MAX_CONCURRENCY = float(os.environ.get("RATE_LIMIT_MAX_CONCURRENCY", "64"))
+# Calls slower than this count as a congestion signal for AIMD
+RATE_LIMIT_LATENCY_TARGET_S = float(os.environ.get("RATE_LIMIT_LATENCY_TARGET_S", "30"))
+# SQLite file holding the token buckets and Retry-After hold-offs, shared by
+# every process that points at it (run.py sets one per run). Empty keeps
+# them in this process only.
+RATE_LIMIT_STATE_PATH = os.environ.get("RATE_LIMIT_STATE_PATH", "")
+
+
+class RateLimitedError(Exception):
+    """Raised when a call is still rate limited after RATE_LIMIT_MAX_RETRIES attempts."""
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class LocalRateLimitState:
+    """Token bucket levels and provider hold-offs kept in this process."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._holds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        """Take `amount` tokens if available; otherwise return the seconds until they will be."""
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, rate, capacity)
+            if tokens >= amount:
+                self._buckets[key] = (tokens - amount, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (amount - tokens) / rate
+
+    def drain(self, key: str, rate: float, seconds: float) -> None:
+        with self._lock:
+            self._buckets[key] = (-seconds * rate, time.time())
+
+    def hold(self, provider: str, until: float) -> None:
+        with self._lock:
+            self._holds[provider] = max(until, self._holds.get(provider, 0.0))
+
+    def held_until(self, provider: str) -> float:
+        with self._lock:
+            return self._holds.get(provider, 0.0)
+
+
+class SharedRateLimitState(LocalRateLimitState):
+    """
+    Token bucket levels and provider hold-offs in a SQLite file, so every
+    worker process of a run draws from the same per-minute quota.
+
+    Args:
+        path (str): Path of the SQLite database file
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not
+        # cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS holds (provider TEXT PRIMARY KEY, until REAL)")
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key: str, rate: float, capacity: float, amount: float) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(*(row or (capacity, now)), now, rate, capacity)
+            wait = 0.0
+            if tokens >= amount:
+                tokens -= amount
+            else:
+                wait = (amount - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return wait
+
+    def drain(self, key: str, rate: float, seconds: float) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+            (key, -seconds * rate, time.time()),
+        )
+
+    def hold(self, provider: str, until: float) -> None:
+        self._connect().execute(
+            "INSERT INTO holds (provider, until) VALUES (?, ?)"
+            " ON CONFLICT (provider) DO UPDATE SET until = MAX(until, excluded.until)",
+            (provider, until),
+        )
+
+    def held_until(self, provider: str) -> float:
+        row = self._connect().execute("SELECT until FROM holds WHERE provider = ?", (provider,)).fetchone()
+        return row[0] if row else 0.0
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+
+    The bucket holds at most one minute's worth, so a burst after an idle
+    period can't exceed the provider's per-minute quota. Its level lives in
+    `state` under `key`, which may be shared with other processes.
+    """
+
+    def __init__(self, per_minute: float, state: Optional[LocalRateLimitState] = None, key: str = ""):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.state = state or LocalRateLimitState()
+        self.key = key
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """Block until `amount` tokens are available, then take them."""
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self.state.take(self.key, self.rate, self.capacity, amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def drain(self, seconds: float) -> None:
+        """Empty the bucket and hold it empty for `seconds` (after a Retry-After)."""
+        if self.rate <= 0:
+            return
+        self.state.drain(self.key, self.rate, seconds)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit that adapts with additive increase / multiplicative decrease.
+
+    Every successful call raises the limit by 1/limit (about +1 per round of
+    calls); a 429 halves it, and a server error, a timeout or a call slower
+    than the latency target cuts it by 10%. Other failures leave it as it
+    is. Waiting callers are admitted in priority order, then FIFO.
+    """
+
+    def __init__(self, initial: float, minimum: float = 1.0, maximum: float = 64.0):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int = 0) -> None:
+        with self._cond:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            while self._waiters[0] != entry or self.in_flight >= int(self.limit):
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self._cond.notify_all()
+
+    def release(self, throttled: bool = False, congested: bool = False,
+                latency: Optional[float] = None) -> None:
+        """Give the slot back; `latency` is only passed for a successful call."""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif congested or (latency is not None and latency > RATE_LIMIT_LATENCY_TARGET_S):
+                self.limit = max(self.minimum, self.limit * 0.9)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+def _responses(error: Exception):
+    # Groq/requests errors carry the HTTP response on `response`, Mistral's
+    # SDKError on `raw_response`
+    return [response for response in (getattr(error, "response", None), getattr(error, "raw_response", None))
+            if response is not None]
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for candidate in [error] + _responses(error):
+        code = getattr(candidate, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    for response in _responses(error):
+        headers = getattr(response, "headers", None) or {}
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _is_congestion(error: Exception) -> bool:
+    # Server errors and timeouts mean the provider is struggling, like a slow call
+    code = _status_code(error)
+    if code is not None and code >= 500:
+        return True
+    return isinstance(error, TimeoutError) or any("Timeout" in cls.__name__ for cls in type(error).__mro__)
+
+
+def estimate_tokens(*texts: str, completion: int = 256) -> int:
+    """Rough token count for a request: ~4 characters per token plus expected completion."""
+    return sum(len(text or "") for text in texts) // 4 + completion
+
+
+class Scheduler:
+    """
+    Scheduler for outbound API calls.
+
+    Each call waits out any Retry-After hold-off on its provider, then goes
+    through the provider's AIMD concurrency limiter (priority ordered), then
+    the provider-wide and per-model request and token buckets. HTTP 429
+    responses are retried after the server's Retry-After (or an exponential
+    backoff with jitter) and shrink the concurrency limit; other errors are
+    raised to the caller unchanged, and server errors and timeouts among
+    them shrink the limit too.
+
+    The token buckets and hold-offs live in `state`. With a
+    SharedRateLimitState every process using the same file shares them, so
+    the configured rpm/tpm limits hold across all the workers of a run. The
+    concurrency limiter and TASK_PRIORITIES only apply within one process.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, Dict[str, float]]],
+                 state: Optional[LocalRateLimitState] = None):
+        self.limits = limits
+        self.state = state or LocalRateLimitState()
+        self._buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        self._limiters: Dict[str, AIMDLimiter] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, provider: str, model: str, kind: str) -> Optional[TokenBucket]:
+        config = self.limits.get(provider, {}).get(model, {})
+        if not config.get(kind):
+            return None
+        key = (provider, model, kind)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(config[kind], self.state, ":".join(key))
+            return self._buckets[key]
+
+    def _limiter(self, provider: str) -> AIMDLimiter:
+        with self._lock:
+            if provider not in self._limiters:
+                self._limiters[provider] = AIMDLimiter(
+                    RATE_LIMIT_INITIAL_CONCURRENCY, maximum=RATE_LIMIT_MAX_CONCURRENCY
+                )
+            return self._limiters[provider]
+
+    def _count(self, provider: str, name: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(provider, {"calls": 0, "throttled": 0, "retries": 0, "errors": 0})
+            counters[name] += 1
+
+    def call(
+        self,
+        provider: str,
+        model: str,
+        fn: Callable[[], Any],
+        priority: Union[int, str] = 0,
+        tokens: int = 0,
+    ) -> Any:
+        """
+        Run fn() under the provider's limits.
+
+        Args:
+            provider (str): Provider name, e.g. "groq" or "mistral"
+            model (str): Model name, for per-model limits
+            fn (callable): The API call
+            priority (int or str): Priority, or a task name from TASK_PRIORITIES
+            tokens (int): Estimated tokens the call consumes, for tokens/min limits
+        """
+        # A task-name priority also labels the call's remote_api time, which
+        # matters for calls made from helper threads
+        task = priority if isinstance(priority, str) else None
+        if isinstance(priority, str):
+            priority = TASK_PRIORITIES.get(priority, len(TASK_PRIORITIES))
+        limiter = self._limiter(provider)
+        scopes = ["*", model]
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            hold = self.state.held_until(provider) - time.time()
+            if hold > 0:
+                time.sleep(hold)
+            limiter.acquire(priority)
+            # Keyword arguments for limiter.release; none if the buckets raise
+            outcome = {}
+            try:
+                for scope in scopes:
+                    for kind, amount in (("rpm", 1), ("tpm", tokens)):
+                        bucket = self._bucket(provider, scope, kind)
+                        if bucket is not None and amount:
+                            bucket.acquire(amount)
+                started = time.monotonic()
+                try:
+                    with metrics.phase("remote_api", task):
+                        result = fn()
+                except Exception as e:
+                    if _status_code(e) != 429:
+                        outcome = {"congested": _is_congestion(e)}
+                        self._count(provider, "errors")
+                        raise
+                    outcome = {"throttled": True}
+                    error = e
+                else:
+                    outcome = {"latency": time.monotonic() - started}
+                    self._count(provider, "calls")
+                    return result
+            finally:
+                limiter.release(**outcome)
+            self._count(provider, "throttled")
+            wait = _retry_after(error)
+            if wait is not None:
+                # The server told us when quota comes back; keep every
+                # caller of this provider from trying before then, with
+                # or without an rpm bucket
+                self.state.hold(provider, time.time() + wait)
+                for scope in scopes:
+                    bucket = self._bucket(provider, scope, "rpm")
+                    if bucket is not None:
+                        bucket.drain(wait)
+            else:
+                wait = min(60.0, 0.5 * (2 ** attempt)) * random.uniform(0.5, 1.5)
+            if attempt == RATE_LIMIT_MAX_RETRIES:
+                raise RateLimitedError(f"{provider}/{model} still rate limited after {attempt + 1} attempts") from error
+            self._count(provider, "retries")
+            time.sleep(wait)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-provider call/throttle/retry/error counters and current concurrency limit."""
+        with self._lock:
+            return {
+                provider: dict(
+                    counters,
+                    concurrency_limit=round(self._limiters[provider].limit, 2),
+                    in_flight=self._limiters[provider].in_flight,
+                )
+                for provider, counters in self._counters.items()
+            }
+
+
+def _load_limits() -> Dict[str, Dict[str, Dict[str, float]]]:
+    limits = json.loads(json.dumps(DEFAULT_RATE_LIMITS))
+    override = os.environ.get("RATE_LIMITS_JSON")
+    if override:
+        for provider, models in json.loads(override).items():
+            limits.setdefault(provider, {}).update(models)
+    return limits
+
+
+scheduler = Scheduler(
+    _load_limits(),
+    SharedRateLimitState(RATE_LIMIT_STATE_PATH) if RATE_LIMIT_STATE_PATH else None,
+)
+
+
+def _collect_scheduler_metrics():
+    for provider, counters in scheduler.stats().items():
+        for name in ("calls", "throttled", "retries", "errors"):
+            yield "counter", f"remote_api_{name}_total", {"provider": provider}, counters[name]
+        yield "gauge", "remote_api_concurrency_limit", {"provider": provider}, counters["concurrency_limit"]
+
+
+metrics.add_collector(_collect_scheduler_metrics)
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from utils.metrics import metrics
+
+
+def _tensors(value: Any) -> Iterator[Any]:
+    # State dict values are tensors, or tuples of them for packed params
+    if hasattr(value, "numel") and hasattr(value, "element_size"):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _tensors(item)
+
+
+def estimate_size(obj: Any) -> int:
+    """
+    Estimate the resident size in bytes of a loaded model object.
+
+    Torch modules are measured from their parameters, buffers and state
+    dict, the last of which holds the packed weights of dynamically
+    quantized layers; tensors that share storage (tied weights) count once.
+    Tuples, lists and dicts (e.g. a tokenizer/model pair) are summed over
+    their members. Anything else counts as 0.
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_size(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(estimate_size(item) for item in obj.values())
+    if hasattr(obj, "parameters") and callable(obj.parameters):
+        tensors = list(obj.parameters())
+        if hasattr(obj, "buffers") and callable(obj.buffers):
+            tensors.extend(obj.buffers())
+        if hasattr(obj, "state_dict") and callable(obj.state_dict):
+            for value in obj.state_dict().values():
+                tensors.extend(_tensors(value))
+        total = 0
+        seen = set()
+        for tensor in tensors:
+            try:
+                storage = tensor.data_ptr()
+            except Exception:
+                storage = id(tensor)
+            if storage and storage in seen:
+                continue
+            seen.add(storage)
+            total += tensor.numel() * tensor.element_size()
+        return total
+    # GLiNER and similar wrappers keep the torch module on `.model`
+    inner = getattr(obj, "model", None)
+    if inner is not None and inner is not obj:
+        return estimate_size(inner)
+    return 0
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of lazily loaded models.
+
+    Each model is registered with a loader callable and loaded on the first
+    `get`. Loaded models stay resident until the registry has to make room
+    under its budget, at which point the least recently used ones are evicted.
+
+    Args:
+        max_models (int): Maximum number of resident models (0 means unlimited)
+        max_bytes (int): Maximum estimated resident bytes (0 means unlimited)
+    """
+
+    def __init__(self, max_models: int = 0, max_bytes: int = 0):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """Register a loader for `name`. Re-registering replaces the loader."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+            self._stats.setdefault(name, {
+                "loaded": False,
+                "loads": 0,
+                "evictions": 0,
+                "hits": 0,
+                "load_seconds": None,
+                "size_bytes": 0,
+            })
+
+    def get(self, name: str) -> Any:
+        """Return the model registered as `name`, loading it if needed."""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                self._stats[name]["hits"] += 1
+                return self._models[name]
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            load_lock = self._load_locks[name]
+
+        # Load outside the registry lock so other models stay available, but
+        # only once per name even when several threads ask at the same time.
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    self._stats[name]["hits"] += 1
+                    return self._models[name]
+                loader = self._loaders[name]
+
+            started = time.perf_counter()
+            model = loader()
+            if os.environ.get("MODEL_MMAP_DIR"):
+                from utils.sharedweights import mmap_weights
+                model = mmap_weights(name, model)
+            elapsed = time.perf_counter() - started
+            size = estimate_size(model)
+
+            with self._lock:
+                self._models[name] = model
+                stats = self._stats[name]
+                stats["loaded"] = True
+                stats["loads"] += 1
+                stats["load_seconds"] = round(elapsed, 3)
+                stats["size_bytes"] = size
+                self._evict(keep=name)
+            metrics.observe("model_load_seconds", elapsed, model=name)
+            print(f"Loaded model '{name}' in {elapsed:.2f}s ({size / 1e6:.1f} MB)")
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    def evict(self, name: str) -> bool:
+        """Drop a resident model. Returns False if it was not loaded."""
+        with self._lock:
+            if name not in self._models:
+                return False
+            del self._models[name]
+            self._stats[name]["loaded"] = False
+            self._stats[name]["evictions"] += 1
+            return True
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._stats[name]["size_bytes"] for name in self._models)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model load time, resident size and hit/eviction counters."""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        # Caller holds self._lock. The model just loaded is never evicted, so
+        # a single model larger than the budget still gets served.
+        while len(self._models) > 1:
+            over_count = self.max_models and len(self._models) > self.max_models
+            over_bytes = self.max_bytes and self.resident_bytes() > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            victim = next(iter(self._models))
+            if victim == keep:
+                self._models.move_to_end(victim)
+                victim = next(iter(self._models))
+            print(f"Evicting model '{victim}' to stay within the registry budget")
+            self.evict(victim)
+
+
+registry = ModelRegistry(
+    max_models=int(os.environ.get("MODEL_REGISTRY_MAX_MODELS", "0")),
+    max_bytes=int(float(os.environ.get("MODEL_REGISTRY_MAX_MB", "0")) * 1024 * 1024),
+)
+
+
+def _collect_registry_metrics():
+    for name, stats in registry.stats().items():
+        yield "counter", "model_registry_hits_total", {"model": name}, stats["hits"]
+        yield "counter", "model_registry_loads_total", {"model": name}, stats["loads"]
+        yield "gauge", "model_resident_bytes", {"model": name}, stats["size_bytes"] if stats["loaded"] else 0
+
+
+metrics.add_collector(_collect_registry_metrics)
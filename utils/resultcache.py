@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from utils import tasklog
+from utils.httpclient import HTTP_TIMEOUT_SECONDS, get_session
+from utils.metrics import metrics
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_PATH = os.environ.get(
+    "RESULT_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "conductor-ml-workers", "results.sqlite"),
+)
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "1024"))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Part of every key; bump it when the shape of cached results changes so
+# entries written by older code are never returned
+RESULT_CACHE_FORMAT = 2
+
+log = tasklog.get_logger("resultcache")
+
+
+class ResultCache:
+    """
+    Persistent key/value cache for task results, stored in SQLite.
+
+    Values are JSON-encoded and zlib-compressed. Entries older than
+    `ttl_seconds` are treated as misses; when the stored size goes over
+    `max_bytes` the least recently read entries are evicted. The total size
+    is kept in a meta row by triggers, so an insert doesn't scan the table.
+    The database is opened in WAL mode, so every worker process on the host
+    can share it.
+
+    Args:
+        path (str): Path of the SQLite database file
+        max_bytes (int): Size cap for the stored (compressed) values
+        ttl_seconds (float): Time to live of an entry (0 means no expiry)
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: float = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not
+        # cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        with self._transaction(conn):
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Seeded from the table once, for databases written before the meta row existed
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value)"
+                " SELECT 'total_size', COALESCE(SUM(size), 0) FROM entries"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_size_insert AFTER INSERT ON entries BEGIN"
+                " UPDATE meta SET value = value + NEW.size WHERE name = 'total_size'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_size_update AFTER UPDATE OF size ON entries BEGIN"
+                " UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'total_size'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_size_delete AFTER DELETE ON entries BEGIN"
+                " UPDATE meta SET value = value - OLD.size WHERE name = 'total_size'; END"
+            )
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl_seconds and row[1] + self.ttl_seconds < now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, values: Dict[str, Any]) -> None:
+        """Store several key/value pairs in one transaction, evicting once at the end."""
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            blob = zlib.compress(json.dumps(value).encode("utf-8"), 1)
+            if self.max_bytes and len(blob) > self.max_bytes:
+                continue
+            rows.append((key, blob, len(blob), now, now))
+        if not rows:
+            return
+        conn = self._connect()
+        with self._transaction(conn):
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete
+            # would not fire the size trigger
+            conn.executemany(
+                "INSERT INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+                " created = excluded.created, accessed = excluded.accessed",
+                rows,
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if not self.max_bytes:
+            return
+        total = conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        size = conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": size,
+            }
+
+
+result_cache = ResultCache(
+    RESULT_CACHE_PATH,
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+)
+
+
+def _collect_cache_metrics():
+    for result, value in (("hit", result_cache.hits), ("miss", result_cache.misses)):
+        yield "counter", "cache_requests_total", {"cache": "result", "result": result}, value
+
+
+metrics.add_collector(_collect_cache_metrics)
+
+
+def url_fingerprint(url: str) -> Optional[str]:
+    """
+    Identify the current content behind `url`.
+
+    Uses the URL plus the ETag or Last-Modified validators from a HEAD
+    request. Returns None when the server sends neither, or the URL can't
+    be reached, in which case callers should not use the cache: hashing the
+    body would download the file once more on top of the download the task
+    itself does on a miss.
+    """
+    session = get_session()
+    try:
+        head = session.head(url, allow_redirects=True, timeout=HTTP_TIMEOUT_SECONDS)
+        if not head.ok:
+            return None
+        etag = head.headers.get("ETag")
+        last_modified = head.headers.get("Last-Modified")
+        if etag and not etag.startswith("W/"):
+            return f"etag:{url}:{etag}"
+        if last_modified:
+            return f"last-modified:{url}:{last_modified}:{head.headers.get('Content-Length', '')}"
+        log.debug("Not caching %s: no ETag or Last-Modified", url)
+        return None
+    except Exception as e:
+        log.warning("Could not fingerprint %s for the result cache: %s", url, e)
+        return None
+
+
+def cache_key(namespace: str, fingerprint: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps([RESULT_CACHE_FORMAT, namespace, fingerprint, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached_call(
+    namespace: str,
+    url: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Any],
+    should_cache: Callable[[Any], bool] = lambda value: True,
+) -> Any:
+    """
+    Return the cached result for (namespace, content of url, params), or
+    compute and store it.
+
+    Args:
+        namespace (str): Kind of result, e.g. "ocr"; part of the key
+        url (str): Input URL; its content fingerprint is part of the key
+        params (dict): Model and parameters that affect the result
+        compute (callable): Produces the result on a miss
+        should_cache (callable): Return False for results that must not be stored (errors)
+    """
+    if not RESULT_CACHE_ENABLED:
+        return compute()
+    fingerprint = url_fingerprint(url)
+    if fingerprint is None:
+        return compute()
+    key = cache_key(namespace, fingerprint, params)
+    try:
+        value = result_cache.get(key)
+    except sqlite3.Error as e:
+        log.warning("Result cache read failed: %s", e)
+        value = None
+    if value is not None:
+        log.debug("Result cache hit for %s %s", namespace, url)
+        return value
+    value = compute()
+    if should_cache(value):
+        try:
+            result_cache.set(key, value)
+        except sqlite3.Error as e:
+            log.warning("Result cache write failed: %s", e)
+    return value
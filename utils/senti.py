@@ -1,9 +1,19 @@
+import os
+import torch
 from transformers import AutoModelForSequenceClassification
-from transformers import TFAutoModelForSequenceClassification
 from transformers import AutoTokenizer, AutoConfig
 import numpy as np
-from scipy.special import softmax
 import json
+from utils.metrics import metrics
+from utils.registry import registry
+
+# Texts per forward pass. Texts are sorted by length first, so each batch
+# pads to a similar length.
+SENTIMENT_BATCH_SIZE = int(os.environ.get("SENTIMENT_BATCH_SIZE", "64"))
+SENTIMENT_MAX_LENGTH = int(os.environ.get("SENTIMENT_MAX_LENGTH", "128"))
+# Run a dynamically quantized int8 copy of the model (CPU only)
+SENTIMENT_QUANTIZE = os.environ.get("SENTIMENT_QUANTIZE", "0") == "1"
+
 # Preprocess text (username and link placeholders)
 def preprocess(text):
     new_text = []
@@ -12,29 +22,86 @@ def preprocess(text):
         t = 'http' if t.startswith('http') else t
         new_text.append(t)
     return " ".join(new_text)
-MODEL = f"cardiffnlp/twitter-roberta-base-sentiment-latest"
-tokenizer = AutoTokenizer.from_pretrained(MODEL)
-config = AutoConfig.from_pretrained(MODEL)
-# PT
-model = AutoModelForSequenceClassification.from_pretrained(MODEL)
-#model.save_pretrained(MODEL)
+MODEL = os.environ.get("SENTIMENT_MODEL", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+
+
+def _load_sentiment():
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    config = AutoConfig.from_pretrained(MODEL)
+    # PT
+    model = AutoModelForSequenceClassification.from_pretrained(MODEL)
+    model.eval()
+    #model.save_pretrained(MODEL)
+    return tokenizer, config, model
+
+
+def _load_sentiment_int8():
+    tokenizer, config, model = _load_sentiment()
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tokenizer, config, model
+
+
+registry.register("sentiment", _load_sentiment)
+registry.register("sentiment-int8", _load_sentiment_int8)
+
+
+def preload_models():
+    """Registry models to load before the workers fork."""
+    return ["sentiment-int8" if SENTIMENT_QUANTIZE else "sentiment"]
+
+
+def _softmax(logits):
+    # Row-wise softmax over the whole batch at once
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def classify(texts, quantize=None):
+    """
+    Sentiment of each text, ranked from the most to the least likely label.
+
+    Args:
+        texts (list): Texts to classify
+        quantize (bool, optional): Use the int8 model (default SENTIMENT_QUANTIZE)
+
+    Returns:
+        list: For each text, [{"rank", "label", "score"}, ...]
+    """
+    if not texts:
+        return []
+    quantize = SENTIMENT_QUANTIZE if quantize is None else quantize
+    tokenizer, config, model = registry.get("sentiment-int8" if quantize else "sentiment")
+    processed = [preprocess(text) for text in texts]
+    order = sorted(range(len(processed)), key=lambda i: len(processed[i]))
+
+    logits = np.empty((len(processed), model.config.num_labels), dtype=np.float32)
+    with torch.inference_mode(), metrics.phase("model_inference"):
+        for start in range(0, len(order), SENTIMENT_BATCH_SIZE):
+            indices = order[start:start + SENTIMENT_BATCH_SIZE]
+            encoded_input = tokenizer(
+                [processed[i] for i in indices],
+                padding="longest",
+                truncation=True,
+                max_length=SENTIMENT_MAX_LENGTH,
+                return_tensors='pt',
+            )
+            logits[indices] = model(**encoded_input).logits.float().numpy()
 
+    scores = _softmax(logits)
+    ranking = np.argsort(-scores, axis=1)
+    ranked_scores = np.take_along_axis(scores, ranking, axis=1).round(4).tolist()
+    labels = [config.id2label[i] for i in range(scores.shape[1])]
+    return [
+        [
+            {"rank": rank + 1, "label": labels[label_id], "score": score}
+            for rank, (label_id, score) in enumerate(zip(row_ranking, row_scores))
+        ]
+        for row_ranking, row_scores in zip(ranking.tolist(), ranked_scores)
+    ]
 
 
 def process_ner(text):
-    text = preprocess(text)
-    encoded_input = tokenizer(text, return_tensors='pt')
-    output = model(**encoded_input)
-    scores = output[0][0].detach().numpy()
-    scores = softmax(scores)
-    ranking = np.argsort(scores)
-    ranking = ranking[::-1]
-    output_json = []
-    for i in range(scores.shape[0]):
-        l = config.id2label[ranking[i]]
-        s = scores[ranking[i]]
-        output_json.append({"rank": i + 1, "label": l, "score": round(float(s), 4)})
-    return json.dumps(output_json, indent=4)
+    return json.dumps(classify([text])[0], indent=4)
 
 if __name__ == "__main__":
     text = "Covid cases are increasing fast!"
@@ -0,0 +1,78 @@
+import gc
+import os
+from typing import Any, Iterable, List
+
+from utils.registry import registry
+
+# When set, torch weights are saved here once and every process maps the
+# same file read-only, so the page cache holds one copy for all of them.
+MODEL_MMAP_DIR = os.environ.get("MODEL_MMAP_DIR", "")
+
+
+def _torch_modules(obj: Any) -> List[Any]:
+    if isinstance(obj, (tuple, list)):
+        return [module for item in obj for module in _torch_modules(item)]
+    if hasattr(obj, "parameters") and hasattr(obj, "state_dict") and hasattr(obj, "eval"):
+        return [obj]
+    return []
+
+
+def freeze(obj: Any) -> Any:
+    """
+    Put every torch module in `obj` in eval mode with gradients disabled.
+
+    Nothing in the workers trains, but an autograd-enabled parameter can
+    still get written to (e.g. a .grad allocated by accident), which would
+    copy its pages in every forked child.
+    """
+    for module in _torch_modules(obj):
+        module.eval()
+        module.requires_grad_(False)
+    return obj
+
+
+def mmap_weights(name: str, obj: Any) -> Any:
+    """
+    Swap the weights of the torch modules in `obj` for memory-mapped copies.
+
+    The first process to load a model writes its state dict to
+    MODEL_MMAP_DIR; every process then loads that file with mmap=True and
+    assigns the mapped tensors into the module, so the weights live in the
+    shared page cache rather than in each process's private memory.
+    Quantized models (packed params) are left as they are. Cached files are
+    keyed by registry name only, so clear MODEL_MMAP_DIR after changing models.
+    """
+    if not MODEL_MMAP_DIR:
+        return obj
+    import torch
+
+    os.makedirs(MODEL_MMAP_DIR, exist_ok=True)
+    for index, module in enumerate(_torch_modules(obj)):
+        if any("_packed_params" in key for key in module.state_dict()):
+            continue
+        path = os.path.join(MODEL_MMAP_DIR, f"{name.replace('/', '_')}-{index}.pt")
+        try:
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                torch.save(module.state_dict(), tmp_path)
+                os.replace(tmp_path, path)
+            state = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+            module.load_state_dict(state, assign=True)
+        except Exception as e:
+            print(f"Could not memory-map weights for '{name}': {e}")
+    return freeze(obj)
+
+
+def share_models(model_names: Iterable[str]) -> None:
+    """
+    Load models in the parent process so forked workers share them copy-on-write.
+
+    Call this before TaskHandler.start_processes(). The models are loaded
+    through the registry, frozen, and then every object alive at that point
+    is moved out of the garbage collector's reach with gc.freeze(), so
+    collections in the children don't touch (and copy) the parent's pages.
+    """
+    for name in model_names:
+        freeze(registry.get(name))
+    gc.collect()
+    gc.freeze()
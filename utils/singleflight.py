@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+from utils.metrics import metrics
+
+
+def make_key(*parts: Any) -> str:
+    """Stable key for a call from its (JSON-serialisable) arguments."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce identical calls that are in flight at the same time.
+
+    The first caller for a key runs the function; callers that arrive with
+    the same key while it is still running wait for that result (or
+    exception) instead of making the same remote call or inference again.
+    Nothing is remembered once the call finishes; that is the result
+    cache's job.
+
+    Threads use `do`, coroutines use `do_async`, and both share the same
+    in-flight table, so a thread and an async task asking for the same key
+    at the same time still make a single call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _join(self, namespace: str, key: str):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {"calls": 0, "executed": 0, "saved": 0})
+            counters["calls"] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                counters["saved"] += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            counters["executed"] += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result: Any = None, error: BaseException = None) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, namespace: str, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn() unless an identical call (same namespace and key) is already running."""
+        full_key = f"{namespace}:{key}"
+        future, leader = self._join(namespace, full_key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(full_key, future, error=e)
+            raise
+        self._finish(full_key, future, result=result)
+        return result
+
+    async def do_async(self, namespace: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async counterpart of `do`; fn is a coroutine function."""
+        full_key = f"{namespace}:{key}"
+        future, leader = self._join(namespace, full_key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(full_key, future, error=e)
+            raise
+        self._finish(full_key, future, result=result)
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-namespace calls, executed calls and calls saved by coalescing."""
+        with self._lock:
+            return {namespace: dict(counters) for namespace, counters in self._counters.items()}
+
+
+single_flight = SingleFlight()
+
+
+def _collect_single_flight_metrics():
+    for namespace, counters in single_flight.stats().items():
+        yield "counter", "single_flight_calls_total", {"namespace": namespace}, counters["calls"]
+        yield "counter", "single_flight_saved_total", {"namespace": namespace}, counters["saved"]
+
+
+metrics.add_collector(_collect_single_flight_metrics)
@@ -0,0 +1,99 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+_timings: List[Tuple[str, float]] = []
+_lock = threading.Lock()
+_process_started = time.perf_counter()
+
+
+def enabled_tasks() -> Optional[Set[str]]:
+    """
+    Task names this process should serve, from ENABLED_TASKS (comma-separated).
+
+    Returns None when every task is enabled (variable unset, empty or "all").
+    """
+    value = os.environ.get("ENABLED_TASKS", "").strip()
+    if not value or value.lower() == "all":
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def is_enabled(task_name: str) -> bool:
+    tasks = enabled_tasks()
+    return tasks is None or task_name in tasks
+
+
+def concurrent_tasks() -> Dict[str, int]:
+    """
+    Tasks to run on the in-process concurrent runner instead of TaskHandler,
+    with their in-flight limits, from CONCURRENT_TASKS.
+
+    The format is "OCRTask=32,transcribeTask=8"; a name without a limit
+    gets CONCURRENT_DEFAULT_LIMIT (16).
+    """
+    default_limit = int(os.environ.get("CONCURRENT_DEFAULT_LIMIT", "16"))
+    limits = {}
+    for item in os.environ.get("CONCURRENT_TASKS", "").split(","):
+        name, _, limit = item.partition("=")
+        if name.strip():
+            limits[name.strip()] = int(limit) if limit.strip() else default_limit
+    return limits
+
+
+def pid_alive(pid: int) -> bool:
+    """Whether a process with this pid is still running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+@contextmanager
+def timed(label: str):
+    """Record how long the enclosed block takes under `label` in the startup report."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _timings.append((label, elapsed))
+
+
+def lazy_import(module_name: str):
+    """
+    Import a module on first use and record the import time.
+
+    Worker functions call this instead of importing at the top of worker.py,
+    so a process only pays for the models and clients of the tasks it serves.
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - started
+    with _lock:
+        _timings.append((f"import {module_name}", elapsed))
+    print(f"Imported {module_name} in {elapsed:.2f}s")
+    return module
+
+
+def report() -> str:
+    """Format the recorded startup timings, slowest first."""
+    with _lock:
+        timings = sorted(_timings, key=lambda item: item[1], reverse=True)
+    total = time.perf_counter() - _process_started
+    lines = [f"Startup report (pid {os.getpid()}, {total:.2f}s elapsed):"]
+    for label, elapsed in timings:
+        lines.append(f"  {elapsed:8.3f}s  {label}")
+    return "\n".join(lines)
@@ -0,0 +1,211 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from utils.metrics import metrics
+
+# Logging for the task hot path. Records are put on an in-memory queue by
+# the worker thread and formatted and written by a QueueListener thread, so
+# a task never waits on stdout; if the queue is full the record is dropped
+# (and counted) instead of blocking.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_PREVIEW_CHARS = int(os.environ.get("LOG_PREVIEW_CHARS", "120"))
+# Fraction of task executions whose below-WARNING records are kept, and
+# per-task overrides: "transcribeTask=0.1,piiTask=0"
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+# Per-task minimum levels: "piiTask=WARNING,OCRTask=DEBUG"
+LOG_TASK_LEVELS = os.environ.get("LOG_TASK_LEVELS", "")
+LOG_TASK_SAMPLE_RATES = os.environ.get("LOG_TASK_SAMPLE_RATES", "")
+
+_context = threading.local()
+_setup_pid: Optional[int] = None
+_setup_lock = threading.Lock()
+# Records can be dropped from several worker threads at once
+_dropped_lock = threading.Lock()
+_dropped = 0
+
+
+def _parse_overrides(value: str, convert) -> Dict[str, Any]:
+    overrides = {}
+    for item in value.split(","):
+        name, _, setting = item.partition("=")
+        if name.strip() and setting.strip():
+            overrides[name.strip()] = convert(setting.strip())
+    return overrides
+
+
+_global_level = logging.getLevelName(LOG_LEVEL)
+_task_levels = _parse_overrides(LOG_TASK_LEVELS, lambda level: logging.getLevelName(level.upper()))
+_task_sample_rates = _parse_overrides(LOG_TASK_SAMPLE_RATES, float)
+
+
+def preview(value: Any, limit: int = LOG_PREVIEW_CHARS) -> str:
+    """A short, single-line preview of a value for logging, with its size when truncated."""
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text.replace("\n", "\\n")
+    return text[:limit].replace("\n", "\\n") + f"... ({len(text)} chars)"
+
+
+def size_of(value: Any) -> int:
+    """Cheap size of a task input/output: characters, bytes or items (no serialization)."""
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+class _TaskFilter(logging.Filter):
+    """Applies per-task levels and sampling, and stamps the task context on each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        task = getattr(_context, "task", None)
+        record.task = task
+        record.task_id = getattr(_context, "task_id", None)
+        if record.levelno < _task_levels.get(task, _global_level):
+            return False
+        return task is None or record.levelno >= logging.WARNING or getattr(_context, "sampled", True)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def handle(self, record: logging.LogRecord):
+        if _setup_pid != os.getpid():
+            # Inherited across a fork: this queue's listener thread is gone
+            setup()
+            return logging.getLogger("workers").handlers[0].handle(record)
+        return super().handle(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _dropped_lock:
+                _dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread, not the worker's; only
+        # the exception text is rendered here, while the traceback is live
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for key in ("task", "task_id"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        task = f" [{record.task}{' ' + record.task_id if record.task_id else ''}]" if getattr(record, "task", None) else ""
+        fields = getattr(record, "fields", None)
+        extra = (" " + " ".join(f"{key}={value}" for key, value in fields.items())) if fields else ""
+        line = (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))} "
+                f"{record.levelname:<7} {record.process}{task} {record.getMessage()}{extra}")
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+def setup() -> None:
+    """
+    Install the queue handler on the "workers" logger and start the
+    listener thread. Safe to call repeatedly; a forked child starts its own
+    listener (threads don't survive a fork).
+    """
+    global _setup_pid
+    if _setup_pid == os.getpid():
+        return
+    with _setup_lock:
+        if _setup_pid == os.getpid():
+            return
+        logger = logging.getLogger("workers")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        listener = logging.handlers.QueueListener(log_queue, stream)
+        listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(listener.stop)
+        handler = _DroppingQueueHandler(log_queue)
+        handler.addFilter(_TaskFilter())
+        logger.addHandler(handler)
+        # The logger lets through the lowest level any task asks for; the
+        # filter then applies each task's own level
+        logger.setLevel(min([_global_level, *_task_levels.values()]))
+        logger.propagate = False
+        _setup_pid = os.getpid()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """A child of the "workers" logger; setup() runs on first use in each process."""
+    setup()
+    return logging.getLogger(f"workers.{name}")
+
+
+def dropped() -> int:
+    """Records dropped because the queue was full."""
+    return _dropped
+
+
+def _collect_log_metrics():
+    yield "counter", "log_records_dropped_total", {}, _dropped
+
+
+metrics.add_collector(_collect_log_metrics)
+
+
+def bind(task_id: Optional[str]) -> None:
+    """Set the Conductor task id for records logged by this thread's next task."""
+    _context.bound_task_id = task_id
+
+
+@contextmanager
+def task_context(task: str):
+    """
+    Tag records logged by this thread with `task` and an id (the bound
+    Conductor task id, or a short generated one), and decide once per
+    execution whether its below-WARNING records are sampled in.
+    """
+    setup()
+    previous = (getattr(_context, "task", None), getattr(_context, "task_id", None), getattr(_context, "sampled", True))
+    _context.task = task
+    _context.task_id = getattr(_context, "bound_task_id", None) or uuid.uuid4().hex[:12]
+    _context.bound_task_id = None
+    _context.sampled = random.random() < _task_sample_rates.get(task, LOG_SAMPLE_RATE)
+    try:
+        yield
+    finally:
+        _context.task, _context.task_id, _context.sampled = previous
@@ -0,0 +1,130 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from utils.metrics import metrics
+from utils.resultcache import ResultCache, cache_key
+
+# Sentence-level translation memory in front of IndicTrans2. Lookups go to
+# an in-process LRU first, then to the optional on-disk store, which is
+# shared by every worker process on the host and survives restarts.
+TRANSLATION_MEMORY_ENABLED = os.environ.get("TRANSLATION_MEMORY_ENABLED", "1") == "1"
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get("TRANSLATION_MEMORY_MAX_ENTRIES", "100000"))
+# Empty disables the on-disk store
+TRANSLATION_MEMORY_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", "")
+TRANSLATION_MEMORY_MAX_MB = float(os.environ.get("TRANSLATION_MEMORY_MAX_MB", "256"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(sentence: str) -> str:
+    """NFC-normalize a sentence and collapse runs of whitespace."""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", sentence)).strip()
+
+
+class TranslationMemory:
+    """
+    LRU map from (normalized sentence, src_lang, tgt_lang, profile) to its
+    translation, optionally backed by a ResultCache on disk.
+
+    Args:
+        max_entries (int): Sentences kept in memory
+        store (ResultCache, optional): Persistent second level
+    """
+
+    def __init__(self, max_entries: int, store: Optional[ResultCache] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_key(self, key: tuple) -> str:
+        sentence, src_lang, tgt_lang, profile = key
+        return cache_key("translation", sentence, {"src": src_lang, "tgt": tgt_lang, "profile": profile})
+
+    def _remember(self, key: tuple, translation: str) -> None:
+        # Caller holds self._lock
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, sentences: List[str], src_lang: str, tgt_lang: str, profile: str) -> Dict[str, str]:
+        """Translations of the sentences that are in memory, by sentence."""
+        found: Dict[str, str] = {}
+        missing = []
+        with self._lock:
+            for sentence in sentences:
+                key = (normalize(sentence), src_lang, tgt_lang, profile)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[sentence] = self._entries[key]
+                    self.memory_hits += 1
+                else:
+                    missing.append((sentence, key))
+        for sentence, key in missing:
+            translation = None
+            if self.store is not None:
+                try:
+                    translation = self.store.get(self._disk_key(key))
+                except sqlite3.Error as e:
+                    print(f"Translation memory read failed: {e}")
+            with self._lock:
+                if translation is None:
+                    self.misses += 1
+                    continue
+                self.disk_hits += 1
+                self._remember(key, translation)
+            found[sentence] = translation
+        return found
+
+    def store_many(self, translations: Dict[str, str], src_lang: str, tgt_lang: str, profile: str) -> None:
+        """Remember sentence -> translation pairs produced by the model."""
+        keys = [((normalize(sentence), src_lang, tgt_lang, profile), translation)
+                for sentence, translation in translations.items()]
+        with self._lock:
+            for key, translation in keys:
+                self._remember(key, translation)
+        if self.store is not None:
+            try:
+                self.store.set_many({self._disk_key(key): translation for key, translation in keys})
+            except sqlite3.Error as e:
+                print(f"Translation memory write failed: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+translation_memory = TranslationMemory(
+    TRANSLATION_MEMORY_MAX_ENTRIES,
+    store=ResultCache(
+        TRANSLATION_MEMORY_PATH,
+        max_bytes=int(TRANSLATION_MEMORY_MAX_MB * 1024 * 1024),
+    ) if TRANSLATION_MEMORY_PATH else None,
+)
+
+
+def _collect_translation_memory_metrics():
+    stats = translation_memory.stats()
+    for result, name in (("hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses")):
+        yield "counter", "cache_requests_total", {"cache": "translation_memory", "result": result}, stats[name]
+    yield "gauge", "translation_memory_entries", {}, stats["entries"]
+
+
+metrics.add_collector(_collect_translation_memory_metrics)
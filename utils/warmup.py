@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, List
+
+from utils.startup import lazy_import, timed
+
+# Batch sizes each model is exercised with before the workers start. Sizes
+# above what a task can actually batch are capped to its own limit.
+WARMUP_BATCH_SIZES = [int(size) for size in os.environ.get("WARMUP_BATCH_SIZES", "1,8,32").split(",") if size.strip()]
+# Language pair the translation model is warmed up on, "src:tgt"
+WARMUP_INDIC_PAIR = os.environ.get("WARMUP_INDIC_PAIR", "hin_Deva:eng_Latn")
+# The Ollama warm-up runs in the background and gives up after this long
+WARMUP_OLLAMA_TIMEOUT = float(os.environ.get("WARMUP_OLLAMA_TIMEOUT", "10"))
+
+_SHORT_TEXT = "John Smith from London emailed john.smith@example.com about the order."
+_LONG_TEXT = " ".join([
+    "Maria Garcia, who lives at 25 King's Road in Manchester, called on Monday about her account.",
+    "She asked for the invoice to be sent to maria.garcia@example.org and left the number +44 20 7946 0958.",
+] * 40)
+_HINDI_SENTENCES = [
+    "जब मैं छोटा था, मैं हर रोज़ पार्क जाता था।",
+    "उसके पास बहुत सारी पुरानी किताबें हैं, जिन्हें उसने अपने दादा-दादी से विरासत में पाया।",
+    "मुझे समझ में नहीं आ रहा कि मैं अपने दोस्त को उसकी जन्मदिन की पार्टी में क्या उपहार दूं, क्योंकि मैं उसे कुछ विशेष और यादगार देना चाहता हूं।",
+]
+
+
+def _shapes(limit: int) -> List[int]:
+    return sorted({max(1, min(size, limit)) for size in WARMUP_BATCH_SIZES})
+
+
+def _texts(count: int) -> List[str]:
+    # Mixed lengths, so the padded shapes vary as they do in real batches
+    return [_LONG_TEXT if i % 4 == 3 else _SHORT_TEXT for i in range(count)]
+
+
+def _warm_pii() -> None:
+    pii = lazy_import("utils.pii")
+    for size in _shapes(pii.PII_BATCH_SIZE):
+        # "cascade" runs the model even where the rules alone would answer
+        pii.extract_pii_batch(_texts(size), rules="cascade")
+
+
+def _warm_indic() -> None:
+    indic = lazy_import("utils.indic")
+    if indic.uses_cuda():
+        # CUDA initialized here would be unusable in every forked worker
+        # ("Cannot re-initialize CUDA in forked subprocess"), so on a GPU
+        # host the parent only downloads the files and each worker loads
+        # the model itself
+        indic.prefetch()
+        print("InidcToEnglish runs on CUDA: downloaded the model, workers load it after forking")
+        return
+    src_lang, _, tgt_lang = WARMUP_INDIC_PAIR.partition(":")
+    for size in _shapes(indic.INDIC_BATCH_SIZE):
+        # Goes straight to the model: no batcher thread and no translation memory
+        sentences = [f"{_HINDI_SENTENCES[i % len(_HINDI_SENTENCES)]} {i}" for i in range(size)]
+        indic.translate_bucketed(sentences, src_lang, tgt_lang)
+
+
+def _warm_keywords() -> None:
+    keywordextrac = lazy_import("utils.keywordextrac")
+    for size in _shapes(keywordextrac.KEYWORD_BATCH_SIZE):
+        keywordextrac.extract_keywords(_texts(size), n_process=1)
+
+
+def _warm_sentiment() -> None:
+    senti = lazy_import("utils.senti")
+    for size in _shapes(senti.SENTIMENT_BATCH_SIZE):
+        senti.classify(_texts(size))
+
+
+def _warm_ollama() -> None:
+    ollamaprocesser = lazy_import("utils.ollamaprocesser")
+    ollamaprocesser.warm_up(ollamaprocesser.OLLAMA_MODEL, timeout=WARMUP_OLLAMA_TIMEOUT)
+
+
+# Warm-up routine for each task that has one. These must succeed before the
+# workers start.
+WARMERS: Dict[str, Callable[[], None]] = {
+    'piiTask': _warm_pii,
+    'InidcToEnglish': _warm_indic,
+    'keywordTask': _warm_keywords,
+    'sentimentTask': _warm_sentiment,
+}
+
+# Best-effort warm-ups of remote services: run in the background, never
+# block startup and only log a failure (the service may come up later)
+BACKGROUND_WARMERS: Dict[str, Callable[[], None]] = {
+    'StructurdTexttoJson': _warm_ollama,
+}
+
+
+def _warm_in_background(task_name: str, warmer: Callable[[], None]) -> None:
+    def run():
+        try:
+            warmer()
+            print(f"Warmed up {task_name}")
+        except Exception:
+            print(f"Could not warm up {task_name} (continuing without it):")
+            print(traceback.format_exc())
+
+    threading.Thread(target=run, name=f"warmup-{task_name}", daemon=True).start()
+
+
+def warm_up(task_names: Iterable[str]) -> Dict[str, float]:
+    """
+    Run synthetic inferences for every task in `task_names` that has a
+    warm-up routine, across WARMUP_BATCH_SIZES, and start the background
+    warm-ups.
+
+    Loading happens through the registry on the first inference, so this
+    also downloads and loads any model that isn't loaded yet. Exceptions
+    from WARMERS are not caught: a task that can't warm up can't serve
+    either. Nothing here initializes CUDA, since the caller forks afterwards.
+
+    Args:
+        task_names (iterable): Enabled task names
+
+    Returns:
+        dict: Seconds spent warming up each task
+    """
+    timings = {}
+    for task_name in task_names:
+        if task_name in BACKGROUND_WARMERS:
+            _warm_in_background(task_name, BACKGROUND_WARMERS[task_name])
+        warmer = WARMERS.get(task_name)
+        if warmer is None:
+            continue
+        started = time.perf_counter()
+        with timed(f"warm up {task_name}"):
+            warmer()
+        timings[task_name] = time.perf_counter() - started
+        print(f"Warmed up {task_name} in {timings[task_name]:.2f}s")
+    return timings
@@ -1,104 +1,151 @@
 from conductor.client.worker.worker_task import worker_task
-from utils.pii import *
 from pathlib import Path
-from utils.mistralocrr import *
+import functools
 import json
-import ast
-from utils.groqApplications import *
-from utils.indic import *
-from utils.ollamaprocesser import ollamaParserClient
-
-
-
-@worker_task(task_definition_name='myTask')
+import logging
+import time
+from utils import tasklog
+from utils.metrics import metrics
+from utils.startup import concurrent_tasks, is_enabled, lazy_import
+
+# Every worker function by task name, whether or not it is enabled here
+WORKERS = {}
+
+# Helper module behind each model-backed task. Its preload_models() names
+# the registry models the task will use with the current settings.
+MODEL_MODULES = {
+    'piiTask': 'utils.pii',
+    'InidcToEnglish': 'utils.indic',
+    'keywordTask': 'utils.keywordextrac',
+    'sentimentTask': 'utils.senti',
+}
+
+log = tasklog.get_logger("worker")
+
+
+def models_for(task_names):
+    """Registry model names `task_names` can safely load before forking, importing their helper modules."""
+    names = []
+    for task_name in task_names:
+        if task_name in MODEL_MODULES:
+            names.extend(lazy_import(MODEL_MODULES[task_name]).preload_models())
+    return names
+
+
+def task(task_definition_name):
+    """
+    Register a worker function with Conductor if its task is enabled in this
+    process (see ENABLED_TASKS). Tasks listed in CONCURRENT_TASKS are left
+    out here because run.py serves them with the concurrent runner. The ML
+    helpers and API clients each worker needs are imported through
+    lazy_import on its first call.
+
+    Every worker is wrapped with utils.metrics: latency, in-flight count,
+    ok/error counts (an "Error: ..." return counts as an error) and sampled
+    output size. functools.wraps keeps the signature Conductor maps task
+    input onto.
+
+    Each execution also logs through utils.tasklog: input sizes when it
+    starts (DEBUG) and status, duration and output size when it finishes,
+    tagged with the task name and id. Payloads are never logged in full.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def instrumented(*args, **kwargs):
+            with tasklog.task_context(task_definition_name):
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("started", extra={"fields": {f"{key}_size": tasklog.size_of(value)
+                                                           for key, value in kwargs.items()}})
+                started = time.perf_counter()
+                try:
+                    with metrics.track_task(task_definition_name) as outcome:
+                        result = func(*args, **kwargs)
+                        if isinstance(result, str) and result.startswith("Error:"):
+                            outcome["status"] = "error"
+                except Exception:
+                    log.exception("failed", extra={"fields": {
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 1)}})
+                    raise
+                metrics.record_output(task_definition_name, result)
+                status = outcome.get("status", "ok")
+                fields = {"status": status,
+                          "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                          "output_size": tasklog.size_of(result)}
+                if status == "error":
+                    fields["error"] = tasklog.preview(result)
+                    log.warning("finished", extra={"fields": fields})
+                else:
+                    log.info("finished", extra={"fields": fields})
+            return result
+
+        WORKERS[task_definition_name] = instrumented
+        if is_enabled(task_definition_name) and task_definition_name not in concurrent_tasks():
+            return worker_task(task_definition_name=task_definition_name)(instrumented)
+        return instrumented
+    return decorate
+
+
+@task('myTask')
 def worker(name: str) -> str:
-    print(f'Worker called with name: {name}')
+    log.debug("name=%s", tasklog.preview(name))
     return f'hello, {name}'
 
 
-@worker_task(task_definition_name='OCRTask')
-def ocr_worker(URL: str , TYPE: str) -> str:
-    print(f'OCR Worker called with URL: {URL} and TYPE: {TYPE}')
+@task('OCRTask')
+def ocr_worker(URL: str , TYPE: str, OUTPUT: str = None) -> str:
     try:
-       return ast.literal_eval(ocr_docu(URL, TYPE))
+       mistralocrr = lazy_import("utils.mistralocrr")
+       return mistralocrr.ocr_docu(URL, TYPE, OUTPUT)
        
     except Exception as e:
-        print(f"Error in OCR processing: {e}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("OCR processing failed for %s", URL)
         return f"Error: {str(e)}"
 
-@worker_task(task_definition_name='StructuredOCRTask')
-def structured_ocr_worker(URL: str) -> str:
+@task('StructuredOCRTask')
+def structured_ocr_worker(URL: str, TYPE: str = 'IMAGE') -> str:
     try:
+        mistralocrr = lazy_import("utils.mistralocrr")
         # return structured_ocr(URL)
-        return ast.literal_eval(structured_ocr(URL))
+        return mistralocrr.structured_ocr(URL, TYPE)
     except Exception as e:
-        print(f"Error in Structured OCR processing: {e}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("Structured OCR processing failed for %s", URL)
         return f"Error: {str(e)}"
 
-@worker_task(task_definition_name='transcribeTask')
-def transcribe_worker(url: str, model: str = "whisper-large-v3-turbo", prompt: str = None, response_format: str = "verbose_json", timestamp_granularities: list = None, language: str = None, temperature: float = 0.0) :
+@task('transcribeTask')
+def transcribe_worker(url: str, model: str = "whisper-large-v3-turbo", prompt: str = None, response_format: str = "verbose_json", timestamp_granularities: list = None, language: str = None, temperature: float = 0.0, long_audio: bool = None, include_timestamps: bool = False, transcode: bool = None) :
     try:
-        result = transcribe_audio_from_url_groq(
+        groqApplications = lazy_import("utils.groqApplications")
+        result = groqApplications.transcribe_audio_from_url_groq(
             url=url,
             model=model,
             response_format=response_format,
             timestamp_granularities=["word", "segment"],
             language=language,
-            temperature=temperature
+            temperature=temperature,
+            long_audio=long_audio,
+            include_timestamps=include_timestamps,
+            transcode=transcode
         )
-        
-        # Pretty print the result
-        print(result)
-        return ast.literal_eval(result)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("transcription: %s", tasklog.preview(result))
+        return result
     except Exception as e:
-        print(f"Error: {e}")
+        log.exception("Transcription failed for %s", url)
         return f"Error: {str(e)}"
 
-@worker_task(task_definition_name='piiTask')
+@task('piiTask')
 def pii_worker(text: str) -> str:
     if text:
-        resultjson = {}
-        print(f'PII Worker called with text: {text}')
         # sample_text = "John Smith, from London, teaches mathematics at Royal Academy located at 25 King's Road. His employee ID is UK-987654-321 and he has been working there since 2015."
         # sample2 = 'pradeep odela from hyderabad, teaches mathematics at Royal Academy located at 25 King\'s Road. His employee ID is UK-987654-321 and he has been working there since 2015. his credit card number is 1234-5678-9012-3456 and his passport number is A1234567.'
         # Example 1: Using default labels
-        results = extract_pii(text)
-        print("Example 1: Using default labels")
-        print(f"Text: {results['text']}")
-        print("Detected entities:")
-        for entity in results["entities"]:
-            print(f"  {entity['word']} => {entity['entity']} (positions {entity['start']}-{entity['end']})")
-        resultjson["text"] = results['text']
-        resultjson["entities"] = []
-        for entity in results["entities"]:
-            entity_dict = {}
-            entity_dict["word"] = entity['word']
-            entity_dict["entity"] = entity['entity']
-            entity_dict["start"] = entity['start']
-            entity_dict["end"] = entity['end']
-            entity_dict["score"] = entity.get("score", 0)
-            resultjson["entities"].append(entity_dict)
-        resultss = {
-            "text": resultjson["text"],
-            "entities": [
-                {
-                    "entity": entity["entity"],
-                    "word": entity["word"],
-                    "start": entity["start"],
-                    "end": entity["end"],
-                    "score": entity.get("score", 0),
-                }
-                for entity in resultjson["entities"]
-            ],
-        }
-        # print(resultss)
-        return resultss
+        pii = lazy_import("utils.pii")
+        # Already in output shape ({"text", "entities": [{"entity", "word", ...}]})
+        results = pii.extract_pii_batched(text)
+        log.debug("%d entities", len(results["entities"]))
+        return results
     else:
-        print("No text provided for PII extraction.")
+        log.warning("No text provided for PII extraction")
         return "No text provided"
 
 
@@ -106,35 +153,63 @@ def pii_worker(text: str) -> str:
 
 
 # Task 2: General query processing
-@worker_task(task_definition_name='queryTask')
+@task('queryTask')
 def query_worker(query: str) -> str:
 
-    response = LLMChat(query)
-    print(f'Query Worker called with query: {query}')
-    print(f'Chat completion response: {response}')
+    groqApplications = lazy_import("utils.groqApplications")
+    response = groqApplications.LLMChat(query)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("query: %s response: %s", tasklog.preview(query), tasklog.preview(response))
     return response
 
-@worker_task(task_definition_name='InidcToEnglish')
-def inidc_worker(text:str,src:str,dst:str) -> str:
-    print(f'Indic to English Worker called with text: ')
-    print(text)
-    print(src)
-    print(dst)
-    # print(text, src, dst)
-    if type(text) is not list:
+@task('InidcToEnglish')
+def inidc_worker(text:str,src:str,dst:str,profile:str=None) -> str:
+    single = type(text) is not list
+    if single:
         text = [text]
-    resp = TransulationWorkerIndictoEnglish(text, src_lang=src, tgt_lang=dst)
-    print(resp)
-    return resp
+    indic = lazy_import("utils.indic")
+    resp = indic.TransulationWorkerIndictoEnglish(text, src_lang=src, tgt_lang=dst, profile=profile)
+    log.debug("translated %d text(s) %s -> %s", len(resp), src, dst)
+    return resp[0] if single else resp
+
+@task('keywordTask')
+def keyword_worker(text, top_n: int = 10):
+    # One text gives one result; a list of texts is batched through nlp.pipe
+    single = type(text) is not list
+    texts = [text] if single else text
+    log.debug("%d text(s)", len(texts))
+    try:
+        keywordextrac = lazy_import("utils.keywordextrac")
+        results = keywordextrac.extract_keywords(texts, top_n=int(top_n))
+        return results[0] if single else results
+    except Exception as e:
+        log.exception("Keyword extraction failed")
+        return f"Error: {str(e)}"
+
+@task('sentimentTask')
+def sentiment_worker(text, quantize: bool = None):
+    # One text gives one ranking; a list of texts is classified in batches
+    single = type(text) is not list
+    texts = [text] if single else text
+    log.debug("%d text(s)", len(texts))
+    try:
+        senti = lazy_import("utils.senti")
+        results = senti.classify(texts, quantize=quantize)
+        return results[0] if single else results
+    except Exception as e:
+        log.exception("Sentiment classification failed")
+        return f"Error: {str(e)}"
 
-@worker_task(task_definition_name='StructurdTexttoJson')
+@task('StructurdTexttoJson')
 def structured_text_to_json_worker(text: str, template: str) -> str:
     try:
-        return ast.literal_eval(ollamaParserClient(text, template , model='iodose/nuextract-v1.5'))
+        ollamaprocesser = lazy_import("utils.ollamaprocesser")
+        # A list of texts is extracted against the one template concurrently
+        if type(text) is list:
+            return ollamaprocesser.extract_json_many(text, template, model='iodose/nuextract-v1.5')
+        return ollamaprocesser.extract_json(text, template , model='iodose/nuextract-v1.5')
     except Exception as e:
-        print(f"Error in Structured Text to JSON processing: {e}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("Structured text to JSON processing failed")
         return f"Error: {str(e)}"
     
 